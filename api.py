@@ -0,0 +1,205 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import validate_properties
+import pipeline_writer
+from diagnostics import Diagnostics, TooManyErrors, ERROR, WARNING
+
+
+"""
+Library API of the validator: properties text or dicts in, result objects out.
+Nothing is logged, written or exited, unlike validate_properties.validate_file
+"""
+
+# Validation results kept by a Validator
+RESULT_CACHE_SIZE = 256
+
+
+class ValidationResult:
+    '''
+    Result of validating a properties file, with its pipeline built in memory
+
+    :param name: pipeline name, base name of the properties file
+    :param diagnostics: diagnostics.Diagnostics with every error and warning
+    :param tables: validated tables as returned by validate_properties_dict, empty if KO
+    :param base_schedule: validated schedule dict, None if KO
+    :param tags: list of tags, empty if KO
+    '''
+
+    def __init__(self, name, diagnostics, tables=None, base_schedule=None, tags=None):
+        self.name = name
+        self.diagnostics = diagnostics
+        self.tables = tables or []
+        self.base_schedule = base_schedule
+        self.tags = tags or []
+        self._tasks = None
+        self._files = None
+
+    @property
+    def ok(self):
+        return not self.diagnostics.has_errors
+
+    @property
+    def errors(self):
+        '''
+        :return: dict with config path -> list of errors
+        '''
+        return self.diagnostics.messages(ERROR)
+
+    @property
+    def warnings(self):
+        '''
+        :return: dict with config path -> list of warnings
+        '''
+        return self.diagnostics.messages(WARNING)
+
+    def tasks(self):
+        '''
+        :return: list of task_model.TaskRecord of the pipeline, empty if KO
+        '''
+        if self._tasks is None:
+            self._tasks = list(validate_properties.iter_tasks(self.tables, self.base_schedule)) if self.ok else []
+        return self._tasks
+
+    def documents(self):
+        '''
+        :return: dict with task id -> (environment, schedule) documents
+        '''
+        return {task.id: task.documents() for task in self.tasks()}
+
+    def files(self, yaml=None):
+        '''
+        Renders the pipeline directory as validate_file writes it under pipelines/<name>
+
+        :param yaml: YAML emitter, see pipeline_writer.new_yaml, files of the default one are kept
+        :return: dict with relative file path -> content, empty if KO
+        '''
+        if not self.ok:
+            return {}
+        if yaml is None and self._files is not None:
+            return self._files
+        emitter = yaml or pipeline_writer.new_yaml()
+        files = validate_properties.pipeline_files(self.base_schedule, self.tags)
+        for task in self.tasks():
+            task_id, task_files = pipeline_writer.serialize_task(emitter, task)
+            files.update((f"{task_id}/{name}", content) for name, content in task_files.items())
+        if yaml is None:
+            self._files = files
+        return files
+
+    def to_dict(self, files=False):
+        '''
+        :param files: include the rendered pipeline files
+        :return: JSON serializable dict
+        '''
+        result = {
+            'name': self.name,
+            'ok': self.ok,
+            'errors': self.errors,
+            'warnings': self.warnings,
+            'diagnostics': self.diagnostics.report(),
+            'tasks': [task.id for task in self.tasks()],
+        }
+        if self.ok:
+            result['schedule'] = validate_properties.pipeline_files(self.base_schedule, self.tags)
+        if files:
+            result['files'] = self.files()
+        return result
+
+
+def validate_dict(properties, name, max_errors=None):
+    '''
+    Validates a properties dict, left untouched
+
+    :param properties: dict as returned by validate_properties.properties_text_to_dict
+    :param name: pipeline name
+    :param max_errors: stop after this number of errors, None to collect all
+    :return: ValidationResult
+    '''
+    diagnostics = Diagnostics(max_errors)
+    try:
+        errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(
+            properties, name, diagnostics=diagnostics)
+    except TooManyErrors:
+        return ValidationResult(name, diagnostics)
+    if diagnostics.has_errors:
+        return ValidationResult(name, diagnostics)
+    return ValidationResult(name, diagnostics, tables, base_schedule, tags)
+
+
+def validate_text(text, name, max_errors=None):
+    '''
+    Validates the content of a properties file
+
+    :return: ValidationResult
+    '''
+    return validate_dict(validate_properties.properties_text_to_dict(text), name, max_errors)
+
+
+def validate_path(file_path, max_errors=None):
+    '''
+    Validates a properties file, named after its base name
+
+    :raise OSError: if the file can't be read
+    :return: ValidationResult
+    '''
+    with open(file_path) as f:
+        text = f.read()
+    return validate_text(text, os.path.basename(file_path).split('.')[0], max_errors)
+
+
+def _has_start_date(properties):
+    schedule = properties.get('schedule')
+    return isinstance(schedule, dict) and 'start_date' in schedule
+
+
+class Validator:
+    '''
+    Validates properties texts keeping the results of the last cache_size distinct ones.
+    Results of files without schedule.start_date depend on the current time and are not kept.
+    Cached results are shared, they must be treated as read-only
+
+    :param cache_size: number of results kept
+    '''
+
+    def __init__(self, cache_size=RESULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate_text(self, text, name, max_errors=None):
+        '''
+        :return: ValidationResult, see validate_text
+        '''
+        key = (name, max_errors, hashlib.sha256(text.encode('utf-8')).digest())
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        properties = validate_properties.properties_text_to_dict(text)
+        result = validate_dict(properties, name, max_errors)
+        if _has_start_date(properties):
+            with self._lock:
+                self._results[key] = result
+                while len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+        return result
+
+    def validate_path(self, file_path, max_errors=None):
+        '''
+        :raise OSError: if the file can't be read
+        :return: ValidationResult, see validate_path
+        '''
+        with open(file_path) as f:
+            text = f.read()
+        return self.validate_text(text, os.path.basename(file_path).split('.')[0], max_errors)
+
+    def stats(self):
+        return {'cached': len(self._results), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,123 @@
+import os
+import sys
+import logging
+import argparse
+import validate_properties
+import instrumentation
+import parse_cache
+import diagnostics
+
+
+logger = logging.getLogger()
+
+
+def _validate_one(file_path, write=False, incremental=False):
+    '''
+    Validates a single properties file, never raising
+
+    :param file_path: path of input properties file
+    :param write: write pipeline files if file is valid
+    :param incremental: only rewrite the tasks whose content changed
+    :return: tuple (file_path, True if OK / False if KO)
+    '''
+    try:
+        return file_path, bool(validate_properties.validate_file(file_path, write=write, incremental=incremental))
+    except SystemExit:
+        # validate_file exits when the file does not exist
+        return file_path, False
+    except Exception as ex:
+        logger.error(f"Unexpected error validating {file_path}: {ex}")
+        return file_path, False
+
+
+def validate_files(files, write=False, workers=1, incremental=False):
+    '''
+    Validates a batch of properties files in the current process, so the validator
+    module and its *_CONFIG_KEYS tables are imported only once
+
+    :param files: list of properties file paths
+    :param write: write pipeline files for valid properties files
+    :param workers: number of worker processes, None to use all cores, 1 to run in-process
+    :param incremental: only rewrite the tasks whose content changed
+    :return: dict with file path -> True if OK, False if KO, in input order
+    '''
+    files = validate_properties.uniquify([x.strip() for x in files if x.strip() != ""])
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(files))
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_validate_one, files, [write] * len(files), [incremental] * len(files),
+                                        chunksize=chunksize))
+    else:
+        results = [_validate_one(file, write=write, incremental=incremental) for file in files]
+
+    return dict(results)
+
+
+def log_report(results):
+    '''
+    Logs an aggregated OK/KO report for a batch of validated files
+
+    :param results: dict with file path -> True if OK, False if KO
+    :return: exit code, 0 if every file is OK, 1 otherwise
+    '''
+    ko_files = [file for file in results if not results[file]]
+    logger.info(f"Validated {len(results)} properties files: {len(results) - len(ko_files)} OK, {len(ko_files)} KO")
+    for file in ko_files:
+        logger.error(f"Properties file {file} is KO")
+    return 1 if len(ko_files) > 0 else 0
+
+
+def run(files, write=False, workers=1, incremental=False):
+    '''
+    Validates a batch of properties files and logs the aggregated report
+
+    :return: exit code, 0 if every file is OK, 1 otherwise
+    '''
+    if len(files) == 0:
+        logger.info("No properties files to validate")
+        return 0
+    return log_report(validate_files(files, write=write, workers=workers, incremental=incremental))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Validate a batch of properties files")
+    arg_parser.add_argument('files', nargs='*', help="properties files to validate")
+    arg_parser.add_argument('-j', '--workers', type=int, default=1,
+                            help="worker processes, 0 to use all cores (default: 1, in-process)")
+    arg_parser.add_argument('--write', action='store_true', help="write pipeline files for valid properties files")
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help="when writing, only rewrite the tasks whose content changed")
+    arg_parser.add_argument('--stats', metavar='DIR',
+                            help="write a JSON report with time per stage and counters per file to DIR")
+    arg_parser.add_argument('--profile', metavar='DIR', help="write a cProfile dump per file to DIR")
+    arg_parser.add_argument('--cache', metavar='DIR',
+                            help="skip files whose content and validator are unchanged, caching results in DIR")
+    arg_parser.add_argument('--diagnostics', metavar='DIR',
+                            help="write a JSON report with every error and warning per file to DIR")
+    arg_parser.add_argument('--max-errors', type=int, metavar='N',
+                            help="stop validating a file after N errors")
+    args = arg_parser.parse_args()
+
+    # Set through environment so worker processes inherit them
+    if args.stats:
+        os.environ[instrumentation.STATS_ENV_VAR] = args.stats
+    if args.profile:
+        os.environ[instrumentation.PROFILE_ENV_VAR] = args.profile
+    if args.cache:
+        os.environ[parse_cache.CACHE_ENV_VAR] = args.cache
+    if args.diagnostics:
+        os.environ[diagnostics.DIAGNOSTICS_ENV_VAR] = args.diagnostics
+    if args.max_errors:
+        os.environ[diagnostics.MAX_ERRORS_ENV_VAR] = str(args.max_errors)
+
+    sys.exit(run(args.files, write=args.write, workers=args.workers or None, incremental=args.incremental))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,569 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import shutil
+import resource
+import tempfile
+import subprocess
+
+
+def _timeit(function, repeat=3):
+    '''
+    Runs function repeat times and returns the best wall time in seconds
+    '''
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_jasypt(args):
+    '''
+    Decrypts the ENC() values of args.pipelines pipelines sharing args.secrets distinct
+    encrypted passwords, without cache, with the derived key cache and with decrypt_many
+    '''
+    import jasypt
+
+    password = b"benchmark-decrypt-key"
+    secrets = [jasypt.encrypt(f"secret-{i}", password) for i in range(args.secrets)]
+    msgs = [secrets[i % len(secrets)] for i in range(args.pipelines)]
+
+    def uncached():
+        for msg in msgs:
+            jasypt.clear_derived_key_cache()
+            jasypt.decrypt(msg, password)
+
+    def cached():
+        jasypt.clear_derived_key_cache()
+        for msg in msgs:
+            jasypt.decrypt(msg, password)
+
+    def batch():
+        jasypt.clear_derived_key_cache()
+        jasypt.decrypt_many(msgs, password, workers=args.workers)
+
+    results = {
+        'pipelines': args.pipelines,
+        'secrets': args.secrets,
+        'uncached_s': _timeit(uncached, args.repeat),
+        'cached_s': _timeit(cached, args.repeat),
+        'decrypt_many_s': _timeit(batch, args.repeat),
+    }
+    results['cached_speedup'] = results['uncached_s'] / results['cached_s']
+    results['decrypt_many_speedup'] = results['uncached_s'] / results['decrypt_many_s']
+    return results
+
+
+def _table_configs(tables):
+    '''
+    Returns table configs as read from a properties file, mixing every extraction strategy
+    '''
+    variants = [
+        {'fields': "ID,NAME", 'replication_method': "FULL_TABLE", 'query_threads': 1},
+        {'fields': "*", 'strategy': "partition", 'partition_column': "FECHA", 'partitions': 5},
+        {'strategy': "offset_rownum", 'max_results': 500000, 'query_threads': "4"},
+        {'replication_method': "incremental", 'replication_key': "id_fecha", 'encrypt_columns': "A,B,C"},
+        {'additional_filters': "ID_CADENA = 16", 'strategy': "offset_denserank", 'max_results': 1000},
+        # Invalid configs, so errors are compared too
+        {'strategy': "Partition", 'partitions': "many", 'query_threads': -2},
+        {'replication_method': "merge", 'max_results': "10", 'fields': ""},
+    ]
+    return [dict(variants[i % len(variants)]) for i in range(tables)]
+
+
+def bench_validations(args):
+    '''
+    Validates args.tables table configs with ORACLE_CONFIG_KEYS and SNOWFLAKE_CONFIG_KEYS,
+    using the interpreted _validate_keys_config loop, the compiled schemas and the columnar
+    validate_columns across all configs
+    '''
+    import copy
+    import validations
+    import validate_properties
+
+    schemas = [
+        (validate_properties.ORACLE_CONFIG_KEYS, validate_properties.ORACLE_SCHEMA, _table_configs(args.tables)),
+        (validate_properties.SNOWFLAKE_CONFIG_KEYS, validate_properties.SNOWFLAKE_SCHEMA,
+         [{'batch_size_rows': 100000, 'stage_type': "GCS", 'prefix': "ptr", 'wait_to_load': "false"}
+          for i in range(args.tables)]),
+    ]
+
+    def run(validate):
+        def measure():
+            for config_keys, schema, configs in schemas:
+                for config in copy.deepcopy(configs):
+                    validate(config, config_keys, schema)
+        return measure
+
+    def interpreted(config, config_keys, schema):
+        return validations._validate_keys_config(config, config_keys)
+
+    def compiled(config, config_keys, schema):
+        return schema.validate(config)
+
+    def columnar():
+        for config_keys, schema, configs in schemas:
+            validations.validate_columns(copy.deepcopy(configs), schema, filter_keys=False)
+
+    # Every path must produce the same configs, errors and warnings
+    for config_keys, schema, configs in schemas:
+        columnar_configs = copy.deepcopy(configs)
+        reports = validations.validate_columns(columnar_configs, schema, filter_keys=False)
+        for config, columnar_config, report in zip(configs, columnar_configs, reports):
+            interpreted_config, compiled_config = copy.deepcopy(config), copy.deepcopy(config)
+            result = interpreted(interpreted_config, config_keys, schema)
+            assert result == compiled(compiled_config, config_keys, schema)
+            assert interpreted_config == compiled_config == columnar_config
+            assert result == ([x[3] for x in report if x[0] == "error"], [x[3] for x in report if x[0] == "warning"])
+
+    # Time spent copying the configs, subtracted from both measures
+    copy_s = _timeit(run(lambda config, config_keys, schema: None), args.repeat)
+    results = {
+        'tables': args.tables,
+        'interpreted_s': _timeit(run(interpreted), args.repeat) - copy_s,
+        'compiled_s': _timeit(run(compiled), args.repeat) - copy_s,
+        'columnar_s': _timeit(columnar, args.repeat) - copy_s,
+    }
+    results['compiled_speedup'] = results['interpreted_s'] / results['compiled_s']
+    results['columnar_speedup'] = results['interpreted_s'] / results['columnar_s']
+    return results
+
+
+def generate_properties(origins=2, schemas=10, tables=100, encrypted=True):
+    '''
+    Generates the text of a synthetic properties file with origins x schemas x tables tasks,
+    mixing every extraction strategy, encrypted passwords and snowflake overrides at every level
+
+    :param origins: number of origins, at most len(VALID_ORIGINS)
+    :param schemas: schemas per origin
+    :param tables: tables per schema
+    :param encrypted: add an ENC() password with its decrypt_key to each origin
+    :return: str with properties file content
+    '''
+    import jasypt
+    import validate_properties
+
+    origin_names = validate_properties.VALID_ORIGINS[:origins]
+    strategies = [
+        ["replication_method = FULL_TABLE", "fields = ID_CADENA,ID_FECHA_EVENTO", "query_threads = 1"],
+        ["strategy = partition", "partition_column = FECHA_PEDIDO", "partitions = 5", "query_threads = 5"],
+        ["strategy = offset_rownum", "max_results = 500000"],
+        ["replication_method = INCREMENTAL", "replication_key = ID_FECHA_EVENTO", "encrypt_columns = CALIDAD,PVP"],
+        ["strategy = offset_denserank", "max_results = 100000", "additional_filters = ID_CADENA = 16"],
+    ]
+
+    lines = ["[schedule]", "schedule.interval = @daily", "schedule.start_date = 2022-04-27T08:00:00", "",
+             "[snowflake]", "snowflake.stage_type = gcs", "snowflake.batch_size_rows = 100000",
+             "snowflake.no_compression = false", "snowflake.wait_to_load = false", "",
+             "[tags]", "tags = benchmark", "",
+             "[origins]", f"origins = {','.join(origin_names)}", ""]
+    for origin in origin_names:
+        schema_names = [f"schema_{i}" for i in range(schemas)]
+        lines += [f"[origins.{origin}]", f"{origin}.schemas = {','.join(schema_names)}",
+                  f"{origin}.snowflake.prefix = {origin}"]
+        if encrypted:
+            decrypt_key = f"{origin}-decrypt-key"
+            password = jasypt.encrypt(f"{origin}-password", decrypt_key.encode('utf-8')).decode('utf-8')
+            lines += [f"{origin}.decrypt_key = {decrypt_key}", f"{origin}.password = ENC({password})"]
+        lines.append("")
+
+        for schema_index, schema in enumerate(schema_names):
+            table_names = [f"table_{i}" for i in range(tables)]
+            lines.append(f"{origin}.{schema}.tables = {','.join(table_names)}")
+            if schema_index % 3 == 0:
+                lines.append(f"{origin}.{schema}.snowflake.prefix = {origin}_{schema}")
+            for table_index, table in enumerate(table_names):
+                for line in strategies[table_index % len(strategies)]:
+                    lines.append(f"{origin}.{schema}.{table}.{line}")
+                if table_index % 7 == 0:
+                    lines.append(f"{origin}.{schema}.{table}.snowflake.batch_size_rows = 50000")
+                    lines.append(f"{origin}.{schema}.{table}.snowflake.parallelism = 4")
+            lines.append("")
+
+    return "\n".join(lines) + "\n"
+
+
+def _peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_pipeline(args):
+    '''
+    Times every stage of the properties to Meltano pipeline on a synthetic properties file
+    of args.origins x args.schemas x args.tables_per_schema tasks: parse, validate, decrypt, build,
+    serialize and write. Peak RSS is the process maximum once the stage has finished
+    '''
+    import logging
+    import validations
+    import config_index
+    import pipeline_writer
+    import validate_properties
+
+    logging.getLogger().setLevel(logging.WARNING)
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    file_path = os.path.join(work_dir, "bench-pipeline.properties")
+    with open(file_path, 'w') as f:
+        f.write(generate_properties(args.origins, args.schemas, args.tables_per_schema))
+    file_bytes = os.path.getsize(file_path)
+    file_name = "bench-pipeline"
+
+    stages = {}
+    state = {}
+
+    def stage(name, function):
+        start = time.perf_counter()
+        items = function()
+        elapsed = time.perf_counter() - start
+        stages[name] = {
+            'seconds': elapsed,
+            'items': items,
+            'items_per_second': items / elapsed if elapsed > 0 else None,
+            'peak_rss_kb': _peak_rss_kb(),
+        }
+
+    def parse():
+        state['properties'] = validate_properties.properties_file_to_dict(file_path)
+        return sum(1 for line in open(file_path))
+
+    def validate():
+        errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(
+            state['properties'], file_name)
+        assert len(errors) == 0, errors
+        state['tables'], state['base_schedule'] = tables, base_schedule
+        return len(tables)
+
+    def decrypt():
+        index = config_index.ConfigIndex.from_properties(state['properties'])
+        origins = validate_properties.uniquify(origin for origin, schema, table, table_config, snowflake in state['tables'])
+        configs = [index.config(index.path(origin)) for origin in origins]
+        for config in configs:
+            assert validations.decrypt_password(config) == []
+        return len(configs)
+
+    def build():
+        count = 0
+        for task in validate_properties.iter_tasks(state['tables'], state['base_schedule']):
+            count += 1
+        return count
+
+    def serialize():
+        yaml = pipeline_writer.new_yaml()
+        state['documents'] = []
+        for task in validate_properties.iter_tasks(state['tables'], state['base_schedule']):
+            task_id, (environment, schedule) = task.id, task.documents()
+            environment_stream, schedule_stream = io.StringIO(), io.StringIO()
+            yaml.dump(environment, environment_stream)
+            yaml.dump(schedule, schedule_stream)
+            state['documents'].append((task_id, environment_stream.getvalue(), schedule_stream.getvalue()))
+        return len(state['documents'])
+
+    def write():
+        from concurrent.futures import ThreadPoolExecutor
+
+        pipeline_path = os.path.join(work_dir, "pipelines", file_name)
+        with ThreadPoolExecutor(max_workers=pipeline_writer.WRITE_WORKERS) as executor:
+            futures = [executor.submit(pipeline_writer.write_directory, os.path.join(pipeline_path, task_id), {
+                "environment.yml": environment,
+                "schedule.yml": schedule,
+                "env": f"export MELTANO_ENVIRONMENT={task_id}"
+            }) for task_id, environment, schedule in state['documents']]
+            for future in futures:
+                future.result()
+        return 3 * len(state['documents'])
+
+    try:
+        stage('parse', parse)
+        stage('validate', validate)
+        stage('decrypt', decrypt)
+        stage('build', build)
+        stage('serialize', serialize)
+        stage('write', write)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'benchmark': 'pipeline',
+        'revision': _git_revision(),
+        'origins': args.origins,
+        'schemas': args.schemas,
+        'tables_per_schema': args.tables_per_schema,
+        'tasks': len(state.get('tables', [])),
+        'file_bytes': file_bytes,
+        'stages': stages,
+        'total_seconds': sum(stages[name]['seconds'] for name in stages),
+        'peak_rss_kb': _peak_rss_kb(),
+    }
+
+
+def _task_documents(text, file_name):
+    import validate_properties
+
+    properties = validate_properties.properties_text_to_dict(text)
+    errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(properties, file_name)
+    assert len(errors) == 0, errors
+    documents = []
+    for task in validate_properties.iter_tasks(tables, base_schedule):
+        documents += task.documents()
+    return documents
+
+
+def bench_yaml(args):
+    '''
+    Serializes the task documents of a synthetic properties file, of every file in properties/
+    and of edge cases with ruamel and with the template emitter. ok is False if any output differs
+    '''
+    import glob
+    import logging
+    import yaml_emitter
+    import pipeline_writer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    documents = _task_documents(generate_properties(args.origins, args.schemas, args.tables_per_schema, False),
+                                "bench-yaml")
+    properties_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "properties")
+    for file_path in sorted(glob.glob(os.path.join(properties_dir, "*.properties"))):
+        with open(file_path) as f:
+            documents += _task_documents(f.read(), os.path.basename(file_path).split('.')[0])
+    # Scalars ruamel quotes, folds or leaves empty, and shapes the emitter leaves to ruamel
+    documents += [
+        {'a': None, 'b': True, 'c': 1.5, 'd': "", 'e': "yes", 'f': "1.0", 'g': "a: b", 'h': "#x", 'i': "null"},
+        {'long': " ".join(["word"] * 30), 'multi': "line\nbreak", 'empty': {}, 'list': [], 'quote': "it's"},
+        {'nested': [[1, 2], {'k': [None, "-", "x_y"]}], "key with spaces": "*alias", 'k' * 130: 1},
+    ]
+
+    ruamel_yaml = pipeline_writer.new_yaml(template=False)
+    emitter = yaml_emitter.TemplateEmitter()
+
+    def dump_all(yaml):
+        def measure():
+            return [pipeline_writer.dump_yaml(yaml, document) for document in documents]
+        return measure
+
+    ruamel_output, template_output = dump_all(ruamel_yaml)(), dump_all(emitter)()
+    different = sum(1 for x, y in zip(ruamel_output, template_output) if x != y)
+    results = {
+        'documents': len(documents),
+        'different': different,
+        'fallbacks': emitter.fallbacks,
+        'ruamel_s': _timeit(dump_all(ruamel_yaml), args.repeat),
+        'template_s': _timeit(dump_all(emitter), args.repeat),
+    }
+    results['template_speedup'] = results['ruamel_s'] / results['template_s']
+    results['ok'] = different == 0
+    return results
+
+
+def bench_tasks(args):
+    '''
+    Builds the tasks of a synthetic properties file as task records and as the nested
+    dict documents they are serialized from, measuring memory held, build and compare time
+    '''
+    import logging
+    import tracemalloc
+    import validate_properties
+
+    logging.getLogger().setLevel(logging.WARNING)
+    properties = validate_properties.properties_text_to_dict(
+        generate_properties(args.origins, args.schemas, args.tables_per_schema, False))
+    errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(properties, "bench-tasks")
+    assert len(errors) == 0, errors
+
+    def records():
+        return list(validate_properties.iter_tasks(tables, base_schedule))
+
+    def documents():
+        return [task.documents() for task in validate_properties.iter_tasks(tables, base_schedule)]
+
+    def held_kb(function):
+        tracemalloc.start()
+        result = function()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        return size / 1024
+
+    first_records, second_records = records(), records()
+    first_documents, second_documents = documents(), documents()
+    results = {
+        'tasks': len(tables),
+        'records_kb': held_kb(records),
+        'documents_kb': held_kb(documents),
+        'records_build_s': _timeit(records, args.repeat),
+        'documents_build_s': _timeit(documents, args.repeat),
+        'records_compare_s': _timeit(lambda: first_records == second_records, args.repeat),
+        'documents_compare_s': _timeit(lambda: first_documents == second_documents, args.repeat),
+    }
+    results['memory_ratio'] = results['documents_kb'] / results['records_kb']
+    results['ok'] = first_records == second_records and [x.documents() for x in first_records] == first_documents
+    return results
+
+
+# start_date values checked against dateutil: ISO 8601 forms, other formats and invalid dates
+DATE_SAMPLES = [
+    "2023-01-01", "2023-01-01T10:00", "2023-01-01 10:03", "2023-01-01T10:58:59", "2023-06-30T23:59:59.999999",
+    "2023-01-01T10:07:00Z", "2023-07-01T10:07:00+02:00", "2023-07-01T10:07:00-0330", "2023-07-01T10:07+05",
+    "2023-03-26T02:30:00", "2023-10-29T02:30:00", "2024-02-29T12:00:00",
+    "20230101", "2023/01/05 10:03", "Jan 5 2023 10:03", "5 January 2023", " 2023-01-01", "2023-01-01T10:00:00.1234567",
+    "2023-02-30", "2023-13-01", "2023-01-01T25:00", "not a date", "",
+]
+
+
+def _reference_parse_date(date_str):
+    '''
+    parse_date before the ISO fast path and memoization
+    '''
+    import pendulum
+    import dateutil.parser as parser
+    import validate_properties
+
+    date = parser.parse(date_str)
+    date = date.replace(minute=validate_properties.round_to_minute(date.minute, round_to=5), second=0, microsecond=0)
+    return date.astimezone(pendulum.timezone('Europe/Madrid'))
+
+
+def bench_dates(args):
+    '''
+    Parses args.pipelines start_date values drawn from DATE_SAMPLES with the reference dateutil
+    path and with parse_date, ok is False if any result (or failure) differs
+    '''
+    import validate_properties
+
+    def outcome(function, date_str):
+        try:
+            date = function(date_str)
+            return date, date.isoformat(), date.utcoffset()
+        except Exception:
+            return 'error'
+
+    mismatches = []
+    for x in DATE_SAMPLES:
+        validate_properties.clear_parsed_date_cache()
+        expected = outcome(_reference_parse_date, x)
+        # First parse fills the cache, second one is read from it
+        if any(outcome(validate_properties.parse_date, x) != expected for attempt in range(2)):
+            mismatches.append(x)
+
+    valid = [x for x in DATE_SAMPLES if outcome(_reference_parse_date, x) != 'error']
+    dates = [valid[i % len(valid)] for i in range(args.pipelines)]
+    iso_dates = [x for x in dates if validate_properties.ISO_DATE.match(x)]
+
+    def reference():
+        for x in dates:
+            _reference_parse_date(x)
+
+    def uncached():
+        for x in iso_dates:
+            validate_properties.localize_date(validate_properties._parse_datetime(x))
+
+    def cached():
+        validate_properties.clear_parsed_date_cache()
+        for x in dates:
+            validate_properties.parse_date(x)
+
+    results = {
+        'dates': len(dates),
+        'iso_dates': len(iso_dates),
+        'reference_s': _timeit(reference, args.repeat),
+        'iso_uncached_s': _timeit(uncached, args.repeat),
+        'parse_date_s': _timeit(cached, args.repeat),
+        'mismatches': mismatches,
+    }
+    results['parse_date_speedup'] = results['reference_s'] / results['parse_date_s']
+    results['ok'] = len(mismatches) == 0
+    return results
+
+
+# Modules that must not be loaded by a plain import of validate_properties
+LAZY_MODULES = ['pendulum', 'ruamel.yaml', 'dateutil', 'Crypto', 'jasypt', 'numpy']
+# Cold import time allowed for validate_properties
+IMPORT_BUDGET_MS = 60
+
+
+def bench_importtime(args):
+    '''
+    Measures the cold import of validate_properties with -X importtime in a fresh interpreter,
+    ok is False if it takes more than args.budget_ms or any of LAZY_MODULES is imported
+    '''
+    times = []
+    loaded = set()
+    for i in range(args.repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import validate_properties'],
+                                 capture_output=True, text=True, check=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        for line in process.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            module = module.strip()
+            if not cumulative_us.strip().isdigit():
+                continue
+            loaded.add(module)
+            if module == 'validate_properties':
+                times.append(int(cumulative_us) / 1000)
+
+    lazy_loaded = sorted(module for module in loaded
+                         if any(module == lazy or module.startswith(lazy + '.') for lazy in LAZY_MODULES))
+    import_ms = min(times)
+    return {
+        'import_ms': import_ms,
+        'budget_ms': args.budget_ms,
+        'lazy_modules_loaded': lazy_loaded,
+        'ok': import_ms <= args.budget_ms and len(lazy_loaded) == 0,
+    }
+
+
+BENCHMARKS = {
+    'jasypt': bench_jasypt,
+    'validations': bench_validations,
+    'pipeline': bench_pipeline,
+    'importtime': bench_importtime,
+    'yaml': bench_yaml,
+    'tasks': bench_tasks,
+    'dates': bench_dates,
+}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Micro-benchmarks, results are printed as JSON")
+    arg_parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    arg_parser.add_argument('--repeat', type=int, default=3, help="runs per measure, best time is kept")
+    arg_parser.add_argument('--workers', type=int, default=1, help="worker processes for parallel modes")
+    arg_parser.add_argument('--pipelines', type=int, default=500, help="jasypt: number of encrypted values to decrypt, dates: number of dates to parse")
+    arg_parser.add_argument('--secrets', type=int, default=20, help="jasypt: number of distinct encrypted values")
+    arg_parser.add_argument('--tables', type=int, default=10000, help="validations: number of table configs")
+    arg_parser.add_argument('--origins', type=int, default=2, help="pipeline, yaml, tasks: number of origins (at most 2)")
+    arg_parser.add_argument('--schemas', type=int, default=10, help="pipeline, yaml, tasks: schemas per origin")
+    arg_parser.add_argument('--tables-per-schema', dest='tables_per_schema', type=int, default=100,
+                            help="pipeline, yaml, tasks: tables per schema")
+    arg_parser.add_argument('--budget-ms', dest='budget_ms', type=float, default=IMPORT_BUDGET_MS,
+                            help="importtime: maximum cold import time of validate_properties")
+    arg_parser.add_argument('--output', help="also write the JSON results to this file")
+    args = arg_parser.parse_args()
+
+    results = BENCHMARKS[args.benchmark](args)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    # Benchmarks with a budget report ok, failing the command when exceeded
+    sys.exit(0 if results.get('ok', True) else 1)
+
+
+if __name__ == "__main__":
+    main()
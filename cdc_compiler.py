@@ -0,0 +1,378 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import validations
+import diagnostics
+import parse_cache
+import pipeline_writer
+from diagnostics import Diagnostics
+
+
+logger = logging.getLogger()
+
+"""
+CDC templates are JSON objects, or the "key: value" lines of the Generate CDC Template issue form:
+    schema: INDOM_ZARA
+    table: ESTADO_SUBPEDIDO
+    maintenance_user_list: [MAINTENANCE_USER1 MAINTENANCE_USER2]
+Each valid template is compiled to <output>/<template directory>/<template name>.json with every
+key validated, normalized and defaulted, derived names included
+"""
+
+CDC_DIRECTORIES = ['cdc_templates', '_issues']
+OUTPUT_DIRECTORY = "cdc"
+MANIFEST_FILE = pipeline_writer.MANIFEST_FILE
+
+# Modules whose source code determines the compiled artifacts
+COMPILER_MODULES = ['cdc_compiler', 'validations', 'diagnostics']
+
+# Unquoted Snowflake identifier, as templates write them
+IDENTIFIER = re.compile(r'^[A-Z_][A-Z0-9_$]*$')
+ISSUE_LINE = re.compile(r'^([a-z_][a-z0-9_]*)\s*:\s*(.*)$')
+
+
+def is_identifier(x):
+    return bool(IDENTIFIER.match(x))
+
+
+def is_identifier_list(x):
+    return all(isinstance(item, str) and is_identifier(item) for item in x)
+
+
+def il_table_name(config):
+    '''
+    :return: base name of the CDC initial load table, templates may add a numeric suffix to it
+    '''
+    return f"IL_{config['sf_origin_prefix']}_{config['schema']}_{config['table']}"
+
+
+# CDC template validations
+CDC_CONFIG_KEYS = {
+    'schema': (True, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), None),
+    'table': (True, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), None),
+    'connections_file': (False, str, lambda x: x.strip(), lambda x: x.endswith(('.yml', '.yaml')), "connections.yml"),
+    'origin_connection': (True, str, lambda x: x.strip().lower(), None, None),
+    'sf_origin_prefix': (True, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), None),
+    'sf_bbdd': (True, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), None),
+    'sf_bbdd_target': (True, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), None),
+    'sf_cdc_table': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), "NOT_YET"),
+    'sf_cdc_il_table': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x),
+                        validations.depends_on('sf_origin_prefix', 'schema', 'table')(il_table_name)),
+    'sf_cdc_schema': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), "LANDING"),
+    'sf_snap_schema': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), "FLATTENED"),
+    'sf_datasource_schema': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), "RAW"),
+    'sf_landing_schema': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), "LANDING"),
+    'sf_flat_schema': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), "FLATTENED"),
+    'sf_warehouse': (True, str, lambda x: x.strip().upper(), lambda x: is_identifier(x), None),
+    'sf_table': (False, str, lambda x: x.strip().upper(), lambda x: is_identifier(x),
+                 validations.depends_on('table')(lambda x: x.get('table'))),
+    'maintenance_user_list': (False, list, lambda x: [item.strip().upper() for item in x],
+                              lambda x: is_identifier_list(x), lambda x: []),
+    'fields_to_hash': (False, list, lambda x: [item.strip().upper() for item in x],
+                       lambda x: is_identifier_list(x), lambda x: []),
+    'fields_truncated': (False, dict, None, None, lambda x: {}),
+}
+
+CDC_SCHEMA = validations.compile_schema(CDC_CONFIG_KEYS)
+
+_compiler_version = None
+
+
+def compiler_version():
+    '''
+    :return: hex sha256 digest of the compiler modules source, artifacts are rebuilt when it changes
+    '''
+    global _compiler_version
+    if _compiler_version is None:
+        _compiler_version = parse_cache.source_digest(COMPILER_MODULES)
+    return _compiler_version
+
+
+def parse_issue_form(text):
+    '''
+    Parses the "key: value" lines of the CDC issue form. Lines starting with '#' are comments,
+    so are '#' and what follows in a value. [A B] values are lists, {...} values are JSON objects
+
+    :raise ValueError: if a line is not a "key: value" pair or there are none
+    :return: dict with raw template values
+    '''
+    config = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith('#'):
+            continue
+        match = ISSUE_LINE.match(line)
+        if match is None:
+            raise ValueError(f"line '{line[:40]}' is not a 'key: value' pair")
+        key, value = match.group(1), match.group(2).split('#', 1)[0].strip()
+        if value == "":
+            continue
+        if value.startswith('[') and value.endswith(']'):
+            config[key] = [x for x in re.split(r'[\s,]+', value[1:-1]) if x]
+        elif value.startswith('{') and value.endswith('}'):
+            config[key] = json.loads(value)
+        else:
+            config[key] = value
+    if len(config) == 0:
+        raise ValueError("no 'key: value' pairs found")
+    return config
+
+
+def parse_template(text):
+    '''
+    :raise ValueError: if text is neither a JSON object nor an issue form
+    :return: dict with raw template values
+    '''
+    stripped = text.strip()
+    if stripped.startswith('{'):
+        config = json.loads(stripped)
+        if not isinstance(config, dict):
+            raise ValueError("template is not a JSON object")
+        return config
+    return parse_issue_form(text)
+
+
+def template_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def output_path(template_path, output=OUTPUT_DIRECTORY):
+    '''
+    :return: path of the artifact of a template, <output>/<template directory>/<template name>.json
+    '''
+    directory = os.path.basename(os.path.dirname(os.path.abspath(template_path)))
+    name = os.path.splitext(os.path.basename(template_path))[0]
+    return os.path.join(output, directory, f"{name}.json")
+
+
+def compile_template(template_path, text):
+    '''
+    Validates a CDC template and derives its target names
+
+    :param template_path: template file path, used as diagnostics path
+    :param text: template content
+    :return: tuple with (compiled config dict, None if KO, diagnostics.Diagnostics)
+    '''
+    result = Diagnostics()
+    try:
+        config = parse_template(text)
+    except ValueError as ex:
+        result.error(template_path, None, diagnostics.PARSE_FAILED, f"Not a CDC template: {ex}")
+        return None, result
+
+    for key in config:
+        if key not in CDC_SCHEMA:
+            result.warning(template_path, key, diagnostics.UNKNOWN_KEY, f"Unknown key '{key}' is ignored")
+    validations.validate_config(config, CDC_SCHEMA, filter_keys=True, report=result.reporter(template_path))
+    if result.has_errors:
+        return None, result
+
+    # Copied templates often keep the initial load table of another one
+    base_name = il_table_name(config)
+    if not config['sf_cdc_il_table'].startswith(base_name):
+        result.warning(template_path, 'sf_cdc_il_table', diagnostics.MISMATCH,
+                       f"sf_cdc_il_table '{config['sf_cdc_il_table']}' does not match '{base_name}'")
+    return {key: config[key] for key in CDC_SCHEMA}, result
+
+
+def _compile_one(template_path, text, output, write):
+    '''
+    Compiles a template and writes its artifact, never raising
+
+    :return: manifest entry dict with digest, ok, artifact path, target table and diagnostics report
+    '''
+    entry = {'digest': template_digest(text), 'ok': False, 'output': None, 'target': None}
+    try:
+        config, result = compile_template(template_path, text)
+        if config is not None:
+            entry['ok'] = True
+            entry['target'] = f"{config['sf_bbdd_target']}.{config['sf_flat_schema']}.{config['sf_table']}"
+            entry['il_table'] = config['sf_cdc_il_table']
+            if write:
+                entry['output'] = output_path(template_path, output)
+                os.makedirs(os.path.dirname(entry['output']), exist_ok=True)
+                pipeline_writer.write_file_atomic(entry['output'], json.dumps(config, indent=2) + "\n")
+    except Exception as ex:
+        result = Diagnostics()
+        result.error(template_path, None, diagnostics.PARSE_FAILED, f"Unexpected error compiling template: {ex}")
+        entry['ok'] = False
+    entry['diagnostics'] = result.report()
+    return template_path, entry
+
+
+def list_templates(paths):
+    '''
+    :param paths: template files and directories, *.json files of directories are taken
+    :return: sorted list of template file paths
+    '''
+    templates = set()
+    for path in paths:
+        if os.path.isdir(path):
+            templates.update(os.path.join(path, x) for x in os.listdir(path) if x.endswith('.json'))
+        else:
+            templates.add(path)
+    return sorted(templates)
+
+
+def read_manifest(output=OUTPUT_DIRECTORY):
+    '''
+    :return: tuple with (compiler version, dict with template path -> manifest entry), (None, {}) if missing
+    '''
+    try:
+        with open(os.path.join(output, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        return manifest['version'], dict(manifest['templates'])
+    except (OSError, ValueError, TypeError, KeyError):
+        return None, {}
+
+
+def load_manifest(output=OUTPUT_DIRECTORY):
+    '''
+    :return: dict with template path -> manifest entry, empty if missing or built by another compiler version
+    '''
+    version, templates = read_manifest(output)
+    return templates if version == compiler_version() else {}
+
+
+def prune_outputs(previous, entries):
+    '''
+    Removes the artifacts of a previous manifest no template produces anymore: those of templates
+    deleted or renamed since, and of templates compiled again that are now KO or moved.
+    Artifacts of templates still present but not compiled in this run are kept
+
+    :param previous: dict with template path -> entry of the previous manifest, whatever its version
+    :param entries: dict with template path -> entry of the new manifest
+    :return: sorted list of removed artifact paths
+    '''
+    outputs = {x['output'] for x in entries.values() if x['output'] is not None}
+    stale = {entry.get('output') for template_path, entry in previous.items()
+             if template_path in entries or not os.path.exists(template_path)}
+    removed = []
+    for artifact in sorted(stale - outputs - {None}):
+        try:
+            os.remove(artifact)
+            removed.append(artifact)
+        except FileNotFoundError:
+            continue
+        # Template directory left empty, as if it never had templates
+        try:
+            os.rmdir(os.path.dirname(artifact))
+        except OSError:
+            pass
+    return removed
+
+
+def duplicates(entries):
+    '''
+    :param entries: dict with template path -> manifest entry
+    :return: dict with template path -> list of other templates loading the same target or initial load table
+    '''
+    by_name = {}
+    for template_path, entry in entries.items():
+        if entry['ok']:
+            for name in {entry['target'], entry['il_table']}:
+                by_name.setdefault(name, []).append(template_path)
+    result = {}
+    for name, templates in by_name.items():
+        for template_path in templates:
+            others = [x for x in templates if x != template_path]
+            if len(others) > 0:
+                result.setdefault(template_path, set()).update(others)
+    return {x: sorted(others) for x, others in result.items()}
+
+
+def compile_templates(templates, output=OUTPUT_DIRECTORY, workers=1, write=True, force=False):
+    '''
+    Compiles templates in one pass, in worker processes if workers > 1. Templates whose content
+    is unchanged since the last run of the same compiler version are skipped.
+    The manifest keeps the templates of previous runs still present, and artifacts no template
+    produces anymore are removed with prune_outputs
+
+    :param templates: list of template file paths
+    :param workers: number of worker processes, None to use all cores
+    :param write: write artifacts and manifest
+    :param force: compile every template
+    :return: tuple with (dict with template path -> manifest entry, list of compiled template paths)
+    '''
+    version, manifest = read_manifest(output) if write else (None, {})
+    previous = manifest if version == compiler_version() and not force else {}
+    entries, pending = {}, []
+    for template_path in templates:
+        with open(template_path) as f:
+            text = f.read()
+        entry = previous.get(template_path)
+        if entry is not None and entry['digest'] == template_digest(text) and \
+                (entry['output'] is None or os.path.exists(entry['output'])):
+            entries[template_path] = entry
+        else:
+            pending.append((template_path, text))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(pending))
+    paths = [x[0] for x in pending]
+    texts = [x[1] for x in pending]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(pending) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_compile_one, paths, texts, [output] * len(paths), [write] * len(paths),
+                                        chunksize=chunksize))
+    else:
+        results = [_compile_one(path, text, output, write) for path, text in pending]
+    entries.update(results)
+    entries = {x: entries[x] for x in templates}
+
+    if write:
+        # Templates of previous runs not given this time, entries of another compiler version are dropped
+        templates = {x: entry for x, entry in previous.items() if x not in entries and os.path.exists(x)}
+        templates.update(entries)
+        for artifact in prune_outputs(manifest, templates):
+            logger.info(f"Removed artifact {artifact}, its template was deleted, renamed or is KO")
+        os.makedirs(output, exist_ok=True)
+        pipeline_writer.write_file_atomic(os.path.join(output, MANIFEST_FILE), json.dumps(
+            {'version': compiler_version(), 'templates': templates}, indent=1, sort_keys=True))
+    return entries, paths
+
+
+def log_report(entries, compiled):
+    '''
+    Logs the diagnostics of every template and templates loading the same tables
+
+    :return: exit code, 0 if every template is OK, 1 otherwise
+    '''
+    for template_path, entry in entries.items():
+        Diagnostics.from_report(entry['diagnostics']).log()
+    for template_path, others in duplicates(entries).items():
+        logger.warning(f"Template {template_path} loads the same tables as {', '.join(others)}")
+    ko = [x for x in entries if not entries[x]['ok']]
+    logger.info(f"CDC templates: {len(entries)} found, {len(compiled)} compiled, "
+                f"{len(entries) - len(compiled)} unchanged, {len(ko)} KO")
+    return 1 if len(ko) > 0 else 0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Validate and compile CDC templates")
+    arg_parser.add_argument('paths', nargs='*', help=f"templates or directories (default: {' '.join(CDC_DIRECTORIES)})")
+    arg_parser.add_argument('--output', default=OUTPUT_DIRECTORY, help=f"artifacts directory (default: {OUTPUT_DIRECTORY})")
+    arg_parser.add_argument('-j', '--workers', type=int, default=1,
+                            help="worker processes, 0 to use all cores (default: 1, in-process)")
+    arg_parser.add_argument('--check', action='store_true', help="only validate, do not write artifacts")
+    arg_parser.add_argument('--force', action='store_true', help="compile unchanged templates too")
+    args = arg_parser.parse_args()
+    # Same log format as validate_properties, which is not imported here
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - [%(levelname)s] - %(message)s')
+
+    paths = args.paths or [x for x in CDC_DIRECTORIES if os.path.isdir(x)]
+    entries, compiled = compile_templates(list_templates(paths), args.output, workers=args.workers or None,
+                                          write=not args.check, force=args.force)
+    sys.exit(log_report(entries, compiled))
+
+
+if __name__ == "__main__":
+    main()
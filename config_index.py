@@ -0,0 +1,139 @@
+from types import MappingProxyType
+from collections import ChainMap
+
+
+# Keys of a level holding settings inherited by its sublevels instead of a sublevel
+SECTIONS = ('snowflake',)
+
+EMPTY = MappingProxyType({})
+NO_SECTIONS = MappingProxyType({})
+
+
+class ConfigIndex:
+    '''
+    Immutable index of the config levels of a properties dict:
+        global -> origin -> schema -> table
+
+    Each level is addressed by the path of lowercased names from the root:
+        (), ('ptr',), ('ptr', 'aap_drive'), ('ptr', 'aap_drive', 'fact_venta_evento')
+    and holds its own scalar values plus one mapping per section (snowflake settings...).
+    Sections are resolved across levels with a layered lookup, deepest level first,
+    memoized per path, so resolving a table costs one ChainMap node on top of its schema.
+    The source dict is never modified through the index and every mapping returned is read-only
+
+    :param levels: dict with path tuple -> (own values dict, dict with section name -> dict),
+                   the index takes them over, they must not be modified afterwards
+    '''
+
+    def __init__(self, levels):
+        self._levels = levels
+        self._resolved = {}
+        # Shallow copies handed out by config, the only copies made of the source dict
+        self.copies = 0
+
+    @classmethod
+    def from_properties(cls, properties, sections=SECTIONS):
+        '''
+        Indexes every nested dict of a properties dict as a level
+
+        :param properties: dict as returned by properties_text_to_dict
+        :param sections: keys indexed as inherited sections instead of sublevels
+        :return: ConfigIndex
+        '''
+        levels = {}
+        pending = [((), properties)]
+        while pending:
+            path, config = pending.pop()
+            # Most levels (tables) have no sublevels nor sections, their dict is indexed as is
+            for value in config.values():
+                if isinstance(value, dict):
+                    break
+            else:
+                levels[path] = (config, NO_SECTIONS)
+                continue
+            values, level_sections = {}, {}
+            for key, value in config.items():
+                if key in sections and isinstance(value, dict):
+                    level_sections[key] = value
+                elif isinstance(value, dict):
+                    pending.append((path + (key,), value))
+                else:
+                    values[key] = value
+            levels[path] = (values, level_sections)
+        return cls(levels)
+
+    @staticmethod
+    def path(*names):
+        '''
+        :return: level path for the given origin, schema, table names
+        '''
+        return tuple(map(str.lower, names))
+
+    def __contains__(self, path):
+        return path in self._levels
+
+    def __iter__(self):
+        return iter(self._levels)
+
+    def __len__(self):
+        return len(self._levels)
+
+    def values(self, path):
+        '''
+        :return: read-only mapping with the own values of a level, empty if it does not exist
+        '''
+        level = self._levels.get(path)
+        return MappingProxyType(level[0]) if level is not None else EMPTY
+
+    def config(self, path, section=None):
+        '''
+        Returns a copy of the own values of a level, or of a section set on it,
+        to be validated without touching the index
+
+        :param path: level path tuple
+        :param section: section name, None for the level values
+        :return: new dict, empty if the level or section does not exist
+        '''
+        level = self._levels.get(path)
+        if level is None:
+            return {}
+        if section is None:
+            self.copies += 1
+            return dict(level[0])
+        values = level[1].get(section)
+        if values is None:
+            return {}
+        self.copies += 1
+        return dict(values)
+
+    def section(self, path, name):
+        '''
+        :return: read-only mapping with the section set on a level itself, empty if not set
+        '''
+        level = self._levels.get(path)
+        if level is None or name not in level[1]:
+            return EMPTY
+        return MappingProxyType(level[1][name])
+
+    def resolve(self, path, name):
+        '''
+        Returns the effective section of a level, layered over every level above it
+
+        :param path: level path tuple
+        :param name: section name
+        :return: read-only ChainMap, deepest level first
+        '''
+        resolved = self._resolved.get((path, name))
+        if resolved is None:
+            if len(path) == 0:
+                resolved = ChainMap(self.section(path, name))
+            else:
+                resolved = self.resolve(path[:-1], name).new_child(self.section(path, name))
+            self._resolved[(path, name)] = resolved
+        return resolved
+
+    def get(self, path, name, key, default=None):
+        '''
+        :return: effective value of key in a section for a level
+        '''
+        return self.resolve(path, name).get(key, default)
@@ -0,0 +1,262 @@
+import re
+from functools import lru_cache
+from datetime import datetime, time, timedelta
+
+
+"""
+Schedule intervals accepted for pipelines:
+  Presets: @hourly, @daily, @weekly, @monthly, @yearly
+  Cron codes: 5 fields (minute hour day-of-month month day-of-week), each one a comma
+    separated list of '*', 'N' or 'N-M', optionally followed by a '/step'
+    ('*/5', '1-5', '0,30', '10-40/10'). Day of week goes from 0 (sunday) to 6.
+    As in cron, if both day of month and day of week are restricted, a day matching
+    any of them fires
+  Intervals: @every followed by a duration (@every 1h30m), not accepted as pipeline
+    schedule but supported to compute fire times
+"""
+
+PRESETS = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *'
+}
+
+# (name, min, max) of every cron field
+FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 6)
+)
+
+FIELD_ITEM = re.compile(r'^(?:(\*)|(\d+)(?:-(\d+))?)(?:/(\d+))?$')
+
+EVERY_DURATION = re.compile(r'^@every ((?:\d+(?:ns|us|µs|ms|s|m|h))+)$')
+DURATION_PART = re.compile(r'(\d+)(ns|us|µs|ms|s|m|h)')
+# Nanoseconds per unit, durations are added up exactly and rounded to timedelta microseconds once
+DURATION_UNITS = {
+    'ns': 1,
+    'us': 10 ** 3,
+    'µs': 10 ** 3,
+    'ms': 10 ** 6,
+    's': 10 ** 9,
+    'm': 60 * 10 ** 9,
+    'h': 3600 * 10 ** 9
+}
+
+# Days searched ahead for a matching date before giving up (covers leap years)
+MAX_DAYS_AHEAD = 366 * 8
+
+
+def _parse_field(value, name, minimum, maximum):
+    '''
+    Parses a cron field into the sorted tuple of values it matches
+
+    :raise ValueError: if the field is not valid
+    '''
+    values = set()
+    for item in value.split(','):
+        match = FIELD_ITEM.match(item)
+        if match is None:
+            raise ValueError(f"Invalid {name} field '{value}'")
+        star, start, end, step = match.groups()
+        if star:
+            start, end = minimum, maximum
+        else:
+            start = int(start)
+            # 'N/step' runs from N to the maximum value
+            end = int(end) if end is not None else maximum if step is not None else start
+        step = int(step) if step is not None else 1
+        if not minimum <= start <= end <= maximum or step == 0:
+            raise ValueError(f"Invalid {name} field '{value}', values go from {minimum} to {maximum}")
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+
+class CronSchedule:
+    '''
+    Compact representation of a cron code, with the values matched by every field
+    '''
+    __slots__ = ('expression', 'minutes', 'hours', 'days', 'months', 'weekdays', 'day_restricted',
+                 'weekday_restricted', '_days_set', '_months_set', '_weekdays_set')
+
+    def __init__(self, expression, minutes, hours, days, months, weekdays, day_restricted, weekday_restricted):
+        self.expression = expression
+        self.minutes = minutes
+        self.hours = hours
+        self.days = days
+        self.months = months
+        self.weekdays = weekdays
+        self.day_restricted = day_restricted
+        self.weekday_restricted = weekday_restricted
+        self._days_set = frozenset(days)
+        self._months_set = frozenset(months)
+        self._weekdays_set = frozenset(weekdays)
+
+    def __repr__(self):
+        return f"CronSchedule('{self.expression}')"
+
+    def matches_date(self, day):
+        '''
+        :param day: date or datetime
+        :return: True if the schedule fires on that day
+        '''
+        if day.month not in self._months_set:
+            return False
+        day_match = day.day in self._days_set
+        # isoweekday: monday 1 .. sunday 7, cron: sunday 0 .. saturday 6
+        weekday_match = day.isoweekday() % 7 in self._weekdays_set
+        if self.day_restricted and self.weekday_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def fire_times_per_day(self):
+        '''
+        :return: number of times the schedule fires on a matching day
+        '''
+        return len(self.hours) * len(self.minutes)
+
+    def next_fire_times(self, start, n=1):
+        '''
+        Returns the next n fire times strictly after start, keeping start tzinfo
+
+        :param start: datetime
+        :param n: number of fire times
+        :return: list of datetimes, shorter than n if the schedule stops firing
+        '''
+        result = []
+        day = start.date()
+        first_day = True
+        for i in range(MAX_DAYS_AHEAD):
+            if self.matches_date(day):
+                for hour in self.hours:
+                    if first_day and hour < start.hour:
+                        continue
+                    for minute in self.minutes:
+                        fire_time = datetime.combine(day, time(hour, minute), tzinfo=start.tzinfo)
+                        if first_day and fire_time <= start:
+                            continue
+                        result.append(fire_time)
+                        if len(result) == n:
+                            return result
+            day += timedelta(days=1)
+            first_day = False
+        return result
+
+
+class EverySchedule:
+    '''
+    Fixed interval schedule, fire times are anchored on a start date
+    '''
+    __slots__ = ('expression', 'interval')
+
+    def __init__(self, expression, interval):
+        self.expression = expression
+        self.interval = interval
+
+    def __repr__(self):
+        return f"EverySchedule('{self.expression}')"
+
+    def next_fire_times(self, start, n=1, anchor=None):
+        '''
+        Returns the next n fire times strictly after start
+
+        :param start: datetime
+        :param n: number of fire times
+        :param anchor: datetime of a fire time, start by default
+        :return: list of datetimes
+        '''
+        anchor = start if anchor is None else anchor
+        if anchor > start:
+            first = anchor
+        else:
+            first = anchor + ((start - anchor) // self.interval + 1) * self.interval
+        return [first + i * self.interval for i in range(n)]
+
+
+def _parse_duration(duration):
+    nanoseconds = sum(int(amount) * DURATION_UNITS[unit] for amount, unit in DURATION_PART.findall(duration))
+    return timedelta(microseconds=nanoseconds / 1000)
+
+
+@lru_cache(maxsize=1024)
+def parse(expression):
+    '''
+    Parses a schedule interval, memoized since the same few intervals are shared by most pipelines
+
+    :param expression: preset, cron code or @every duration
+    :return: CronSchedule or EverySchedule
+    :raise ValueError: if expression is not valid
+    '''
+    expression = expression.strip()
+    match = EVERY_DURATION.match(expression)
+    if match is not None:
+        interval = _parse_duration(match.group(1))
+        # Sub-microsecond durations round to zero
+        if interval <= timedelta():
+            raise ValueError(f"Invalid interval '{expression}', duration must be at least 1us")
+        return EverySchedule(expression, interval)
+
+    code = PRESETS.get(expression, expression)
+    values = code.split()
+    if len(values) != len(FIELDS):
+        raise ValueError(f"Invalid cron '{expression}', it must have {len(FIELDS)} fields")
+    fields = [_parse_field(value, *field) for value, field in zip(values, FIELDS)]
+    # As in cron, a field starting with '*' ('*', '*/2') does not restrict days
+    return CronSchedule(expression, *fields, day_restricted=not values[2].startswith('*'),
+                        weekday_restricted=not values[4].startswith('*'))
+
+
+def is_preset(expression):
+    return expression in PRESETS
+
+
+def is_valid_code(expression):
+    '''
+    :return: True if expression is a valid 5 fields cron code
+    '''
+    try:
+        return isinstance(parse(expression), CronSchedule) and not is_preset(expression.strip())
+    except ValueError:
+        return False
+
+
+def is_valid_every(expression):
+    '''
+    :return: True if expression is an @every interval that parse accepts
+    '''
+    try:
+        return isinstance(parse(expression), EverySchedule)
+    except ValueError:
+        return False
+
+
+def validate_many(expressions):
+    '''
+    Checks a bulk of schedule intervals, every distinct expression is parsed once
+
+    :param expressions: iterable of intervals
+    :return: dict with expression -> error message, only for invalid expressions
+    '''
+    errors = {}
+    for expression in set(expressions):
+        try:
+            parse(expression)
+        except ValueError as ex:
+            errors[expression] = str(ex)
+    return errors
+
+
+def next_fire_times(expression, start, n=1):
+    '''
+    Returns the next n fire times of a schedule interval strictly after start
+
+    :param expression: preset, cron code or @every duration
+    :param start: datetime, also anchor of @every intervals
+    :param n: number of fire times
+    :return: list of datetimes
+    '''
+    return parse(expression).next_fire_times(start, n)
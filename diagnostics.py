@@ -0,0 +1,184 @@
+import os
+import json
+import logging
+
+
+logger = logging.getLogger()
+
+# Directory where a JSON diagnostics report is written per validated file
+DIAGNOSTICS_ENV_VAR = "VALIDATE_PROPERTIES_DIAGNOSTICS"
+# Validation of a file stops after this number of errors
+MAX_ERRORS_ENV_VAR = "VALIDATE_PROPERTIES_MAX_ERRORS"
+
+ERROR = "error"
+WARNING = "warning"
+
+# Diagnostic codes
+MISSING = "missing"
+EMPTY = "empty"
+CASTED = "casted"
+CAST_FAILED = "cast_failed"
+CAST_UNDEFINED = "cast_undefined"
+TRANSFORM_FAILED = "transform_failed"
+CONDITION_FAILED = "condition_failed"
+VALIDATION_FAILED = "validation_failed"
+REQUIRED_FAILED = "required_failed"
+DEFAULT_FAILED = "default_failed"
+DECRYPT_FAILED = "decrypt_failed"
+INVALID_ORIGIN = "invalid_origin"
+MISSING_SECTION = "missing_section"
+PARSE_FAILED = "parse_failed"
+UNKNOWN_KEY = "unknown_key"
+MISMATCH = "mismatch"
+
+
+class Diagnostic:
+    '''
+    A single validation error or warning
+
+    :param level: ERROR or WARNING
+    :param path: config the entry belongs to, dotted as in the properties file ('ptr.aap_drive.snowflake')
+    :param key: config key, None if it concerns the whole config
+    :param code: diagnostic code, see module constants
+    :param message: human readable message
+    '''
+    __slots__ = ('level', 'path', 'key', 'code', 'message')
+
+    def __init__(self, level, path, key, code, message):
+        self.level = level
+        self.path = path
+        self.key = key
+        self.code = code
+        self.message = message
+
+    def __repr__(self):
+        return f"Diagnostic({self.level}, {self.path}, {self.key}, {self.code})"
+
+    def to_dict(self):
+        return {'level': self.level, 'path': self.path, 'key': self.key, 'code': self.code, 'message': self.message}
+
+
+class TooManyErrors(Exception):
+    '''
+    Raised by Diagnostics when max_errors errors have been collected
+    '''
+
+
+class Diagnostics:
+    '''
+    Collects every diagnostic of a validation in order, optionally stopping it after max_errors errors
+
+    :param max_errors: number of errors after which TooManyErrors is raised, None to collect all
+    '''
+
+    def __init__(self, max_errors=None):
+        self.max_errors = max_errors
+        self.entries = []
+        self.error_count = 0
+        self.truncated = False
+
+    def add(self, level, path, key, code, message):
+        self.entries.append(Diagnostic(level, path, key, code, message))
+        if level == ERROR:
+            self.error_count += 1
+            if self.max_errors is not None and self.error_count >= self.max_errors:
+                self.truncated = True
+                raise TooManyErrors(f"Validation stopped after {self.error_count} errors")
+
+    def error(self, path, key, code, message):
+        self.add(ERROR, path, key, code, message)
+
+    def warning(self, path, key, code, message):
+        self.add(WARNING, path, key, code, message)
+
+    def reporter(self, path):
+        '''
+        :return: function (level, key, code, message) adding entries for path, as used by CompiledSchema
+        '''
+        add = self.add
+
+        def report(level, key, code, message):
+            add(level, path, key, code, message)
+        return report
+
+    @property
+    def has_errors(self):
+        return self.error_count > 0
+
+    def messages(self, level):
+        '''
+        :return: dict with path -> list of messages of level, in order, as logged by log
+        '''
+        result = {}
+        for entry in self.entries:
+            if entry.level == level:
+                result.setdefault(entry.path, []).append(entry.message)
+        return result
+
+    def report(self):
+        '''
+        :return: JSON serializable dict with every entry and the counters
+        '''
+        return {
+            'errors': self.error_count,
+            'warnings': len(self.entries) - self.error_count,
+            'truncated': self.truncated,
+            'diagnostics': [x.to_dict() for x in self.entries]
+        }
+
+    def replay(self, report):
+        '''
+        Adds the entries of a report(), as stored in the parse cache, without applying max_errors
+        '''
+        for entry in report['diagnostics']:
+            self.entries.append(Diagnostic(entry['level'], entry['path'], entry['key'], entry['code'],
+                                           entry['message']))
+        self.error_count += report['errors']
+        self.truncated = self.truncated or report['truncated']
+
+    @classmethod
+    def from_report(cls, report):
+        '''
+        :return: Diagnostics rebuilt from report()
+        '''
+        diagnostics = cls()
+        diagnostics.replay(report)
+        return diagnostics
+
+    def log(self):
+        '''
+        Logs warnings and errors grouped by config path
+
+        :return: True if there are errors
+        '''
+        for path, messages in self.messages(WARNING).items():
+            logger.warning(f'Warning on {path} configuration:\n   * %s', '\n   * '.join(messages))
+        for path, messages in self.messages(ERROR).items():
+            logger.error(f'Invalid {path} configuration:\n   * %s', '\n   * '.join(messages))
+        if self.truncated:
+            logger.error(f"Validation stopped after {self.error_count} errors")
+        return self.has_errors
+
+    def write(self, path, **extra):
+        report = dict(extra)
+        report.update(self.report())
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def diagnostics_from_environment():
+    '''
+    :return: Diagnostics with max_errors from MAX_ERRORS_ENV_VAR, if set
+    '''
+    max_errors = os.environ.get(MAX_ERRORS_ENV_VAR)
+    return Diagnostics(max_errors=int(max_errors) if max_errors else None)
+
+
+def write_diagnostics(diagnostics, name, **extra):
+    '''
+    Writes the JSON report of diagnostics to <DIAGNOSTICS_ENV_VAR dir>/<name>.json, if set
+    '''
+    diagnostics_dir = os.environ.get(DIAGNOSTICS_ENV_VAR)
+    if diagnostics_dir:
+        os.makedirs(diagnostics_dir, exist_ok=True)
+        diagnostics.write(os.path.join(diagnostics_dir, f"{name}.json"), **extra)
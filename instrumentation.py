@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import heapq
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+
+
+# Directory where a JSON stats report is written per validated file
+STATS_ENV_VAR = "VALIDATE_PROPERTIES_STATS"
+# Directory where a cProfile dump is written per validated file
+PROFILE_ENV_VAR = "VALIDATE_PROPERTIES_PROFILE"
+
+SLOWEST_TABLES = 10
+
+
+class Stats:
+    '''
+    Collects wall time per stage, counters and the slowest tables of a validation
+    '''
+    enabled = True
+
+    def __init__(self, slowest_tables=SLOWEST_TABLES):
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.slowest_tables = slowest_tables
+        self._tables = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def timed_iter(self, iterable, name):
+        '''
+        Yields from iterable adding the time spent producing each item to stage name
+        '''
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stages[name] += time.perf_counter() - start
+                return
+            self.stages[name] += time.perf_counter() - start
+            yield item
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def table(self, name, seconds):
+        self._tables[name] += seconds
+
+    def report(self):
+        '''
+        :return: JSON serializable dict with stages, counters and slowest tables
+        '''
+        slowest = heapq.nlargest(self.slowest_tables, self._tables.items(), key=lambda x: x[1])
+        return {
+            'stages': dict(self.stages),
+            'total_seconds': sum(self.stages.values()),
+            'counters': dict(self.counters),
+            'slowest_tables': [{'table': name, 'seconds': seconds} for name, seconds in slowest],
+        }
+
+    def write(self, path, **extra):
+        report = dict(extra)
+        report.update(self.report())
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+class NullStats:
+    '''
+    Stats drop-in doing nothing, used when instrumentation is disabled
+    '''
+    enabled = False
+    _context = nullcontext()
+
+    def stage(self, name):
+        return self._context
+
+    def timed_iter(self, iterable, name):
+        return iterable
+
+    def count(self, name, value=1):
+        pass
+
+    def table(self, name, seconds):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+def stats_from_environment():
+    '''
+    :return: a Stats collector if STATS_ENV_VAR is set, NULL_STATS otherwise
+    '''
+    return Stats() if os.environ.get(STATS_ENV_VAR) else NULL_STATS
+
+
+def write_stats(stats, name, **extra):
+    '''
+    Writes the JSON report of stats to <STATS_ENV_VAR dir>/<name>.json, if enabled
+    '''
+    stats_dir = os.environ.get(STATS_ENV_VAR)
+    if stats.enabled and stats_dir:
+        os.makedirs(stats_dir, exist_ok=True)
+        stats.write(os.path.join(stats_dir, f"{name}.json"), **extra)
+
+
+@contextmanager
+def profile_from_environment(name):
+    '''
+    Profiles the block with cProfile and dumps it to <PROFILE_ENV_VAR dir>/<name>.prof, if set
+    '''
+    profile_dir = os.environ.get(PROFILE_ENV_VAR)
+    if not profile_dir:
+        yield
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
@@ -1,7 +1,7 @@
 import base64
 import hashlib
-import re
 import os
+from collections import OrderedDict
 from Crypto.Cipher import DES
 
 """
@@ -31,29 +31,127 @@ Decrypt:
   Remove padding -> this is your result
 """
 
-def get_derived_key(password, salt, count):
+ITERATIONS = 1000
+
+# Bounded LRU cache of derived (key, iv) pairs keyed by (password, salt, count)
+DERIVED_KEY_CACHE_SIZE = 4096
+_derived_key_cache = OrderedDict()
+
+
+def _derive_key(password, salt, count):
     key = password + salt
     for i in range(count):
         m = hashlib.md5(key)
         key = m.digest()
     return (key[:8], key[8:])
 
+
+def _cache_put(cache_key, derived_key):
+    _derived_key_cache[cache_key] = derived_key
+    _derived_key_cache.move_to_end(cache_key)
+    while len(_derived_key_cache) > DERIVED_KEY_CACHE_SIZE:
+        _derived_key_cache.popitem(last=False)
+
+
+def clear_derived_key_cache():
+    _derived_key_cache.clear()
+
+
+def get_derived_key(password, salt, count):
+    cache_key = (bytes(password), bytes(salt), count)
+    derived_key = _derived_key_cache.get(cache_key)
+    if derived_key is None:
+        derived_key = _derive_key(*cache_key)
+    _cache_put(cache_key, derived_key)
+    return derived_key
+
+
+def _pad(data):
+    # PKCS5: 1-8 bytes of value pad_num, padding bytes and not characters
+    pad_num = 8 - (len(data) % 8)
+    return data + bytes([pad_num]) * pad_num
+
+
+def _unpad(data):
+    pad_num = data[-1] if len(data) > 0 else 0
+    if not 1 <= pad_num <= 8 or data[-pad_num:] != bytes([pad_num]) * pad_num:
+        # A wrong password decrypts to random bytes, almost never correctly padded
+        raise ValueError("Invalid padding, wrong password or corrupted message")
+    return data[:-pad_num]
+
+
+def _decrypt_with_key(enc_text, dk, iv):
+    crypter = DES.new(dk, DES.MODE_CBC, iv)
+    return _unpad(crypter.decrypt(enc_text)).decode('utf-8')
+
+
 def decrypt(msg, password):
     msg_bytes = base64.b64decode(msg)
     salt = msg_bytes[:8]
     enc_text = msg_bytes[8:]
-    (dk, iv) = get_derived_key(password, salt, 1000)
+    (dk, iv) = get_derived_key(password, salt, ITERATIONS)
+    return _decrypt_with_key(enc_text, dk, iv)
+
+
+def decrypt_many(msgs, password, workers=1):
+    """
+    Decrypts a list of messages sharing the same password.
+    Identical messages are decrypted once, and derived keys not yet cached can be
+    computed on a process pool (workers > 1, None to use all cores)
+    Returns the decrypted texts in the same order as msgs
+    """
+    password = bytes(password)
+    unique_msgs = {}
+    for msg in msgs:
+        if msg not in unique_msgs:
+            msg_bytes = base64.b64decode(msg)
+            unique_msgs[msg] = (msg_bytes[:8], msg_bytes[8:])
+
+    cold_salts = list(dict.fromkeys(salt for salt, enc_text in unique_msgs.values()
+                                    if (password, salt, ITERATIONS) not in _derived_key_cache))
+    if workers != 1 and len(cold_salts) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            derived_keys = executor.map(_derive_key, [password] * len(cold_salts), cold_salts,
+                                        [ITERATIONS] * len(cold_salts), chunksize=max(1, len(cold_salts) // 64))
+            for salt, derived_key in zip(cold_salts, derived_keys):
+                _cache_put((password, salt, ITERATIONS), derived_key)
+
+    texts = {}
+    for msg, (salt, enc_text) in unique_msgs.items():
+        (dk, iv) = get_derived_key(password, salt, ITERATIONS)
+        texts[msg] = _decrypt_with_key(enc_text, dk, iv)
+    return [texts[msg] for msg in msgs]
+
+
+def _encrypt_with_key(msg, salt, dk, iv):
     crypter = DES.new(dk, DES.MODE_CBC, iv)
-    text = crypter.decrypt(enc_text).decode('utf-8')
-    # remove the padding at the end, if any
-    return re.sub(r'[\x01-\x08]','',text)
+    enc_text = crypter.encrypt(_pad(msg.encode("utf8")))
+    return base64.b64encode(salt + enc_text)
+
 
 def encrypt(msg, password):
     salt = os.urandom(8)
-    pad_num = 8 - (len(msg) % 8)
-    for i in range(pad_num):
-        msg += chr(pad_num)
-    (dk, iv) = get_derived_key(password, salt, 1000)
-    crypter = DES.new(dk, DES.MODE_CBC, iv)
-    enc_text = crypter.encrypt(msg.encode("utf8"))
-    return base64.b64encode(salt + enc_text)
+    # salt is random, caching its derived key would only evict useful entries
+    (dk, iv) = _derive_key(password, salt, ITERATIONS)
+    return _encrypt_with_key(msg, salt, dk, iv)
+
+
+def encrypt_many(msgs, password, workers=1):
+    """
+    Encrypts a list of messages with the same password, each with its own random salt.
+    Derived keys can be computed on a process pool (workers > 1, None to use all cores)
+    Returns the encrypted messages in the same order as msgs
+    """
+    password = bytes(password)
+    salts = [os.urandom(8) for msg in msgs]
+    if workers != 1 and len(salts) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            derived_keys = list(executor.map(_derive_key, [password] * len(salts), salts,
+                                             [ITERATIONS] * len(salts), chunksize=max(1, len(salts) // 64)))
+    else:
+        derived_keys = [_derive_key(password, salt, ITERATIONS) for salt in salts]
+    return [_encrypt_with_key(msg, salt, dk, iv) for msg, salt, (dk, iv) in zip(msgs, salts, derived_keys)]
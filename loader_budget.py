@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import math
+import logging
+import argparse
+from datetime import datetime, timedelta
+from collections import defaultdict
+import validate_properties
+import properties_editor
+import schedule_planner
+import strategy_advisor
+
+
+logger = logging.getLogger()
+
+"""
+Resource model of the loader of a task, from its resolved snowflake config and its extractor settings:
+    each concurrent extraction query fills its own batch of batch_size_rows rows while up to
+    parallelism batches are flushed, so (query concurrency + parallelism) batches are in flight
+    memory is rows in flight times the row size, from table statistics or ROW_BYTES
+    each flushed batch is a stage file, rows / batch_size_rows files per run
+Every task of a pipeline fires at the same time, so loads add up per schedule slot
+"""
+
+# target-snowflake defaults
+DEFAULT_BATCH_SIZE_ROWS = 100000
+# Flush threads of parallelism 0 or unset, the loader uses one per CPU core
+AUTO_PARALLELISM = 4
+# In-memory size of a row when there are no table statistics
+ROW_BYTES = 1024
+
+MB = 1024 ** 2
+MAX_TASK_MEMORY_MB = 2048
+MAX_SLOT_MEMORY_MB = 32768
+MAX_STAGE_FILES = 1000
+MAX_SLOT_STAGE_FILES = 10000
+# Stage files under this size are too small to load efficiently
+MIN_FILE_MB = 16
+
+
+class TaskLoad:
+    '''
+    Estimated loader resources of a task
+
+    :param task_id: task identifier
+    :param origin: lowercase origin
+    :param batch_size_rows: effective batch_size_rows
+    :param batches: batches in flight
+    :param row_bytes: estimated row size
+    :param rows: table rows, None if unknown
+    '''
+
+    def __init__(self, task_id, origin, batch_size_rows, batches, row_bytes, rows=None):
+        self.task_id = task_id
+        self.origin = origin
+        self.batch_size_rows = batch_size_rows
+        self.batches = batches
+        self.row_bytes = row_bytes
+        self.rows = rows
+
+    @property
+    def rows_in_flight(self):
+        return self.batch_size_rows * self.batches
+
+    @property
+    def memory(self):
+        return self.rows_in_flight * self.row_bytes
+
+    @property
+    def file_bytes(self):
+        '''
+        :return: size of a full stage file
+        '''
+        return self.batch_size_rows * self.row_bytes
+
+    @property
+    def stage_files(self):
+        '''
+        :return: stage files written per run, None if table rows are unknown
+        '''
+        if self.rows is None:
+            return None
+        return max(1, math.ceil(self.rows / self.batch_size_rows))
+
+    def to_dict(self):
+        return {'task': self.task_id, 'origin': self.origin, 'batch_size_rows': self.batch_size_rows,
+                'batches': self.batches, 'rows_in_flight': self.rows_in_flight, 'memory_mb': self.memory / MB,
+                'stage_files': self.stage_files, 'file_mb': self.file_bytes / MB}
+
+
+def task_load(task_id, origin, table_config, table_snowflake, stats=None, auto_parallelism=AUTO_PARALLELISM,
+              row_bytes=ROW_BYTES):
+    '''
+    Estimates the loader resources of a task
+
+    :param table_config: validated table config (ORACLE_CONFIG_KEYS)
+    :param table_snowflake: resolved snowflake config of the table
+    :param stats: strategy_advisor.TableStats of the table, None if unknown
+    :return: TaskLoad
+    '''
+    batch_size_rows = table_snowflake.get('batch_size_rows') or DEFAULT_BATCH_SIZE_ROWS
+    parallelism = table_snowflake.get('parallelism') or auto_parallelism
+    batches = schedule_planner.task_concurrency(table_config) + parallelism
+    rows = None
+    if stats is not None:
+        rows = stats.rows
+        if stats.rows > 0 and stats.size > 0:
+            row_bytes = stats.size / stats.rows
+    return TaskLoad(task_id, origin, batch_size_rows, batches, row_bytes, rows)
+
+
+def check_task(load, max_task_memory=MAX_TASK_MEMORY_MB * MB, max_stage_files=MAX_STAGE_FILES,
+               min_file_bytes=MIN_FILE_MB * MB):
+    '''
+    :return: tuple with (errors, warnings) lists of messages on the loader config of a task
+    '''
+    errors, warnings = [], []
+    if load.memory > max_task_memory:
+        errors.append(f"{load.rows_in_flight} rows in flight ({load.batches} batches of {load.batch_size_rows}) "
+                      f"need {load.memory / MB:.0f}MB, over {max_task_memory / MB:.0f}MB")
+    if load.stage_files is not None and load.stage_files > max_stage_files:
+        errors.append(f"{load.stage_files} stage files per run, over {max_stage_files}, raise batch_size_rows")
+    # A table smaller than a batch writes a single small file whatever its config
+    if load.file_bytes < min_file_bytes and (load.rows is None or load.rows > load.batch_size_rows):
+        warnings.append(f"stage files of {load.file_bytes / MB:.1f}MB (batch_size_rows {load.batch_size_rows}), "
+                        f"under {min_file_bytes / MB:.0f}MB")
+    return errors, warnings
+
+
+# Resources summed per schedule slot
+RESOURCES = ('memory', 'rows', 'stage_files')
+
+
+class PipelineResources:
+    '''
+    Loader resources of the tasks of a properties file, weights holds their sum for each of RESOURCES.
+    Stage files only count tasks whose table rows are known
+    '''
+
+    def __init__(self, file_path, interval, start_date, loads):
+        self.file_path = file_path
+        self.interval = interval
+        self.start_date = start_date
+        self.loads = loads
+        self.weights = {
+            'memory': sum(x.memory for x in loads),
+            'rows': sum(x.rows_in_flight for x in loads),
+            'stage_files': sum(x.stage_files for x in loads if x.stage_files is not None)
+        }
+
+
+class SlotLoads:
+    '''
+    Loader resources per schedule slot, summed over the pipelines firing in it
+    '''
+
+    def __init__(self):
+        self.load = defaultdict(lambda: dict.fromkeys(RESOURCES, 0))
+
+    def add(self, pipeline, slots):
+        for slot in slots:
+            slot_load = self.load[slot]
+            for resource, weight in pipeline.weights.items():
+                slot_load[resource] += weight
+
+    def peak(self, resource):
+        return max((x[resource] for x in self.load.values()), default=0)
+
+    def over_budget(self, budgets):
+        '''
+        :param budgets: dict with resource -> maximum per slot, resources not in it are not checked
+        :return: list of (slot, resource, load, budget) where load goes over the budget, by slot
+        '''
+        result = []
+        for slot in sorted(self.load):
+            for resource, budget in budgets.items():
+                if self.load[slot][resource] > budget:
+                    result.append((slot, resource, self.load[slot][resource], budget))
+        return result
+
+
+def load_pipelines(file_paths, stats=None, auto_parallelism=AUTO_PARALLELISM, row_bytes=ROW_BYTES):
+    '''
+    Parses and validates properties files into PipelineResources, skipping KO files
+
+    :param stats: dict with table key -> strategy_advisor.TableStats
+    :return: list of PipelineResources
+    '''
+    stats = stats or {}
+    pipelines = []
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path).split('.')[0]
+        properties = validate_properties.properties_file_to_dict(file_path)
+        errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(properties, file_name)
+        if len(errors) > 0:
+            logger.warning(f"Properties file {file_path} is KO, it is not checked")
+            continue
+
+        loads = []
+        for origin, schema, table, table_config, table_snowflake in tables:
+            task_id = f"{origin.lower()}_{schema.lower()}_{table.lower()}"
+            table_stats = stats.get(strategy_advisor.table_key(origin, schema, table))
+            loads.append(task_load(task_id, origin.lower(), table_config, table_snowflake, table_stats,
+                                   auto_parallelism, row_bytes))
+        # Wall-clock time in Europe/Madrid, where schedules are defined
+        start_date = base_schedule['start_date'].replace(tzinfo=None)
+        pipelines.append(PipelineResources(file_path, base_schedule['interval'], start_date, loads))
+    return pipelines
+
+
+def slot_loads(pipelines, horizon_start, horizon_days=schedule_planner.HORIZON_DAYS):
+    '''
+    :return: SlotLoads with memory, rows in flight and stage files per slot
+    '''
+    horizon_end = horizon_start + timedelta(days=horizon_days)
+    slot_load = SlotLoads()
+    for pipeline in pipelines:
+        slot_load.add(pipeline, schedule_planner.fire_slots(pipeline.interval, pipeline.start_date,
+                                                            horizon_start, horizon_end))
+    return slot_load
+
+
+def report(pipelines, slot_load, max_task_memory=MAX_TASK_MEMORY_MB * MB, max_slot_memory=MAX_SLOT_MEMORY_MB * MB,
+           max_stage_files=MAX_STAGE_FILES, min_file_bytes=MIN_FILE_MB * MB,
+           max_slot_stage_files=MAX_SLOT_STAGE_FILES):
+    '''
+    :param slot_load: SlotLoads of the pipelines
+    :return: JSON serializable dict with every task load, its errors and warnings, and the slots over
+             the memory or stage files budget, memory in MB
+    '''
+    tasks = []
+    for pipeline in pipelines:
+        for load in pipeline.loads:
+            errors, warnings = check_task(load, max_task_memory, max_stage_files, min_file_bytes)
+            tasks.append(dict(load.to_dict(), file=pipeline.file_path, errors=errors, warnings=warnings))
+    return {
+        'tasks': tasks,
+        'peak_slot': {'memory_mb': slot_load.peak('memory') / MB, 'rows_in_flight': slot_load.peak('rows'),
+                      'stage_files': slot_load.peak('stage_files')},
+        'overloaded_slots': [
+            {'slot': slot.isoformat(), 'resource': resource,
+             'load': load / MB if resource == 'memory' else load,
+             'budget': budget / MB if resource == 'memory' else budget}
+            for slot, resource, load, budget in slot_load.over_budget({'memory': max_slot_memory,
+                                                                       'stage_files': max_slot_stage_files})
+        ]
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Estimate loader memory, rows in flight and stage files")
+    arg_parser.add_argument('files', nargs='*', help="properties files, every file in --directory by default")
+    arg_parser.add_argument('--directory', default="properties", help="properties directory (default: properties)")
+    arg_parser.add_argument('--stats', help="table statistics for row sizes and counts, see strategy_advisor")
+    arg_parser.add_argument('--row-bytes', type=int, default=ROW_BYTES, help="row size of tables without statistics")
+    arg_parser.add_argument('--auto-parallelism', type=int, default=AUTO_PARALLELISM,
+                            help="flush threads when parallelism is 0 or not set")
+    arg_parser.add_argument('--max-task-memory', type=int, default=MAX_TASK_MEMORY_MB, metavar='MB',
+                            help="memory allowed per task")
+    arg_parser.add_argument('--max-slot-memory', type=int, default=MAX_SLOT_MEMORY_MB, metavar='MB',
+                            help="memory allowed for the tasks firing in a schedule slot")
+    arg_parser.add_argument('--max-stage-files', type=int, default=MAX_STAGE_FILES,
+                            help="stage files allowed per task run")
+    arg_parser.add_argument('--max-slot-stage-files', type=int, default=MAX_SLOT_STAGE_FILES,
+                            help="stage files allowed for the tasks firing in a schedule slot")
+    arg_parser.add_argument('--min-file', type=int, default=MIN_FILE_MB, metavar='MB',
+                            help="stage files under this size are reported")
+    arg_parser.add_argument('--start', help="first day of the checked horizon, ISO date (default: today)")
+    arg_parser.add_argument('--days', type=int, default=schedule_planner.HORIZON_DAYS,
+                            help="days of fire times considered")
+    arg_parser.add_argument('--output', help="write the JSON report to this file")
+    args = arg_parser.parse_args()
+
+    files = args.files or properties_editor.list_properties_files(args.directory)
+    stats = strategy_advisor.load_stats(args.stats) if args.stats else None
+    horizon_start = datetime.fromisoformat(args.start) if args.start else \
+        datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    pipelines = load_pipelines(files, stats, args.auto_parallelism, args.row_bytes)
+    slot_load = slot_loads(pipelines, horizon_start, args.days)
+    result = report(pipelines, slot_load, args.max_task_memory * MB, args.max_slot_memory * MB,
+                    args.max_stage_files, args.min_file * MB, args.max_slot_stage_files)
+
+    errors = 0
+    for task in result['tasks']:
+        for message in task['warnings']:
+            logger.warning(f"{task['file']}: {task['task']}: {message}")
+        for message in task['errors']:
+            logger.error(f"{task['file']}: {task['task']}: {message}")
+        errors += len(task['errors'])
+    peak = result['peak_slot']
+    logger.info(f"Peak slot: {peak['memory_mb']:.0f}MB, {peak['rows_in_flight']} rows in flight, "
+                f"{peak['stage_files']} stage files")
+    overloaded = result['overloaded_slots']
+    for resource, unit in [('memory', "MB"), ('stage_files', " stage files")]:
+        slots = [x for x in overloaded if x['resource'] == resource]
+        if len(slots) > 0:
+            logger.error(f"Loaders go over {slots[0]['budget']:.0f}{unit} in {len(slots)} slots, first at "
+                         f"{slots[0]['slot']} with {slots[0]['load']:.0f}{unit}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    sys.exit(1 if errors > 0 or len(overloaded) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import importlib.util
+import pipeline_writer
+
+
+# Directory of the on-disk parse cache, disabled when not set
+CACHE_ENV_VAR = "VALIDATE_PROPERTIES_CACHE"
+
+# Modules whose source code determines the validation result of a properties file
+VALIDATOR_MODULES = ['validate_properties', 'validations', 'config_index', 'cron', 'diagnostics']
+
+_validator_version = None
+
+
+def source_digest(module_names):
+    '''
+    Hashes the source files of modules, found without importing them: a module run as
+    __main__ would otherwise be imported and set up a second time
+
+    :param module_names: list of module names
+    :return: hex sha256 digest
+    '''
+    digest = hashlib.sha256()
+    for name in module_names:
+        with open(importlib.util.find_spec(name).origin, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def validator_version():
+    '''
+    Returns a hash of the validator modules source, so cached results are invalidated
+    whenever the validation code changes
+
+    :return: hex sha256 digest
+    '''
+    global _validator_version
+    if _validator_version is None:
+        _validator_version = source_digest(VALIDATOR_MODULES)
+    return _validator_version
+
+
+class ParseCache:
+    '''
+    On-disk cache of parsed and validated properties files, keyed by the hash of the
+    file content and the validator version. Each entry is a JSON file with:
+        properties: dict as parsed from the file, before validation
+        diagnostics: validation result, as returned by diagnostics.Diagnostics.report
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def key(self, text):
+        '''
+        :param text: str with properties file content
+        :return: cache key for text with current validator version
+        '''
+        digest = hashlib.sha256(validator_version().encode('utf-8'))
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        '''
+        :return: cached entry dict, None if not cached or unreadable
+        '''
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, properties_json, report):
+        '''
+        Stores an entry, atomically so concurrent runs never read a partial entry
+
+        :param key: cache key
+        :param properties_json: str with JSON of the parsed properties, before validation
+        :param report: dict with the diagnostics report of the validation
+        '''
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = f'{{"properties": {properties_json}, "diagnostics": {json.dumps(report)}}}'
+        pipeline_writer.write_file_atomic(path, entry)
+
+
+def cache_from_environment():
+    '''
+    :return: ParseCache on CACHE_ENV_VAR directory, None if it is not set
+    '''
+    cache_dir = os.environ.get(CACHE_ENV_VAR)
+    return ParseCache(cache_dir) if cache_dir else None
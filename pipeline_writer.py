@@ -0,0 +1,464 @@
+import os
+import io
+import re
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import instrumentation
+
+
+logger = logging.getLogger()
+
+MANIFEST_FILE = ".manifest.json"
+# Hidden directories where tasks and pipelines are staged before being swapped into place
+STAGING_NAME = re.compile(r"^\..+\.(?:tmp|old)-(\d+)$")
+
+# Threads writing task directories, file writes release the GIL so they overlap on slow volumes
+WRITE_WORKERS = 8
+# Tasks serialized per batch, bounds the memory held by pending documents
+SERIALIZE_BATCH = 256
+
+_process_yaml = None
+
+# renameat2 flag swapping two paths, and the dirfd of paths relative to the working directory
+RENAME_EXCHANGE = 2
+_AT_FDCWD = -100
+_renameat2 = None
+
+
+def task_digest(environment, schedule):
+    '''
+    Returns a stable hash of the final environment/schedule documents of a task
+
+    :param environment: environment dict as written to environment.yml
+    :param schedule: schedule dict as written to schedule.yml
+    :return: hex sha256 digest
+    '''
+    content = json.dumps([environment, schedule], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def new_yaml(template=True):
+    '''
+    Returns the YAML emitter used to write task files, ruamel is only imported when writing
+
+    :param template: use yaml_emitter.TemplateEmitter, same output as ruamel but much faster
+    :return: object with a ruamel compatible dump(document, stream)
+    '''
+    if template:
+        import yaml_emitter
+
+        return yaml_emitter.TemplateEmitter()
+
+    from ruamel.yaml import YAML
+
+    return YAML()
+
+
+def dump_yaml(yaml, document):
+    '''
+    Serializes a document with the given YAML emitter, see new_yaml
+
+    :return: str with YAML document
+    '''
+    stream = io.StringIO()
+    yaml.dump(document, stream)
+    return stream.getvalue()
+
+
+def task_files(yaml, task_id, environment, schedule):
+    '''
+    :return: dict with file name -> content of a task directory
+    '''
+    return {
+        "environment.yml": dump_yaml(yaml, environment),
+        "schedule.yml": dump_yaml(yaml, schedule),
+        "env": f"export MELTANO_ENVIRONMENT={task_id}"
+    }
+
+
+def serialize_task(yaml, task):
+    '''
+    Serializes every file of a task directory
+
+    :param yaml: YAML emitter, see new_yaml
+    :param task: task_model.TaskRecord
+    :return: tuple with (task id, dict with file name -> content)
+    '''
+    return task.id, task_files(yaml, task.id, *task.documents())
+
+
+def _serialize_task_in_process(task):
+    # Worker processes build their YAML instance once
+    global _process_yaml
+    if _process_yaml is None:
+        _process_yaml = new_yaml()
+    return serialize_task(_process_yaml, task)
+
+
+def write_directory(path, files):
+    '''
+    Creates a directory with the given files, all writes of a directory are done together
+
+    :param path: directory path
+    :param files: dict with file name -> content
+    '''
+    os.makedirs(path, exist_ok=True)
+    for name, content in files.items():
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(content)
+
+
+def write_file_atomic(path, content):
+    '''
+    Writes content to a temporary file next to path and renames it over path,
+    so readers never see a half written file
+
+    :param path: destination file path
+    :param content: str to write
+    '''
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _exchange(path, other_path):
+    '''
+    Exchanges two paths in a single step with renameat2(RENAME_EXCHANGE)
+
+    :return: True if exchanged, False if the platform or the filesystem does not support it
+    '''
+    global _renameat2
+    if _renameat2 is None:
+        try:
+            import ctypes
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            _renameat2 = libc.renameat2
+            _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        except (OSError, AttributeError, TypeError):
+            _renameat2 = False
+    if _renameat2 is False:
+        return False
+
+    import ctypes
+
+    if _renameat2(_AT_FDCWD, os.fsencode(path), _AT_FDCWD, os.fsencode(other_path), RENAME_EXCHANGE) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+        return False
+    raise OSError(error, os.strerror(error), path)
+
+
+def replace_directory(staging_path, path, old_path):
+    '''
+    Moves staging_path to path, replacing the directory there if any.
+    Where renameat2(RENAME_EXCHANGE) is supported (Linux) both are swapped in a single step, so readers
+    see either directory and never none. Elsewhere the previous directory is renamed to old_path first
+    and moved back if the second rename fails, so it is only missing between both renames
+
+    :param staging_path: new directory
+    :param path: destination directory
+    :param old_path: where the previous directory is moved aside when it can't be swapped in one step
+    '''
+    if not os.path.exists(path):
+        os.rename(staging_path, path)
+        return
+    if _exchange(staging_path, path):
+        # staging_path holds the previous directory now
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return
+
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    os.rename(path, old_path)
+    try:
+        os.rename(staging_path, path)
+    except BaseException:
+        os.rename(old_path, path)
+        raise
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_file(path):
+    '''
+    Returns the content of a file, None if it does not exist
+    '''
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return f.read()
+
+
+def _process_alive(pid):
+    '''
+    Returns whether a process with the given pid is running
+    '''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # Running under another user, or no way to tell: keep its directories
+        return True
+    return True
+
+
+def sweep_staging(directory):
+    '''
+    Removes the staging directories (.<name>.tmp-<pid>, .<name>.old-<pid>) left in a directory by
+    runs that crashed before committing. Directories of this process and of other running ones are kept
+
+    :param directory: directory holding staging directories
+    :return: list of removed directory names
+    '''
+    removed = []
+    if not os.path.isdir(directory):
+        return removed
+    for entry in os.scandir(directory):
+        match = STAGING_NAME.match(entry.name)
+        if not match or not entry.is_dir(follow_symlinks=False):
+            continue
+        pid = int(match.group(1))
+        if pid == os.getpid() or _process_alive(pid):
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        logger.info(f"Stale staging directory {entry.path} removed")
+        removed.append(entry.name)
+    return removed
+
+
+def load_manifest(pipeline_path):
+    '''
+    Reads the task manifest of a pipeline directory
+
+    :param pipeline_path: pipeline directory
+    :return: dict with task id -> task digest, empty if there is no valid manifest
+    '''
+    try:
+        with open(os.path.join(pipeline_path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        return manifest.get('tasks', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+class IncrementalPipelineWriter:
+    '''
+    Writes a pipeline directory touching only the tasks whose content changed
+
+    Changed tasks are staged in hidden directories and swapped into place on commit, one by one
+    (see replace_directory), tasks no longer generated are deleted, and the manifest with every
+    task digest is written last. A failure never leaves a task directory half written nor missing:
+    tasks swapped before it keep their new files and, with the manifest not updated, are
+    rewritten by the next run. Staging directories left by crashed runs are removed on creation.
+
+    A renamed table is written under its new task id and the directory of the old id deleted:
+    the id is part of every task file (environment and schedule names), so nothing can be reused
+    '''
+
+    def __init__(self, pipeline_path, yaml, stats=instrumentation.NULL_STATS):
+        self.pipeline_path = pipeline_path
+        self.yaml = yaml
+        self.stats = stats
+        self.manifest = load_manifest(pipeline_path)
+        sweep_staging(pipeline_path)
+        self.new_manifest = {}
+        self.staged = {}
+        self.unchanged = 0
+
+    def add_task(self, task):
+        '''
+        Stages a task if its digest differs from the one stored in the manifest
+
+        :param task: task_model.TaskRecord, its id is used as directory name
+        '''
+        environment, schedule = task.documents()
+        digest = task_digest(environment, schedule)
+        self.new_manifest[task.id] = digest
+        task_path = os.path.join(self.pipeline_path, task.id)
+        if self.manifest.get(task.id) == digest and os.path.isdir(task_path):
+            self.unchanged += 1
+            return
+
+        with self.stats.stage('yaml_dump'):
+            files = task_files(self.yaml, task.id, environment, schedule)
+
+        with self.stats.stage('write'):
+            staging_path = os.path.join(self.pipeline_path, f".{task.id}.tmp-{os.getpid()}")
+            if os.path.exists(staging_path):
+                shutil.rmtree(staging_path)
+            self.staged[task.id] = staging_path
+            write_directory(staging_path, files)
+        self.stats.count('files_written', len(files))
+
+    def commit(self, files):
+        '''
+        Swaps staged tasks into place, deletes removed tasks and writes the manifest.
+        If a swap fails, that task keeps its previous directory and the remaining ones are left staged for abort
+
+        :param files: dict with pipeline level file name -> content (schedule, tags...)
+        :return: tuple with number of (written, unchanged, deleted) tasks
+        '''
+        for name in files:
+            path = os.path.join(self.pipeline_path, name)
+            if read_file(path) != files[name]:
+                write_file_atomic(path, files[name])
+                self.stats.count('files_written')
+
+        for task_id in list(self.staged):
+            replace_directory(self.staged[task_id], os.path.join(self.pipeline_path, task_id),
+                              os.path.join(self.pipeline_path, f".{task_id}.old-{os.getpid()}"))
+            del self.staged[task_id]
+            logger.info(f"Task {task_id} created OK")
+
+        deleted = 0
+        for entry in os.scandir(self.pipeline_path):
+            if entry.is_dir() and not entry.name.startswith('.') and entry.name not in self.new_manifest:
+                shutil.rmtree(entry.path)
+                logger.info(f"Task {entry.name} deleted OK")
+                deleted += 1
+
+        write_file_atomic(os.path.join(self.pipeline_path, MANIFEST_FILE),
+                          json.dumps({'tasks': self.new_manifest}, indent=1, sort_keys=True))
+        written = len(self.new_manifest) - self.unchanged
+        return written, self.unchanged, deleted
+
+    def abort(self):
+        '''
+        Removes every staged task, leaving the pipeline directory as it was
+        '''
+        for task_id in list(self.staged):
+            shutil.rmtree(self.staged.pop(task_id), ignore_errors=True)
+
+
+class PipelineDirectoryWriter:
+    '''
+    Writes a whole pipeline directory into a hidden staging directory and swaps it into place
+    on commit, see replace_directory: readers never see a half written pipeline, and if the
+    swap fails the previous pipeline directory is kept
+
+    Tasks are serialized in batches, on worker processes if yaml_workers > 1, and each task
+    directory is written by a thread pool as soon as its batch is serialized
+    '''
+
+    def __init__(self, pipeline_path, yaml, workers=WRITE_WORKERS, yaml_workers=1, stats=instrumentation.NULL_STATS):
+        self.pipeline_path = pipeline_path.rstrip(os.sep)
+        self.yaml = yaml
+        self.workers = max(1, workers)
+        self.yaml_workers = max(1, yaml_workers)
+        self.stats = stats
+        parent, name = os.path.split(self.pipeline_path)
+        self.staging_path = os.path.join(parent, f".{name}.tmp-{os.getpid()}")
+        self.old_path = os.path.join(parent, f".{name}.old-{os.getpid()}")
+        self._writes = []
+        self._write_executor = None
+        self._yaml_executor = None
+
+    def __enter__(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        sweep_staging(os.path.dirname(self.staging_path))
+        if os.path.exists(self.staging_path):
+            shutil.rmtree(self.staging_path)
+        os.makedirs(self.staging_path)
+        self._write_executor = ThreadPoolExecutor(max_workers=self.workers)
+        if self.yaml_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._yaml_executor = ProcessPoolExecutor(max_workers=self.yaml_workers)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self._shutdown()
+
+    def _shutdown(self):
+        if self._write_executor is not None:
+            self._write_executor.shutdown(wait=True)
+            self._write_executor = None
+        if self._yaml_executor is not None:
+            self._yaml_executor.shutdown(wait=True)
+            self._yaml_executor = None
+
+    def _submit(self, task_id, path, files):
+        self._writes.append((task_id, self._write_executor.submit(write_directory, path, files)))
+        self.stats.count('files_written', len(files))
+
+    def _wait_writes(self):
+        # Raises the first write error
+        for task_id, future in self._writes:
+            future.result()
+            if task_id is not None:
+                logger.info(f"Task {task_id} created OK")
+        self._writes = []
+
+    def add_files(self, files):
+        '''
+        Writes pipeline level files (schedule, tags...)
+
+        :param files: dict with file name -> content
+        '''
+        self._submit(None, self.staging_path, files)
+
+    def add_tasks(self, tasks):
+        '''
+        Serializes and writes tasks
+
+        :param tasks: iterable of task_model.TaskRecord, see iter_tasks
+        :return: number of tasks
+        '''
+        count = 0
+        batch = []
+        for task in tasks:
+            batch.append(task)
+            if len(batch) == SERIALIZE_BATCH:
+                count += self._add_batch(batch)
+                batch = []
+        if len(batch) > 0:
+            count += self._add_batch(batch)
+        return count
+
+    def _add_batch(self, batch):
+        with self.stats.stage('yaml_dump'):
+            if self._yaml_executor is not None:
+                chunksize = max(1, len(batch) // (self.yaml_workers * 4))
+                serialized = list(self._yaml_executor.map(_serialize_task_in_process, batch, chunksize=chunksize))
+            else:
+                serialized = [serialize_task(self.yaml, task) for task in batch]
+        # Let previous batch finish writing before queuing this one, so pending documents stay bounded
+        with self.stats.stage('write'):
+            self._wait_writes()
+        for task_id, files in serialized:
+            self._submit(task_id, os.path.join(self.staging_path, task_id), files)
+        return len(batch)
+
+    def commit(self):
+        '''
+        Waits for every write and swaps the staging directory into place, see replace_directory
+        '''
+        with self.stats.stage('write'):
+            self._wait_writes()
+            self._shutdown()
+            replace_directory(self.staging_path, self.pipeline_path, self.old_path)
+
+    def abort(self):
+        '''
+        Removes the staging directory, leaving the previous pipeline directory as it was
+        '''
+        for task_id, future in self._writes:
+            future.cancel()
+        self._writes = []
+        self._shutdown()
+        shutil.rmtree(self.staging_path, ignore_errors=True)
@@ -1,5 +1,7 @@
 import sys
 import re
+import batch_validate
+import task_index
 
 print("---------------------------------------")
 print("--- POST SYNC FWK-TAPSFLOW PROJECT ----")
@@ -8,35 +10,26 @@ print("---------------------------------------")
 #Variables de configuracion
 allowed_diff="^[am|AM]"
 allowed_folder_files="^properties/"
-script_name = "validate_properties.py"
 
 #Input Data
 files_in=sys.argv
 print("::Files_in - ")
 print(files_in)
 
-#Select files witch have 
-files_out=[]
-count=0
-for item in files_in:
-    if count > 0 and count%2!=0 and re.search(allowed_diff,item) and re.search(allowed_folder_files,files_in[count+1]):
-        files_out.append(files_in[count+1])
-    count+=1
+#Select added or modified properties files, renames and copies come as status, old path and new path
+changes=[x for x in task_index.parse_name_status(files_in[1:]) if re.search(allowed_folder_files,x[1])]
+files_out=[x[1] for x in changes if re.search(allowed_diff,x[0])]
 print("::Files_out - " )    
 print(files_out)
 
 
-argv = []
-for file in files_out:
-    argv.append(script_name)
-    argv.append(file.strip())
+#Validate all selected files in a single process, spreading them across cores
+exit_code = batch_validate.run(files_out, workers=None)
 
-    script_descriptor = open(script_name)
-    script_py = script_descriptor.read()
-    sys.argv = argv
-    exec(script_py)
-    
-    script_descriptor.close()
-    argv.clear()
+#Update task index with every change, deletions included, and report tasks defined twice
+#or loading the same Snowflake table, conflicts are reported but do not fail the sync
+task_index.check_changes(changes)
+
+sys.exit(exit_code)
 
 #----- END -------
\ No newline at end of file
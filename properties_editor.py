@@ -0,0 +1,100 @@
+import os
+import validate_properties
+import pipeline_writer
+
+
+def find_properties(text):
+    '''
+    Finds every property line of a properties file content
+
+    :param text: str with properties file content
+    :return: list of (key, value, value_start, value_end) tuples, in file order,
+             where value_start:value_end is the span of the stripped value in text
+    '''
+    result = []
+    for match in validate_properties.PROPERTY_LINE.finditer(text):
+        raw_value = match.group(2)
+        value = raw_value.strip()
+        value_start = match.start(2) + (len(raw_value) - len(raw_value.lstrip()))
+        result.append((match.group(1).strip(), value, value_start, value_start + len(value)))
+    return result
+
+
+def set_properties(text, updates):
+    '''
+    Sets property values in a properties file content keeping its layout:
+    comments, sections, spacing and line order are left as they are.
+    The last line of a key is the effective one, so that is the one rewritten.
+    Keys not found are inserted after the last line sharing their longest key prefix,
+    or appended at the end of the file. Keys set to None are commented out, every line of them
+
+    :param text: str with properties file content
+    :param updates: dict with full key ('ptr.schema.table.partitions') -> new value str, or None
+    :return: str with updated content
+    '''
+    properties = find_properties(text)
+    last_line = {}
+    for i, (key, value, value_start, value_end) in enumerate(properties):
+        last_line[key] = i
+
+    # (position, replaced length, new text), applied from the end of text
+    edits = []
+    # Added last so that, at the start of a line, keys inserted there stay above the commented line
+    comment_edits = []
+    for key, new_value in updates.items():
+        if new_value is None:
+            comment_edits.extend((text.rfind('\n', 0, value_start) + 1, 0, "# ")
+                                 for existing_key, value, value_start, value_end in properties if existing_key == key)
+            continue
+        new_value = str(new_value)
+        if key in last_line:
+            key, value, value_start, value_end = properties[last_line[key]]
+            if value != new_value:
+                edits.append((value_start, value_end - value_start, new_value))
+            continue
+
+        position = None
+        prefix = key
+        while position is None and '.' in prefix:
+            prefix = prefix.rsplit('.', 1)[0]
+            for existing_key, value, value_start, value_end in properties:
+                if existing_key.startswith(prefix + '.'):
+                    position = text.find('\n', value_end)
+        if position is None or position == -1:
+            if text != "" and not text.endswith('\n') and not any(x[0] == len(text) for x in edits):
+                edits.append((len(text), 0, '\n'))
+            edits.append((len(text), 0, f"{key} = {new_value}\n"))
+        else:
+            edits.append((position + 1, 0, f"{key} = {new_value}\n"))
+
+    edits.extend(comment_edits)
+    # Applied from the end, edits at the same position are applied last first to keep their order
+    indexed_edits = sorted(enumerate(edits), key=lambda x: (x[1][0], x[0]), reverse=True)
+    for index, (position, length, new_text) in indexed_edits:
+        text = text[:position] + new_text + text[position + length:]
+    return text
+
+
+def update_file(file_path, updates):
+    '''
+    Sets property values in a properties file, see set_properties. The file is rewritten
+    atomically and only if some value changed
+
+    :param file_path: properties file path
+    :param updates: dict with full key -> new value str, or None to comment it out
+    :return: True if file was rewritten
+    '''
+    with open(file_path) as f:
+        text = f.read()
+    new_text = set_properties(text, updates)
+    if new_text == text:
+        return False
+    pipeline_writer.write_file_atomic(file_path, new_text)
+    return True
+
+
+def list_properties_files(directory="properties"):
+    '''
+    :return: sorted list of *.properties file paths in directory
+    '''
+    return sorted(os.path.join(directory, x) for x in os.listdir(directory) if x.endswith('.properties'))
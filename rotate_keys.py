@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import logging
+import argparse
+import properties_editor
+import pipeline_writer
+
+
+logger = logging.getLogger()
+
+"""
+Rotates the decrypt_key of the ENC() values of properties files, as decrypted by validations.decrypt_password:
+a '<section>.<field> = ENC(...)' value is decrypted with its sibling '<section>.decrypt_key'.
+Every value is decrypted with its current key, re-encrypted with the new one and verified before
+files are rewritten in place, keeping their layout, together with their decrypt_key lines
+"""
+
+DECRYPT_KEY = "decrypt_key"
+ENCRYPTED_VALUE = re.compile(r'ENC\((.*?)\)')
+# Read when --new-key and --old-key are not given, keeping keys out of the shell history
+NEW_KEY_ENV_VAR = "ROTATE_KEYS_NEW_KEY"
+OLD_KEY_ENV_VAR = "ROTATE_KEYS_OLD_KEY"
+
+
+class EncryptedField:
+    '''
+    ENC() value of a properties file
+
+    :param file_path: properties file path
+    :param key: full property key ('ptr.password')
+    :param ciphertext: base64 text within ENC()
+    :param decrypt_key_name: full key of its decrypt_key property
+    :param old_key: current decrypt key, None if unknown
+    '''
+
+    def __init__(self, file_path, key, ciphertext, decrypt_key_name, old_key):
+        self.file_path = file_path
+        self.key = key
+        self.ciphertext = ciphertext
+        self.decrypt_key_name = decrypt_key_name
+        self.old_key = old_key
+        self.plaintext = None
+        self.new_ciphertext = None
+
+
+def _decrypt_key_name(key):
+    return f"{key.rsplit('.', 1)[0]}.{DECRYPT_KEY}" if '.' in key else DECRYPT_KEY
+
+
+def find_encrypted_fields(file_path, text, old_key=None):
+    '''
+    Finds the ENC() values of a properties file content, the last line of a key being the effective one
+
+    :param old_key: decrypt key of the values without a decrypt_key property
+    :return: tuple with (list of EncryptedField, dict with full key -> value of every property)
+    '''
+    values = {key: value for key, value, value_start, value_end in properties_editor.find_properties(text)}
+    fields = []
+    for key, value in values.items():
+        if not value.startswith('ENC('):
+            continue
+        match = ENCRYPTED_VALUE.search(value)
+        decrypt_key_name = _decrypt_key_name(key)
+        fields.append(EncryptedField(file_path, key, match.group(1) if match else None, decrypt_key_name,
+                                     values.get(decrypt_key_name, old_key)))
+    return fields, values
+
+
+def _decrypt_group(fields, password, workers):
+    # Batch decryption on the pool, and one by one to single out the values that fail
+    import jasypt
+
+    try:
+        texts = jasypt.decrypt_many([x.ciphertext for x in fields], password.encode('utf-8'), workers=workers)
+    except Exception:
+        texts = []
+        for field in fields:
+            try:
+                texts.append(jasypt.decrypt(field.ciphertext, password.encode('utf-8')))
+            except Exception:
+                texts.append(None)
+    for field, text in zip(fields, texts):
+        field.plaintext = text
+
+
+def rotate_fields(fields, new_key, workers=1):
+    '''
+    Decrypts fields with their old key and encrypts them with new_key, setting their
+    plaintext and new_ciphertext, then decrypts the new values to verify them
+
+    :param fields: list of EncryptedField, already under new_key ones must be left out
+    :param new_key: new decrypt key
+    :param workers: worker processes deriving keys, None to use all cores, 1 to run in-process
+    :return: dict with EncryptedField -> error message of the fields that can't be rotated
+    '''
+    import jasypt
+
+    errors = {}
+    groups = {}
+    for field in fields:
+        if field.ciphertext is None:
+            errors[field] = "Malformed ENC() value"
+        elif field.old_key is None:
+            errors[field] = f"Encrypted value without a '{field.decrypt_key_name}' to decipher it"
+        else:
+            groups.setdefault(field.old_key, []).append(field)
+
+    for old_key, group in groups.items():
+        _decrypt_group(group, old_key, workers)
+    rotated = []
+    for field in fields:
+        if field in errors:
+            continue
+        if field.plaintext is None:
+            errors[field] = f"Could not decrypt with '{field.decrypt_key_name}'"
+        else:
+            rotated.append(field)
+
+    new_ciphertexts = jasypt.encrypt_many([x.plaintext for x in rotated], new_key.encode('utf-8'), workers=workers)
+    for field, ciphertext in zip(rotated, new_ciphertexts):
+        field.new_ciphertext = ciphertext.decode('utf-8')
+
+    # Verification pass, keys derived again from the new salts
+    if len(rotated) > 0:
+        verified = jasypt.decrypt_many([x.new_ciphertext for x in rotated], new_key.encode('utf-8'), workers=workers)
+        for field, text in zip(rotated, verified):
+            if text != field.plaintext:
+                errors[field] = "Re-encrypted value does not decrypt to the original one"
+    return errors
+
+
+def file_updates(fields, values, new_key):
+    '''
+    :param fields: rotated EncryptedField of a file
+    :param values: dict with full key -> value of every property of the file
+    :return: dict with full key -> new value, see properties_editor.set_properties
+    '''
+    updates = {}
+    for field in fields:
+        updates[field.key] = ENCRYPTED_VALUE.sub(lambda match: f"ENC({field.new_ciphertext})", values[field.key], 1)
+        if field.decrypt_key_name in values:
+            updates[field.decrypt_key_name] = new_key
+    return updates
+
+
+def verify_text(text, new_text, updates):
+    '''
+    :return: True if new_text has the values of updates and every other property of text unchanged
+    '''
+    expected = {key: value for key, value, value_start, value_end in properties_editor.find_properties(text)}
+    expected.update(updates)
+    found = {key: value for key, value, value_start, value_end in properties_editor.find_properties(new_text)}
+    return found == expected
+
+
+def rotate_files(file_paths, new_key, old_key=None, workers=1, dry_run=False):
+    '''
+    Rotates the decrypt key of the ENC() values of properties files. A file is rewritten only if all
+    of its values are rotated and verified, values already under new_key are left as they are
+
+    :param file_paths: list of properties file paths
+    :param new_key: new decrypt key
+    :param old_key: decrypt key of the values without a decrypt_key property
+    :param workers: worker processes deriving keys, None to use all cores, 1 to run in-process
+    :param dry_run: do everything but rewriting files
+    :return: tuple with (list of rotated file paths, dict with file path -> list of error messages)
+    '''
+    texts, values, fields = {}, {}, []
+    for file_path in file_paths:
+        with open(file_path) as f:
+            texts[file_path] = f.read()
+        file_fields, values[file_path] = find_encrypted_fields(file_path, texts[file_path], old_key)
+        fields += [x for x in file_fields if x.old_key != new_key]
+
+    errors = {}
+    for field, message in rotate_fields(fields, new_key, workers).items():
+        errors.setdefault(field.file_path, []).append(f"{field.key}: {message}")
+
+    rotated = []
+    for file_path in file_paths:
+        file_fields = [x for x in fields if x.file_path == file_path]
+        if len(file_fields) == 0 or file_path in errors:
+            continue
+        updates = file_updates(file_fields, values[file_path], new_key)
+        new_text = properties_editor.set_properties(texts[file_path], updates)
+        if not verify_text(texts[file_path], new_text, updates):
+            errors[file_path] = ["Rewritten file does not match the rotated values"]
+            continue
+        if not dry_run:
+            pipeline_writer.write_file_atomic(file_path, new_text)
+        logger.info(f"{'Would rotate' if dry_run else 'Rotated'} {len(file_fields)} values of {file_path}")
+        rotated.append(file_path)
+    return rotated, errors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Re-encrypt the ENC() values of properties files with a new key")
+    arg_parser.add_argument('files', nargs='*', help="properties files, every file in --directory by default")
+    arg_parser.add_argument('--directory', default="properties", help="properties directory (default: properties)")
+    arg_parser.add_argument('--new-key', default=os.environ.get(NEW_KEY_ENV_VAR),
+                            help=f"new decrypt key (default: ${NEW_KEY_ENV_VAR})")
+    arg_parser.add_argument('--old-key', default=os.environ.get(OLD_KEY_ENV_VAR),
+                            help=f"decrypt key of values without a decrypt_key property (default: ${OLD_KEY_ENV_VAR})")
+    arg_parser.add_argument('-j', '--workers', type=int, default=1,
+                            help="worker processes, 0 to use all cores (default: 1, in-process)")
+    arg_parser.add_argument('--dry-run', action='store_true', help="decrypt, re-encrypt and verify without writing")
+    args = arg_parser.parse_args()
+
+    if not args.new_key:
+        arg_parser.error(f"--new-key or ${NEW_KEY_ENV_VAR} is required")
+    files = args.files or properties_editor.list_properties_files(args.directory)
+    rotated, errors = rotate_files(files, args.new_key, args.old_key, args.workers or None, args.dry_run)
+
+    for file_path, messages in errors.items():
+        for message in messages:
+            logger.error(f"{file_path}: {message}")
+    logger.info(f"{'Would rotate' if args.dry_run else 'Rotated'} {len(rotated)} files, {len(errors)} files KO")
+    sys.exit(1 if len(errors) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
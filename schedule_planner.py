@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import logging
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+import cron
+import validate_properties
+import properties_editor
+
+
+logger = logging.getLogger()
+
+# Histogram slot in minutes, start dates are rounded to it too (see round_to_minute)
+SLOT_MINUTES = 5
+HORIZON_DAYS = 7
+MAX_OFFSET_MINUTES = 60
+DEFAULT_CONCURRENCY_CAP = 10
+
+
+def task_concurrency(table_config):
+    '''
+    Returns the number of concurrent queries an extraction task runs on its origin:
+        default strategy runs a single query
+        partition strategy runs min(query_threads, partitions) queries
+        offset strategies run query_threads queries
+
+    :param table_config: validated table config (ORACLE_CONFIG_KEYS)
+    :return: int
+    '''
+    strategy = table_config.get('strategy', "default")
+    query_threads = table_config.get('query_threads', 1)
+    if strategy == "default":
+        return 1
+    if strategy == "partition":
+        return max(1, min(query_threads, table_config.get('partitions') or 1))
+    return max(1, query_threads)
+
+
+class PipelineLoad:
+    '''
+    Schedule and concurrent queries per origin of the tasks of a properties file,
+    every task of a pipeline fires at the same time
+    '''
+
+    def __init__(self, file_path, interval, start_date, weights):
+        self.file_path = file_path
+        self.interval = interval
+        self.start_date = start_date
+        self.weights = weights
+        self.offset = 0
+        self.new_interval = None
+
+    @property
+    def total_weight(self):
+        return sum(self.weights.values())
+
+
+def load_pipelines(file_paths):
+    '''
+    Parses and validates properties files into PipelineLoad objects, skipping KO files
+
+    :param file_paths: list of properties file paths
+    :return: list of PipelineLoad
+    '''
+    pipelines = []
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path).split('.')[0]
+        properties = validate_properties.properties_file_to_dict(file_path)
+        errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(properties, file_name)
+        if len(errors) > 0:
+            logger.warning(f"Properties file {file_path} is KO, it is not planned")
+            continue
+
+        weights = defaultdict(int)
+        for origin, schema, table, table_config, table_snowflake in tables:
+            weights[origin.lower()] += task_concurrency(table_config)
+        # Wall-clock time in Europe/Madrid, where schedules are defined
+        start_date = base_schedule['start_date'].replace(tzinfo=None)
+        pipelines.append(PipelineLoad(file_path, base_schedule['interval'], start_date, dict(weights)))
+    return pipelines
+
+
+def _slot(fire_time):
+    return fire_time.replace(minute=fire_time.minute - fire_time.minute % SLOT_MINUTES, second=0, microsecond=0)
+
+
+def fire_slots(interval, start_date, horizon_start, horizon_end):
+    '''
+    Returns the histogram slots where a schedule fires within the horizon
+
+    :param interval: schedule interval (preset, cron code, @every)
+    :param start_date: datetime, no fire time before it
+    :param horizon_start: datetime
+    :param horizon_end: datetime
+    :return: list of slot datetimes
+    '''
+    schedule = cron.parse(interval)
+    start = max(horizon_start, start_date) - timedelta(microseconds=1)
+    slots = []
+    while True:
+        if isinstance(schedule, cron.EverySchedule):
+            fire_times = schedule.next_fire_times(start, 100, anchor=start_date)
+        else:
+            fire_times = schedule.next_fire_times(start, 100)
+        for fire_time in fire_times:
+            if fire_time >= horizon_end:
+                return slots
+            slots.append(_slot(fire_time))
+        if len(fire_times) < 100:
+            return slots
+        start = fire_times[-1]
+
+
+def shift_interval(interval, offset):
+    '''
+    Returns interval fired offset minutes later, for presets and cron codes with a single
+    minute and hour (or every hour), without moving it to another day
+
+    :param interval: schedule interval
+    :param offset: minutes
+    :return: new cron code, None if interval can't be shifted
+    '''
+    code = cron.PRESETS.get(interval, interval)
+    fields = code.split()
+    if len(fields) != len(cron.FIELDS) or not fields[0].isdigit():
+        return None
+    minute = int(fields[0]) + offset
+    if fields[1] == '*':
+        if minute >= 60:
+            return None
+        fields[0] = str(minute)
+    elif fields[1].isdigit():
+        hour = int(fields[1]) + minute // 60
+        if hour >= 24:
+            return None
+        fields[0], fields[1] = str(minute % 60), str(hour)
+    else:
+        return None
+    return " ".join(fields)
+
+
+class Histogram:
+    '''
+    Concurrent queries per origin and slot
+    '''
+
+    def __init__(self):
+        self.load = defaultdict(lambda: defaultdict(int))
+
+    def add(self, pipeline, slots, sign=1):
+        for slot in slots:
+            for origin, weight in pipeline.weights.items():
+                self.load[origin][slot] += sign * weight
+
+    def peak(self, origin):
+        return max(self.load[origin].values(), default=0)
+
+    def cost_with(self, pipeline, slots, caps, default_cap):
+        '''
+        :return: tuple with (queries over the caps, highest load) of pipeline origins if pipeline fired at slots
+        '''
+        excess = 0
+        peak = 0
+        for origin, weight in pipeline.weights.items():
+            origin_load = self.load[origin]
+            origin_peak = max((origin_load[slot] + weight for slot in slots), default=0)
+            excess += max(0, origin_peak - caps.get(origin, default_cap))
+            peak = max(peak, origin_peak)
+        return excess, peak
+
+    def overloaded(self, caps, default_cap):
+        '''
+        :return: list of (origin, slot, load, cap) where load goes over the origin cap
+        '''
+        result = []
+        for origin in sorted(self.load):
+            cap = caps.get(origin, default_cap)
+            for slot in sorted(self.load[origin]):
+                if self.load[origin][slot] > cap:
+                    result.append((origin, slot, self.load[origin][slot], cap))
+        return result
+
+
+def plan(pipelines, horizon_start, horizon_days=HORIZON_DAYS, max_offset=MAX_OFFSET_MINUTES, caps=None,
+         default_cap=DEFAULT_CONCURRENCY_CAP):
+    '''
+    Greedily staggers pipelines, heaviest first, choosing for each the smallest offset in
+    [0, max_offset] (SLOT_MINUTES steps) that minimizes the load of its origins over their caps,
+    and then their peak load. Pipelines whose interval can't be shifted are kept where they are
+
+    :param pipelines: list of PipelineLoad, offset and new_interval are set
+    :param horizon_start: datetime of the first slot considered
+    :param horizon_days: days of fire times considered
+    :param max_offset: maximum minutes a pipeline is delayed
+    :param caps: dict with origin -> concurrent queries allowed
+    :param default_cap: concurrent queries allowed for origins not in caps
+    :return: tuple with (current, planned) Histogram
+    '''
+    caps = caps or {}
+    horizon_end = horizon_start + timedelta(days=horizon_days)
+    current = Histogram()
+    planned = Histogram()
+    for pipeline in pipelines:
+        current.add(pipeline, fire_slots(pipeline.interval, pipeline.start_date, horizon_start, horizon_end))
+
+    fixed = [x for x in pipelines if shift_interval(x.interval, 0) is None]
+    movable = sorted((x for x in pipelines if shift_interval(x.interval, 0) is not None),
+                     key=lambda x: x.total_weight, reverse=True)
+    for pipeline in fixed:
+        planned.add(pipeline, fire_slots(pipeline.interval, pipeline.start_date, horizon_start, horizon_end))
+
+    for pipeline in movable:
+        best = None
+        for offset in range(0, max_offset + 1, SLOT_MINUTES):
+            interval = shift_interval(pipeline.interval, offset)
+            if interval is None:
+                break
+            slots = fire_slots(interval, pipeline.start_date, horizon_start, horizon_end)
+            cost = planned.cost_with(pipeline, slots, caps, default_cap)
+            if best is None or cost < best[0]:
+                best = (cost, offset, interval, slots)
+        cost, pipeline.offset, interval, slots = best
+        if pipeline.offset > 0:
+            pipeline.new_interval = interval
+        planned.add(pipeline, slots)
+
+    return current, planned
+
+
+def report(pipelines, current, planned, caps, default_cap):
+    '''
+    :return: JSON serializable dict with peak loads per origin and the proposed intervals
+    '''
+    origins = sorted(set(current.load) | set(planned.load))
+    return {
+        'peak_concurrency': {
+            origin: {'current': current.peak(origin), 'planned': planned.peak(origin),
+                     'cap': caps.get(origin, default_cap)} for origin in origins
+        },
+        'overloaded_slots': [
+            {'origin': origin, 'slot': slot.isoformat(), 'load': load, 'cap': cap}
+            for origin, slot, load, cap in planned.overloaded(caps, default_cap)
+        ],
+        'proposals': [
+            {'file': x.file_path, 'interval': x.interval, 'new_interval': x.new_interval, 'offset_minutes': x.offset,
+             'concurrency': x.weights} for x in pipelines if x.new_interval is not None
+        ]
+    }
+
+
+def parse_caps(values):
+    caps = {}
+    for value in values:
+        origin, cap = value.split('=', 1)
+        caps[origin.strip().lower()] = int(cap)
+    return caps
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Plan staggered schedules to spread extraction load per origin")
+    arg_parser.add_argument('files', nargs='*', help="properties files, every file in --directory by default")
+    arg_parser.add_argument('--directory', default="properties", help="properties directory (default: properties)")
+    arg_parser.add_argument('--start', help="first day of the planned horizon, ISO date (default: today)")
+    arg_parser.add_argument('--days', type=int, default=HORIZON_DAYS, help="days of fire times considered")
+    arg_parser.add_argument('--max-offset', type=int, default=MAX_OFFSET_MINUTES,
+                            help="maximum minutes a schedule can be delayed")
+    arg_parser.add_argument('--max-concurrency', type=int, default=DEFAULT_CONCURRENCY_CAP,
+                            help="concurrent queries allowed per origin")
+    arg_parser.add_argument('--origin-cap', action='append', default=[], metavar='ORIGIN=N',
+                            help="concurrent queries allowed for an origin, overrides --max-concurrency")
+    arg_parser.add_argument('--apply', action='store_true', help="rewrite schedule.interval in properties files")
+    arg_parser.add_argument('--output', help="write the JSON report to this file")
+    args = arg_parser.parse_args()
+
+    files = args.files or properties_editor.list_properties_files(args.directory)
+    horizon_start = datetime.fromisoformat(args.start) if args.start else \
+        datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    caps = parse_caps(args.origin_cap)
+
+    pipelines = load_pipelines(files)
+    current, planned = plan(pipelines, horizon_start, args.days, args.max_offset, caps, args.max_concurrency)
+    result = report(pipelines, current, planned, caps, args.max_concurrency)
+
+    for origin, peak in result['peak_concurrency'].items():
+        logger.info(f"Origin {origin}: peak concurrency {peak['current']} -> {peak['planned']} (cap {peak['cap']})")
+    for proposal in result['proposals']:
+        logger.info(f"{proposal['file']}: '{proposal['interval']}' -> '{proposal['new_interval']}'")
+        if args.apply:
+            properties_editor.update_file(proposal['file'], {'schedule.interval': proposal['new_interval']})
+    for origin, peak in result['peak_concurrency'].items():
+        overloaded = [x['slot'] for x in result['overloaded_slots'] if x['origin'] == origin]
+        if len(overloaded) > 0:
+            logger.warning(f"Origin {origin} goes over its cap of {peak['cap']} concurrent queries in "
+                           f"{len(overloaded)} slots, first at {overloaded[0]}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    sys.exit(1 if len(result['overloaded_slots']) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import signal
+import socket
+import logging
+import argparse
+import http.client
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+import api
+import properties_editor
+
+
+logger = logging.getLogger()
+
+"""
+Local validation service keeping imports, compiled validators and results warm between requests:
+    POST /validate?name=<pipeline>[&files=1][&max_errors=N] with the properties text as body
+    GET /validate?path=<properties file>[&files=1][&max_errors=N]
+    GET /health
+Responses are JSON, see api.ValidationResult.to_dict.
+GET only reads .properties files inside the properties directory of the service, symlinks resolved
+"""
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_DIRECTORY = "properties"
+# Seconds a client waits for the service
+CLIENT_TIMEOUT = 30
+
+
+def properties_path(directory, path):
+    '''
+    Resolves the path of a properties file requested with GET /validate
+
+    :param directory: properties directory served
+    :param path: requested path, relative paths are taken from the working directory
+    :raise PermissionError: if the file, symlinks resolved, is not a .properties file inside directory
+    :return: resolved file path
+    '''
+    directory = os.path.realpath(directory)
+    file_path = os.path.realpath(path)
+    if os.path.commonpath([directory, file_path]) != directory or not file_path.endswith('.properties'):
+        raise PermissionError(f"{path} is not a properties file of {directory}")
+    return file_path
+
+
+class ValidationHandler(BaseHTTPRequestHandler):
+    '''
+    Serves validations from the api.Validator of its server
+    '''
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _query(self):
+        url = urlsplit(self.path)
+        return url.path, {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def _respond(self, validate, query):
+        try:
+            max_errors = int(query['max_errors']) if query.get('max_errors') else None
+            result = validate(max_errors)
+        except ValueError as ex:
+            self._send_json(400, {'error': str(ex)})
+        except PermissionError as ex:
+            self._send_json(403, {'error': str(ex)})
+        except OSError as ex:
+            self._send_json(404, {'error': str(ex)})
+        except Exception as ex:
+            logger.exception(f"Unexpected error serving {self.path}")
+            self._send_json(500, {'error': str(ex)})
+        else:
+            self._send_json(200, result.to_dict(files=query.get('files') in ("1", "true")))
+
+    def do_GET(self):
+        path, query = self._query()
+        validator = self.server.validator
+        if path == "/health":
+            self._send_json(200, dict(validator.stats(), ok=True))
+        elif path == "/validate" and query.get('path'):
+            self._respond(lambda max_errors: validator.validate_path(
+                properties_path(self.server.properties_dir, query['path']), max_errors), query)
+        else:
+            self._send_json(404, {'error': f"Unknown resource {self.path}"})
+
+    def do_POST(self):
+        path, query = self._query()
+        if path != "/validate":
+            self._send_json(404, {'error': f"Unknown resource {self.path}"})
+            return
+        name = query.get('name', "properties")
+        # Invalid Content-Length or body encoding are answered with 400 as any other ValueError
+        self._respond(lambda max_errors: self.server.validator.validate_text(self._read_body(), name, max_errors),
+                      query)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length < 0:
+            raise ValueError(f"Invalid Content-Length {length}")
+        return self.rfile.read(length).decode('utf-8')
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class ValidationServer(HTTPServer):
+    '''
+    Single-threaded HTTP server, requests share the warm caches of validator
+
+    :param properties_dir: directory of the files GET /validate can read
+    '''
+
+    def __init__(self, address, validator, properties_dir=DEFAULT_DIRECTORY):
+        super().__init__(address, ValidationHandler)
+        self.validator = validator
+        self.properties_dir = properties_dir
+
+
+class UnixValidationServer(socketserver.UnixStreamServer):
+    '''
+    ValidationServer listening on a Unix socket, removed when the server is closed
+    '''
+
+    def __init__(self, socket_path, validator, properties_dir=DEFAULT_DIRECTORY):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, ValidationHandler)
+        self.validator = validator
+        self.properties_dir = properties_dir
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    '''
+    http.client connection to a Unix socket
+    '''
+
+    def __init__(self, socket_path, timeout=CLIENT_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=CLIENT_TIMEOUT):
+    '''
+    :return: http.client.HTTPConnection to the service, on socket_path if given
+    '''
+    if socket_path:
+        return UnixHTTPConnection(socket_path, timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def request_validation(connection, text, name, files=False, max_errors=None):
+    '''
+    Validates properties text with the service
+
+    :param connection: http.client.HTTPConnection, see connect
+    :param text: content of a properties file
+    :param name: pipeline name
+    :param files: include the rendered pipeline files
+    :param max_errors: stop after this number of errors
+    :raise OSError: if the service can't be reached
+    :return: dict, see api.ValidationResult.to_dict
+    '''
+    query = {'name': name}
+    if files:
+        query['files'] = "1"
+    if max_errors:
+        query['max_errors'] = str(max_errors)
+    connection.request("POST", f"/validate?{urlencode(query)}", body=text.encode('utf-8'),
+                       headers={'Content-Type': "text/plain; charset=utf-8"})
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    if response.status != 200:
+        raise OSError(f"Validation service answered {response.status}: {body.get('error')}")
+    return body
+
+
+def check_files(file_paths, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, max_errors=None):
+    '''
+    Validates properties files with the service, in-process if the service can't be reached
+
+    :return: number of KO files
+    '''
+    connection = connect(socket_path, host, port)
+    failed = 0
+    for file_path in file_paths:
+        name = os.path.basename(file_path).split('.')[0]
+        with open(file_path) as f:
+            text = f.read()
+        try:
+            result = request_validation(connection, text, name, max_errors=max_errors) if connection else None
+        except OSError as ex:
+            logger.warning(f"Validation service unavailable ({ex}), validating in-process")
+            connection = None
+            result = None
+        if result is None:
+            result = api.validate_text(text, name, max_errors).to_dict()
+
+        for path, messages in result['warnings'].items():
+            for message in messages:
+                logger.warning(f"{file_path}: {path}: {message}")
+        for path, messages in result['errors'].items():
+            for message in messages:
+                logger.error(f"{file_path}: {path}: {message}")
+        if not result['ok']:
+            failed += 1
+        logger.info(f"Properties file {file_path} is {'OK' if result['ok'] else 'KO'}")
+    if connection:
+        connection.close()
+    return failed
+
+
+def serve(socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, preload=None, cache_size=api.RESULT_CACHE_SIZE,
+          properties_dir=DEFAULT_DIRECTORY):
+    '''
+    Runs the validation service until interrupted
+
+    :param socket_path: listen on this Unix socket instead of host and port
+    :param preload: properties files validated at startup, warming imports and caches
+    :param properties_dir: directory of the files GET /validate can read
+    '''
+    validator = api.Validator(cache_size)
+    for file_path in preload or []:
+        validator.validate_path(file_path)
+
+    server = UnixValidationServer(socket_path, validator, properties_dir) if socket_path else \
+        ValidationServer((host, port), validator, properties_dir)
+    logger.info(f"Validation service listening on {socket_path or f'{host}:{port}'}")
+    # Closes the server, and removes its socket, when stopped by a service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Local validation service with warm caches")
+    arg_parser.add_argument('files', nargs='*', help="properties files checked with --check")
+    arg_parser.add_argument('--check', action='store_true',
+                            help="validate files with the running service instead of serving, exit 1 if any is KO")
+    arg_parser.add_argument('--socket', help="Unix socket path, instead of --host and --port")
+    arg_parser.add_argument('--host', default=DEFAULT_HOST, help=f"listening host (default: {DEFAULT_HOST})")
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"listening port (default: {DEFAULT_PORT})")
+    arg_parser.add_argument('--max-errors', type=int, metavar='N', help="stop validating a file after N errors")
+    arg_parser.add_argument('--directory', default=DEFAULT_DIRECTORY,
+                            help=f"properties directory GET /validate reads files from (default: {DEFAULT_DIRECTORY})")
+    arg_parser.add_argument('--preload', metavar='DIR', help="validate the properties files in DIR at startup")
+    arg_parser.add_argument('--cache-size', type=int, default=api.RESULT_CACHE_SIZE,
+                            help="validation results kept by the service")
+    args = arg_parser.parse_args()
+
+    if args.check:
+        sys.exit(1 if check_files(args.files, args.socket, args.host, args.port, args.max_errors) > 0 else 0)
+    preload = properties_editor.list_properties_files(args.preload) if args.preload else None
+    serve(args.socket, args.host, args.port, preload, args.cache_size, args.directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import math
+import heapq
+import sqlite3
+import logging
+import argparse
+import validate_properties
+import properties_editor
+import schedule_planner
+
+
+logger = logging.getLogger()
+
+"""
+Table statistics are read from a JSON file:
+    {"tables": {"ptr.aap_drive.fact_venta_evento": {
+        "rows": 120000000, "bytes": 48000000000,
+        "columns": {"FECHA_PEDIDO": {"distinct": 3650, "min": "2014-01-01", "max": "2023-12-31"}}
+    }}}
+or from a SQLite snapshot, as exported from ALL_TAB_STATISTICS and ALL_TAB_COL_STATISTICS:
+    table_stats(origin, schema_name, table_name, num_rows, bytes)
+    column_stats(origin, schema_name, table_name, column_name, num_distinct, low_value, high_value)
+"""
+
+# Rows and bytes each extraction query should read
+TARGET_CHUNK_ROWS = 5000000
+TARGET_CHUNK_BYTES = 2 * 1024 ** 3
+# Maximum query_threads recommended for a single table
+MAX_QUERY_THREADS = 16
+# A configuration reading this many times the target chunk size per query is reported as inefficient
+INEFFICIENT_FACTOR = 4
+
+# Settings used by some strategies only, see recommend
+STRATEGY_KEYS = ('partitions', 'partition_column', 'max_results')
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+class ColumnStats:
+    '''
+    Statistics of a candidate partition column
+
+    :param distinct: number of distinct values
+    :param low: minimum value, None if unknown
+    :param high: maximum value, None if unknown
+    '''
+
+    def __init__(self, distinct, low=None, high=None):
+        self.distinct = distinct
+        self.low = low
+        self.high = high
+
+    @property
+    def has_range(self):
+        return self.low is not None and self.high is not None
+
+
+class TableStats:
+    '''
+    Statistics of a table
+
+    :param rows: number of rows
+    :param size: size in bytes, 0 if unknown
+    :param columns: dict with uppercase column name -> ColumnStats
+    '''
+
+    def __init__(self, rows, size=0, columns=None):
+        self.rows = rows
+        self.size = size
+        self.columns = columns or {}
+
+    def chunks(self, chunk_rows=TARGET_CHUNK_ROWS, chunk_bytes=TARGET_CHUNK_BYTES):
+        '''
+        :return: number of queries needed so that none reads more than chunk_rows rows or chunk_bytes bytes
+        '''
+        return max(1, math.ceil(self.rows / chunk_rows), math.ceil(self.size / chunk_bytes))
+
+
+def table_key(origin, schema, table):
+    return f"{origin}.{schema}.{table}".lower()
+
+
+def load_json_stats(path):
+    '''
+    :return: dict with table key ('ptr.aap_drive.fact_venta_evento') -> TableStats
+    '''
+    with open(path) as f:
+        content = json.load(f)
+    result = {}
+    for key, table in content['tables'].items():
+        columns = {name.upper(): ColumnStats(column.get('distinct', 0), column.get('min'), column.get('max'))
+                   for name, column in table.get('columns', {}).items()}
+        result[key.lower()] = TableStats(table['rows'], table.get('bytes', 0), columns)
+    return result
+
+
+def load_sqlite_stats(path):
+    '''
+    :return: dict with table key ('ptr.aap_drive.fact_venta_evento') -> TableStats
+    '''
+    result = {}
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        for origin, schema, table, rows, size in connection.execute(
+                "SELECT origin, schema_name, table_name, num_rows, bytes FROM table_stats"):
+            result[table_key(origin, schema, table)] = TableStats(rows or 0, size or 0)
+        for origin, schema, table, column, distinct, low, high in connection.execute(
+                "SELECT origin, schema_name, table_name, column_name, num_distinct, low_value, high_value "
+                "FROM column_stats"):
+            stats = result.get(table_key(origin, schema, table))
+            if stats is not None:
+                stats.columns[column.upper()] = ColumnStats(distinct or 0, low, high)
+    return result
+
+
+def load_stats(path):
+    '''
+    Loads table statistics from a SQLite snapshot (.db, .sqlite, .sqlite3) or a JSON file
+    '''
+    if path.endswith(SQLITE_SUFFIXES):
+        return load_sqlite_stats(path)
+    return load_json_stats(path)
+
+
+def partition_column(table_config, stats, chunks):
+    '''
+    Chooses the column to partition a table by: the configured one if it has enough distinct
+    values, otherwise the column with known bounds and most distinct values
+
+    :return: uppercase column name, None if no column can be split in chunks partitions
+    '''
+    candidates = {name: column for name, column in stats.columns.items()
+                  if column.has_range and column.distinct >= chunks}
+    configured = (table_config.get('partition_column') or "").upper()
+    if configured in candidates:
+        return configured
+    if len(candidates) == 0:
+        return None
+    return max(sorted(candidates), key=lambda x: candidates[x].distinct)
+
+
+def allocate_threads(demands, cap, max_threads=MAX_QUERY_THREADS):
+    '''
+    Shares the concurrent queries an origin allows between the tasks of a pipeline, which fire
+    at the same time. Every task gets one query, the rest go one by one to the task with most
+    rows per query that still has chunks left
+
+    :param demands: dict with task key -> (rows, chunks)
+    :param cap: concurrent queries allowed on the origin
+    :return: dict with task key -> query_threads
+    '''
+    threads = {key: 1 for key in demands}
+    budget = cap - len(threads)
+    heap = [(-rows, key) for key, (rows, chunks) in demands.items() if chunks > 1 and max_threads > 1]
+    heapq.heapify(heap)
+    while budget > 0 and len(heap) > 0:
+        rows_per_thread, key = heapq.heappop(heap)
+        threads[key] += 1
+        budget -= 1
+        rows, chunks = demands[key]
+        if threads[key] < min(chunks, max_threads):
+            heapq.heappush(heap, (-rows / threads[key], key))
+    return threads
+
+
+def recommend(table_config, stats, threads, chunk_rows=TARGET_CHUNK_ROWS, chunk_bytes=TARGET_CHUNK_BYTES):
+    '''
+    Recommends the extraction strategy settings of a table:
+        a single query if the table fits in one chunk
+        partition strategy over the best partition column otherwise
+        offset strategy, chunks of max_results rows, if no column can be partitioned
+
+    :param table_config: validated table config (ORACLE_CONFIG_KEYS)
+    :param stats: TableStats of the table
+    :param threads: query_threads allocated to the table
+    :return: dict with strategy settings
+    '''
+    chunks = stats.chunks(chunk_rows, chunk_bytes)
+    if chunks <= 1:
+        return {'strategy': "default", 'query_threads': 1}
+    column = partition_column(table_config, stats, chunks)
+    if column is not None:
+        return {'strategy': "partition", 'partitions': chunks, 'partition_column': column, 'query_threads': threads}
+    strategy = table_config['strategy'] if table_config['strategy'].startswith('offset_') else "offset_rownum"
+    return {'strategy': strategy, 'max_results': math.ceil(stats.rows / chunks), 'query_threads': threads}
+
+
+def inefficiencies(table_config, stats, chunk_rows=TARGET_CHUNK_ROWS, chunk_bytes=TARGET_CHUNK_BYTES):
+    '''
+    :return: list of messages on clearly inefficient strategy settings of a table
+    '''
+    messages = []
+    chunks = stats.chunks(chunk_rows, chunk_bytes)
+    strategy = table_config['strategy']
+    concurrency = schedule_planner.task_concurrency(table_config)
+    if strategy == "default" and chunks >= INEFFICIENT_FACTOR:
+        messages.append(f"single query full scan of {stats.rows} rows, {chunks} chunks recommended")
+    elif strategy == "partition":
+        partitions = table_config.get('partitions') or 1
+        column = stats.columns.get((table_config.get('partition_column') or "").upper())
+        if chunks == 1 and partitions > 1:
+            messages.append(f"{partitions} partitions for {stats.rows} rows, a single query is enough")
+        elif chunks / partitions >= INEFFICIENT_FACTOR:
+            messages.append(f"{partitions} partitions for {stats.rows} rows, {chunks} recommended")
+        if column is not None and column.distinct < partitions:
+            messages.append(f"partition_column {table_config['partition_column']} has {column.distinct} distinct "
+                            f"values for {partitions} partitions")
+        if table_config['query_threads'] > partitions:
+            messages.append(f"query_threads {table_config['query_threads']} over {partitions} partitions")
+    elif strategy.startswith('offset_'):
+        max_results = table_config.get('max_results') or 1
+        if chunks == 1 and max_results < stats.rows:
+            messages.append(f"max_results {max_results} splits {stats.rows} rows, a single query is enough")
+        elif max_results * INEFFICIENT_FACTOR <= stats.rows / chunks:
+            messages.append(f"max_results {max_results} runs {math.ceil(stats.rows / max_results)} queries, "
+                            f"{chunks} recommended")
+    if chunks == 1 and concurrency > 1 and strategy != "partition":
+        messages.append(f"{concurrency} concurrent queries for {stats.rows} rows")
+    return messages
+
+
+def _changed(current, recommended):
+    if isinstance(recommended, str) and isinstance(current, str):
+        return current.lower() != recommended.lower()
+    return current != recommended
+
+
+def advise_file(file_path, stats, caps, default_cap, chunk_rows=TARGET_CHUNK_ROWS, chunk_bytes=TARGET_CHUNK_BYTES):
+    '''
+    Recommends strategy settings for every table of a properties file with statistics
+
+    :param stats: dict with table key -> TableStats
+    :param caps: dict with origin -> concurrent queries allowed
+    :param default_cap: concurrent queries allowed on origins not in caps
+    :return: JSON serializable dict with the tables advised, their property updates (None for
+             settings to comment out, see properties_editor.set_properties) and warnings, None if the file is KO
+    '''
+    file_name = os.path.basename(file_path).split('.')[0]
+    properties = validate_properties.properties_file_to_dict(file_path)
+    errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(properties, file_name)
+    if len(errors) > 0:
+        return None
+
+    # Tables with statistics per origin, every task of a pipeline fires at the same time.
+    # Tables without statistics keep their settings and the queries they run
+    by_origin = {}
+    fixed = {}
+    missing = []
+    for origin, schema, table, table_config, table_snowflake in tables:
+        key = table_key(origin, schema, table)
+        by_origin.setdefault(origin.lower(), [])
+        if key not in stats:
+            missing.append(key)
+            fixed[origin.lower()] = fixed.get(origin.lower(), 0) + schedule_planner.task_concurrency(table_config)
+            continue
+        by_origin[origin.lower()].append((key, table_config))
+
+    result = {'file': file_path, 'tables': [], 'missing_stats': missing, 'concurrency': {}}
+    for origin, origin_tables in by_origin.items():
+        cap = caps.get(origin, default_cap)
+        demands = {key: (stats[key].rows, stats[key].chunks(chunk_rows, chunk_bytes)) for key, x in origin_tables}
+        threads = allocate_threads(demands, cap - fixed.get(origin, 0))
+        current_concurrency = recommended_concurrency = fixed.get(origin, 0)
+
+        for key, table_config in origin_tables:
+            recommended = recommend(table_config, stats[key], threads[key], chunk_rows, chunk_bytes)
+            updates = {f"{key}.{name}": value for name, value in recommended.items()
+                       if _changed(table_config.get(name), value)}
+            # Settings of the previous strategy that no longer apply are commented out
+            stale = [name for name in STRATEGY_KEYS if name not in recommended and table_config.get(name) is not None]
+            updates.update({f"{key}.{name}": None for name in stale})
+            current_concurrency += schedule_planner.task_concurrency(table_config)
+            recommended_concurrency += schedule_planner.task_concurrency(dict(table_config, **recommended))
+            result['tables'].append({
+                'table': key,
+                'rows': stats[key].rows,
+                'chunks': demands[key][1],
+                'current': {name: table_config.get(name) for name in [*recommended, *stale]},
+                'recommended': recommended,
+                'updates': updates,
+                'warnings': inefficiencies(table_config, stats[key], chunk_rows, chunk_bytes),
+            })
+        result['concurrency'][origin] = {'current': current_concurrency, 'recommended': recommended_concurrency,
+                                         'cap': cap}
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Recommend extraction strategy settings from table statistics")
+    arg_parser.add_argument('files', nargs='*', help="properties files, every file in --directory by default")
+    arg_parser.add_argument('--stats', required=True, help="table statistics, JSON file or SQLite snapshot")
+    arg_parser.add_argument('--directory', default="properties", help="properties directory (default: properties)")
+    arg_parser.add_argument('--chunk-rows', type=int, default=TARGET_CHUNK_ROWS, help="rows read by each query")
+    arg_parser.add_argument('--chunk-bytes', type=int, default=TARGET_CHUNK_BYTES, help="bytes read by each query")
+    arg_parser.add_argument('--max-concurrency', type=int, default=schedule_planner.DEFAULT_CONCURRENCY_CAP,
+                            help="concurrent queries allowed per origin")
+    arg_parser.add_argument('--origin-cap', action='append', default=[], metavar='ORIGIN=N',
+                            help="concurrent queries allowed for an origin, overrides --max-concurrency")
+    arg_parser.add_argument('--apply', action='store_true', help="rewrite strategy settings in properties files")
+    arg_parser.add_argument('--output', help="write the JSON report to this file")
+    args = arg_parser.parse_args()
+
+    files = args.files or properties_editor.list_properties_files(args.directory)
+    stats = load_stats(args.stats)
+    caps = schedule_planner.parse_caps(args.origin_cap)
+
+    results = []
+    inefficient = 0
+    for file_path in files:
+        result = advise_file(file_path, stats, caps, args.max_concurrency, args.chunk_rows, args.chunk_bytes)
+        if result is None:
+            logger.warning(f"Properties file {file_path} is KO, it is not advised")
+            continue
+        results.append(result)
+
+        updates = {}
+        for table in result['tables']:
+            for message in table['warnings']:
+                logger.warning(f"{file_path}: {table['table']}: {message}")
+            inefficient += len(table['warnings'])
+            for key, value in table['updates'].items():
+                new_value = "commented out" if value is None else value
+                logger.info(f"{file_path}: {key}: {table['current'][key.rsplit('.', 1)[1]]} -> {new_value}")
+            updates.update(table['updates'])
+        for origin, concurrency in result['concurrency'].items():
+            logger.info(f"{file_path}: origin {origin} concurrency {concurrency['current']} -> "
+                        f"{concurrency['recommended']} (cap {concurrency['cap']})")
+            if concurrency['recommended'] > concurrency['cap']:
+                logger.warning(f"{file_path}: origin {origin} goes over its cap with a single query per table, "
+                               f"consider splitting the pipeline or staggering it with schedule_planner")
+        if len(result['missing_stats']) > 0:
+            logger.info(f"{file_path}: no statistics for {len(result['missing_stats'])} tables")
+        if args.apply and len(updates) > 0:
+            properties_editor.update_file(file_path, updates)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if inefficient > 0 and not args.apply else 0)
+
+
+if __name__ == "__main__":
+    main()
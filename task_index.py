@@ -0,0 +1,338 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from collections import defaultdict
+import validate_properties
+import pipeline_writer
+import properties_editor
+
+
+logger = logging.getLogger()
+
+INDEX_FILE = ".task_index.json"
+INDEX_VERSION = 1
+
+# Fields of each indexed task
+TASK_FIELDS = ('id', 'origin', 'schema', 'table', 'prefix', 'interval')
+
+# git name-status codes, renames and copies are followed by the old and the new path
+ADDED_OR_MODIFIED = re.compile(r'^[AaMm]')
+DELETED = re.compile(r'^[Dd]')
+RENAMED = re.compile(r'^[Rr]')
+COPIED = re.compile(r'^[Cc]')
+
+
+def file_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_tasks(file_path, text):
+    '''
+    Validates a properties file content and returns the tasks it generates
+
+    :param file_path: properties file path, its base name is the pipeline name
+    :param text: properties file content
+    :return: list of task dicts with TASK_FIELDS, None if the file is KO
+    '''
+    file_name = os.path.basename(file_path).split('.')[0]
+    properties = validate_properties.properties_text_to_dict(text)
+    errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(properties, file_name)
+    if len(errors) > 0:
+        return None
+    return [{
+        'id': f"{origin.lower()}_{schema.lower()}_{table.lower()}",
+        'origin': origin.lower(),
+        'schema': schema.upper(),
+        'table': table.upper(),
+        'prefix': table_snowflake.get('prefix'),
+        'interval': base_schedule['interval']
+    } for origin, schema, table, table_config, table_snowflake in tables]
+
+
+def target_key(task):
+    '''
+    :return: Snowflake table a task loads into, as (prefix, schema, table)
+    '''
+    return task['prefix'] or "", task['schema'], task['table']
+
+
+class TaskIndex:
+    '''
+    Index of the tasks generated by every properties file, persisted as JSON:
+        {"version": 1, "files": {file path: {"digest": content sha256, "tasks": [task, ...]}}}
+
+    Lookups by task id and by Snowflake target table are kept in memory, so checking the
+    tasks of a changed file costs one lookup per task, whatever the number of files
+    '''
+
+    def __init__(self, files=None):
+        self.files = {}
+        self._by_id = defaultdict(set)
+        self._by_target = defaultdict(set)
+        for file_path, entry in (files or {}).items():
+            self._add(file_path, entry)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        '''
+        :return: TaskIndex stored in path, empty if it does not exist or is not valid
+        '''
+        try:
+            with open(path) as f:
+                content = json.load(f)
+            if content.get('version') == INDEX_VERSION:
+                return cls(content['files'])
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+        return cls()
+
+    def save(self, path=INDEX_FILE):
+        pipeline_writer.write_file_atomic(path, json.dumps({'version': INDEX_VERSION, 'files': self.files},
+                                                           indent=1, sort_keys=True))
+
+    def _add(self, file_path, entry):
+        self.files[file_path] = entry
+        for task in entry['tasks']:
+            self._by_id[task['id']].add(file_path)
+            self._by_target[target_key(task)].add((file_path, task['id']))
+
+    def remove_file(self, file_path):
+        '''
+        Removes every task of a file from the index
+
+        :return: True if the file was indexed
+        '''
+        entry = self.files.pop(file_path, None)
+        if entry is None:
+            return False
+        for task in entry['tasks']:
+            self._by_id[task['id']].discard(file_path)
+            if len(self._by_id[task['id']]) == 0:
+                del self._by_id[task['id']]
+            key = target_key(task)
+            self._by_target[key].discard((file_path, task['id']))
+            if len(self._by_target[key]) == 0:
+                del self._by_target[key]
+        return True
+
+    def update_file(self, file_path):
+        '''
+        Reindexes a properties file, skipping it if its content did not change.
+        Deleted and KO files are removed from the index
+
+        :return: True if the index changed
+        '''
+        try:
+            with open(file_path) as f:
+                text = f.read()
+        except FileNotFoundError:
+            return self.remove_file(file_path)
+
+        digest = file_digest(text)
+        if self.files.get(file_path, {}).get('digest') == digest:
+            return False
+
+        self.remove_file(file_path)
+        tasks = file_tasks(file_path, text)
+        if tasks is None:
+            logger.warning(f"Properties file {file_path} is KO, its tasks are not indexed")
+            return True
+        self._add(file_path, {'digest': digest, 'tasks': tasks})
+        return True
+
+    def apply_changes(self, changes):
+        '''
+        Updates the index from a git name-status list, as received by postSync.py
+
+        :param changes: list of (status, file path) tuples, only properties files are considered
+        :return: list of changed file paths still indexed, to be checked for conflicts
+        '''
+        changed = []
+        for status, file_path in changes:
+            if not file_path.endswith('.properties'):
+                continue
+            if DELETED.match(status):
+                self.remove_file(file_path)
+            elif ADDED_OR_MODIFIED.match(status):
+                self.update_file(file_path)
+                if file_path in self.files:
+                    changed.append(file_path)
+        return changed
+
+    def sync_directory(self, directory="properties"):
+        '''
+        Reindexes every properties file of a directory and drops files no longer in it
+
+        :return: list of changed file paths still indexed
+        '''
+        files = properties_editor.list_properties_files(directory)
+        removed = [x for x in self.files if os.path.dirname(x) == directory.rstrip('/') and x not in files]
+        changes = [('D', x) for x in removed] + [('M', x) for x in files]
+        return self.apply_changes(changes)
+
+    def task_files(self, task_id):
+        '''
+        :return: sorted list of files generating a task id
+        '''
+        return sorted(self._by_id.get(task_id, ()))
+
+    def conflicts(self, file_path):
+        '''
+        Returns the tasks of a file defined by other files too, or loading the same Snowflake table
+
+        :return: list of conflict dicts with kind ('duplicate_id' or 'same_target'), task, key and files
+        '''
+        result = []
+        for task in self.files.get(file_path, {}).get('tasks', []):
+            others = self._by_id[task['id']] - {file_path}
+            if len(others) > 0:
+                result.append({'kind': 'duplicate_id', 'task': task['id'], 'key': task['id'],
+                               'files': sorted(others)})
+            key = target_key(task)
+            others = {x for x in self._by_target[key] if x != (file_path, task['id'])}
+            # Same task in other files is already reported as a duplicate id
+            others = {x for x in others if x[1] != task['id']}
+            if len(others) > 0:
+                result.append({'kind': 'same_target', 'task': task['id'], 'key': ".".join(x for x in key if x),
+                               'files': sorted(f"{x[0]}:{x[1]}" for x in others)})
+        return result
+
+    def all_conflicts(self):
+        '''
+        :return: dict with file path -> list of conflicts, only files with conflicts
+        '''
+        result = {}
+        for file_path in sorted(self.files):
+            conflicts = self.conflicts(file_path)
+            if len(conflicts) > 0:
+                result[file_path] = conflicts
+        return result
+
+
+def parse_name_status(args):
+    '''
+    Returns (status, path) pairs from a flat list of git name-status values: [status, path, status, path...].
+    Renames (R<score> old new) are returned as the deletion of old and the addition of new,
+    copies (C<score> old new) as the addition of new
+
+    :param args: list of name-status values, as split by the shell
+    :return: list of (status, file path) tuples
+    '''
+    result = []
+    i = 0
+    while i + 1 < len(args):
+        status = args[i]
+        if RENAMED.match(status) or COPIED.match(status):
+            if i + 2 >= len(args):
+                raise ValueError(f"Missing new path of git name-status record {' '.join(args[i:])}")
+            if RENAMED.match(status):
+                result.append(('D', args[i + 1]))
+            result.append(('A', args[i + 2]))
+            i += 3
+        else:
+            result.append((status, args[i + 1]))
+            i += 2
+    return result
+
+
+def duplicate_count(conflicts):
+    '''
+    :param conflicts: dict with file path -> list of conflicts
+    :return: number of duplicate_id conflicts
+    '''
+    return sum(1 for file_conflicts in conflicts.values() for x in file_conflicts if x['kind'] == 'duplicate_id')
+
+
+def log_conflicts(conflicts, strict=False):
+    '''
+    Logs conflicts as warnings, task ids defined twice as errors if strict
+
+    :param conflicts: dict with file path -> list of conflicts
+    :param strict: task ids defined twice are errors
+    :return: number of conflicts logged
+    '''
+    count = 0
+    for file_path, file_conflicts in conflicts.items():
+        for conflict in file_conflicts:
+            if conflict['kind'] == 'duplicate_id':
+                log = logger.error if strict else logger.warning
+                log(f"Task {conflict['task']} of {file_path} is also defined in {', '.join(conflict['files'])}")
+            else:
+                logger.warning(f"Task {conflict['task']} of {file_path} loads Snowflake table {conflict['key']} "
+                               f"as {', '.join(conflict['files'])}")
+            count += 1
+    return count
+
+
+def check_changes(changes, index_path=INDEX_FILE, directory="properties", strict=False, resync=False):
+    '''
+    Updates the persisted index with a git name-status list and logs the conflicts of changed files.
+    Only the changed files are read, the index is built from every file of directory when it does
+    not exist yet or resync is set
+
+    :param changes: list of (status, file path) tuples
+    :param strict: fail when a changed file defines a task id defined by another file
+    :param resync: reindex every file of directory first, files whose digest did not change are not validated again
+    :return: exit code, 1 if strict and a changed file defines a task id defined by another file, 0 otherwise
+    '''
+    exists = os.path.exists(index_path)
+    index = TaskIndex.load(index_path)
+    if not exists or resync:
+        if not exists:
+            logger.info(f"Task index {index_path} not found, indexing every file in {directory}")
+        index.sync_directory(directory)
+    changed = index.apply_changes(changes)
+    index.save(index_path)
+
+    conflicts = {}
+    for file_path in changed:
+        file_conflicts = index.conflicts(file_path)
+        if len(file_conflicts) > 0:
+            conflicts[file_path] = file_conflicts
+    count = log_conflicts(conflicts, strict)
+    duplicates = duplicate_count(conflicts)
+    logger.info(f"Task index: {len(index.files)} files, {len(changed)} changed, {count} conflicts, "
+                f"{duplicates} duplicate task ids")
+    return 1 if strict and duplicates > 0 else 0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Index tasks of every properties file and detect conflicts")
+    arg_parser.add_argument('changes', nargs='*',
+                            help="git name-status values: STATUS PATH [STATUS PATH ...], renames and copies as "
+                                 "STATUS OLD NEW")
+    arg_parser.add_argument('--index', default=INDEX_FILE, help=f"index file (default: {INDEX_FILE})")
+    arg_parser.add_argument('--directory', default="properties", help="properties directory (default: properties)")
+    arg_parser.add_argument('--rebuild', action='store_true', help="reindex every file of --directory")
+    arg_parser.add_argument('--task', help="print the files generating a task id")
+    arg_parser.add_argument('--all', action='store_true', help="report conflicts of every indexed file")
+    arg_parser.add_argument('--resync', action='store_true',
+                            help="reindex every file of --directory before applying changes, unchanged files are not "
+                                 "validated again")
+    arg_parser.add_argument('--strict', action='store_true', help="exit 1 when a task id is defined by several files")
+    args = arg_parser.parse_args()
+
+    if args.task:
+        index = TaskIndex.load(args.index)
+        print("\n".join(index.task_files(args.task)))
+        sys.exit(0)
+
+    if args.rebuild or args.all:
+        index = TaskIndex() if args.rebuild else TaskIndex.load(args.index)
+        index.sync_directory(args.directory)
+        index.save(args.index)
+        conflicts = index.all_conflicts()
+        count = log_conflicts(conflicts, args.strict)
+        duplicates = duplicate_count(conflicts)
+        logger.info(f"Task index: {len(index.files)} files, {count} conflicts, {duplicates} duplicate task ids")
+        sys.exit(1 if args.strict and duplicates > 0 else 0)
+
+    sys.exit(check_changes(parse_name_status(args.changes), args.index, args.directory, args.strict, args.resync))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import sys
+
+
+"""
+Compact records of the tasks generated for a pipeline. A task only keeps references to
+interned names and to value tuples shared by every task with the same settings, and is
+converted to the nested dicts of environment.yml and schedule.yml when it is serialized
+"""
+
+
+def freeze(value):
+    '''
+    Returns a hashable, shareable version of a config value: lists become tuples
+    and strings are interned
+    '''
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple(freeze(x) for x in value)
+    return value
+
+
+def thaw(value):
+    '''
+    Returns a config value as it is written to YAML, tuples back to lists
+    '''
+    if isinstance(value, tuple):
+        return [thaw(x) for x in value]
+    return value
+
+
+class Interner:
+    '''
+    Shares equal names and settings between the tasks of a pipeline
+    '''
+
+    def __init__(self):
+        self._items = {}
+
+    @staticmethod
+    def name(value):
+        return sys.intern(value)
+
+    def items(self, pairs):
+        '''
+        :param pairs: iterable of (key, value)
+        :return: tuple of (key, value) pairs, the same object for every equal sequence of pairs
+        '''
+        items = tuple((sys.intern(key), freeze(value)) for key, value in pairs)
+        try:
+            return self._items.setdefault(items, items)
+        except TypeError:
+            # Unhashable values are kept, just not shared
+            return items
+
+
+class TaskRecord:
+    '''
+    Extractor, loader and schedule of a task
+
+    :param task_id: task identifier, <origin>_<schema>_<table>
+    :param extractor: extractor plugin name
+    :param schema: schema used as filter_schemas
+    :param stream: stream name, <SCHEMA>-<TABLE>
+    :param fields: tuple of selected fields
+    :param config: tuple of extractor (key, value) config pairs
+    :param metadata: tuple of stream (key, value) metadata pairs
+    :param loader: loader plugin name
+    :param loader_config: tuple of loader (key, value) config pairs
+    :param schedule: validated base schedule dict, shared by every task of the pipeline
+    '''
+    __slots__ = ('id', 'extractor', 'schema', 'stream', 'fields', 'config', 'metadata', 'loader', 'loader_config',
+                 'schedule')
+
+    def __init__(self, task_id, extractor, schema, stream, fields, config, metadata, loader, loader_config, schedule):
+        self.id = task_id
+        self.extractor = extractor
+        self.schema = schema
+        self.stream = stream
+        self.fields = fields
+        self.config = config
+        self.metadata = metadata
+        self.loader = loader
+        self.loader_config = loader_config
+        self.schedule = schedule
+
+    def __repr__(self):
+        return f"TaskRecord('{self.id}')"
+
+    def key(self):
+        '''
+        :return: tuple with every value of the task, equal tasks have equal keys
+        '''
+        return (self.id, self.extractor, self.schema, self.stream, self.fields, self.config, self.metadata,
+                self.loader, self.loader_config, tuple(self.schedule.items()))
+
+    def __eq__(self, other):
+        if not isinstance(other, TaskRecord):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def environment(self):
+        '''
+        :return: dict written to environment.yml
+        '''
+        extractor_config = {'filter_schemas': self.schema}
+        extractor_config.update((key, thaw(value)) for key, value in self.config)
+        extractor = {
+            'name': self.extractor,
+            'config': extractor_config,
+            'select': [f"{self.stream}.{field}" for field in self.fields],
+            'metadata': {self.stream: {key: thaw(value) for key, value in self.metadata}}
+        }
+        loader = {'name': self.loader, 'config': {key: thaw(value) for key, value in self.loader_config}}
+        return {'environments': [{'name': self.id, 'config': {'plugins': {
+            'extractors': [extractor],
+            'loaders': [loader]
+        }}}]}
+
+    def schedule_document(self):
+        '''
+        :return: dict written to schedule.yml
+        '''
+        schedule = dict(self.schedule)
+        schedule['name'] = self.id
+        schedule['extractor'] = self.extractor
+        schedule['loader'] = self.loader
+        return {'schedules': [schedule]}
+
+    def documents(self):
+        '''
+        :return: tuple with (environment, schedule) documents
+        '''
+        return self.environment(), self.schedule_document()
@@ -0,0 +1,47 @@
+import os
+import api
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+FILE_PATH = os.path.join(PROPERTIES_DIR, 'test-pipeline.properties')
+
+
+def test_validate_path():
+    result = api.validate_path(FILE_PATH)
+    assert result.ok
+    assert result.name == "test-pipeline"
+    assert result.errors == {}
+    files = result.files()
+    assert files['schedule_interval'] == "@daily"
+    assert {name.split('/')[0] for name in files if '/' in name} == {task.id for task in result.tasks()}
+    assert result.to_dict(files=True)['files'] == files
+
+
+def test_ko_results_have_no_tasks():
+    result = api.validate_text("origins = ptr\n", "ko")
+    assert not result.ok
+    assert 'schedule' in result.errors
+    assert result.tasks() == []
+    assert result.files() == {}
+    assert 'schedule' not in result.to_dict()
+
+
+def test_max_errors_stops_validation():
+    result = api.validate_text("origins = unknown,other\n", "ko", max_errors=1)
+    assert result.diagnostics.truncated
+    assert result.diagnostics.error_count == 1
+
+
+def test_validator_caches_results_with_start_date():
+    validator = api.Validator(cache_size=1)
+    with open(FILE_PATH) as f:
+        text = f.read()
+    first = validator.validate_text(text, "test-pipeline")
+    assert validator.validate_path(FILE_PATH) is first
+    assert validator.stats() == {'cached': 1, 'hits': 1, 'misses': 1}
+
+    # Without start_date the result depends on the current time
+    text = "\n".join(x for x in text.splitlines() if not x.startswith("schedule.start_date"))
+    validator.validate_text(text, "no-start")
+    validator.validate_text(text, "no-start")
+    assert validator.stats() == {'cached': 1, 'hits': 1, 'misses': 3}
@@ -0,0 +1,34 @@
+import os
+import shutil
+import pytest
+import batch_validate
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+@pytest.fixture
+def files(tmp_path):
+    ok_path = str(tmp_path / 'ok.properties')
+    ko_path = str(tmp_path / 'ko.properties')
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), ok_path)
+    with open(ko_path, 'w') as f:
+        f.write("origins = ptr\n")
+    return ok_path, ko_path, str(tmp_path / 'missing.properties')
+
+
+def test_validate_files_in_input_order(files):
+    ok_path, ko_path, missing_path = files
+    results = batch_validate.validate_files([ko_path, " ", ok_path, ko_path, missing_path])
+    assert list(results.items()) == [(ko_path, False), (ok_path, True), (missing_path, False)]
+
+
+def test_workers_match_in_process(files):
+    assert batch_validate.validate_files(list(files), workers=2) == batch_validate.validate_files(list(files))
+
+
+def test_run_exit_code(files):
+    ok_path, ko_path, missing_path = files
+    assert batch_validate.run([]) == 0
+    assert batch_validate.run([ok_path]) == 0
+    assert batch_validate.run([ok_path, ko_path]) == 1
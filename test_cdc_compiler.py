@@ -0,0 +1,105 @@
+import os
+import json
+import shutil
+import pytest
+import cdc_compiler
+
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cdc_templates', 'cdc_prueba1.json')
+
+ISSUE_FORM = """### CDC template
+schema: indom_zara
+table: estado_subpedido   # table to replicate
+origin_connection: INDOM_ZARA_IR
+sf_origin_prefix: ieecdb2v1
+sf_bbdd: secure_resources
+sf_bbdd_target: digital_data
+sf_warehouse: digital_data_pipeline_rt_wh_med
+maintenance_user_list: [maintenance_user1 maintenance_user2]
+"""
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    '''
+    Template directory with two templates, paths relative to tmp_path as given on the command line
+    '''
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('cdc_templates')
+    shutil.copy(TEMPLATE, 'cdc_templates/a.json')
+    with open('cdc_templates/b.json', 'w') as f:
+        f.write(ISSUE_FORM)
+    return 'cdc_templates'
+
+
+def _manifest():
+    with open(os.path.join('cdc', cdc_compiler.MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def test_issue_form_defaults_and_derived_names():
+    config, result = cdc_compiler.compile_template("b.json", ISSUE_FORM)
+    assert not result.has_errors
+    assert config['schema'] == "INDOM_ZARA"
+    assert config['origin_connection'] == "indom_zara_ir"
+    assert config['sf_cdc_il_table'] == "IL_IEECDB2V1_INDOM_ZARA_ESTADO_SUBPEDIDO"
+    assert config['sf_table'] == "ESTADO_SUBPEDIDO"
+    assert config['maintenance_user_list'] == ["MAINTENANCE_USER1", "MAINTENANCE_USER2"]
+    assert config['sf_flat_schema'] == "FLATTENED"
+
+
+@pytest.mark.parametrize('text', ["", "not a template", "[1, 2]", '{"schema": "1BAD"}'])
+def test_invalid_templates(text):
+    config, result = cdc_compiler.compile_template("t.json", text)
+    assert config is None
+    assert result.has_errors
+
+
+def test_unchanged_templates_are_skipped(templates):
+    paths = cdc_compiler.list_templates([templates])
+    entries, compiled = cdc_compiler.compile_templates(paths)
+    assert compiled == paths
+    assert all(x['ok'] for x in entries.values())
+    # Both templates load the same table
+    assert cdc_compiler.duplicates(entries) == {paths[0]: [paths[1]], paths[1]: [paths[0]]}
+
+    entries, compiled = cdc_compiler.compile_templates(paths)
+    assert compiled == []
+    assert cdc_compiler.compile_templates(paths, force=True)[1] == paths
+
+
+def test_deleted_and_renamed_templates_are_pruned(templates):
+    cdc_compiler.compile_templates(cdc_compiler.list_templates([templates]))
+    assert os.path.exists('cdc/cdc_templates/a.json')
+
+    os.rename('cdc_templates/a.json', 'cdc_templates/c.json')
+    os.remove('cdc_templates/b.json')
+    cdc_compiler.compile_templates(cdc_compiler.list_templates([templates]))
+    assert sorted(os.listdir('cdc/cdc_templates')) == ['c.json']
+    assert list(_manifest()['templates']) == ['cdc_templates/c.json']
+
+
+def test_ko_template_artifact_is_removed(templates):
+    cdc_compiler.compile_templates(cdc_compiler.list_templates([templates]))
+    with open('cdc_templates/b.json', 'w') as f:
+        f.write("schema: 1BAD\n")
+    entries, compiled = cdc_compiler.compile_templates(cdc_compiler.list_templates([templates]))
+    assert not entries['cdc_templates/b.json']['ok']
+    assert sorted(os.listdir('cdc/cdc_templates')) == ['a.json']
+
+
+def test_templates_not_given_are_kept(templates):
+    cdc_compiler.compile_templates(cdc_compiler.list_templates([templates]))
+    entries, compiled = cdc_compiler.compile_templates(['cdc_templates/a.json'])
+    assert list(entries) == ['cdc_templates/a.json']
+    assert sorted(_manifest()['templates']) == ['cdc_templates/a.json', 'cdc_templates/b.json']
+    assert sorted(os.listdir('cdc/cdc_templates')) == ['a.json', 'b.json']
+
+
+def test_other_compiler_version_recompiles(templates, monkeypatch):
+    paths = cdc_compiler.list_templates([templates])
+    cdc_compiler.compile_templates(paths)
+    monkeypatch.setattr(cdc_compiler, '_compiler_version', "other")
+    assert cdc_compiler.load_manifest() == {}
+    assert cdc_compiler.compile_templates(paths)[1] == paths
+    assert _manifest()['version'] == "other"
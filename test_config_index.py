@@ -0,0 +1,50 @@
+import pytest
+import config_index
+
+
+PROPERTIES = {
+    'origins': "ptr",
+    'snowflake': {'batch_size_rows': "100", 'prefix': "global"},
+    'ptr': {
+        'schemas': "a",
+        'snowflake': {'prefix': "ptr"},
+        'a': {
+            'tables': "t",
+            't': {'strategy': "partition", 'snowflake': {'parallelism': "2"}},
+            'u': {'fields': "A,B"},
+        },
+    },
+}
+
+
+@pytest.fixture
+def index():
+    return config_index.ConfigIndex.from_properties(PROPERTIES)
+
+
+def test_levels_are_indexed_by_lowercased_path(index):
+    assert config_index.ConfigIndex.path('PTR', 'A', 'T') == ('ptr', 'a', 't')
+    assert set(index) == {(), ('ptr',), ('ptr', 'a'), ('ptr', 'a', 't'), ('ptr', 'a', 'u')}
+    assert dict(index.values(('ptr',))) == {'schemas': "a"}
+    assert dict(index.values(('missing',))) == {}
+
+
+def test_sections_resolve_deepest_level_first(index):
+    table = ('ptr', 'a', 't')
+    assert dict(index.resolve(table, 'snowflake')) == {'batch_size_rows': "100", 'prefix': "ptr", 'parallelism': "2"}
+    assert index.get(('ptr', 'a', 'u'), 'snowflake', 'prefix') == "ptr"
+    assert index.get((), 'snowflake', 'parallelism', 1) == 1
+    assert index.resolve(table, 'snowflake') is index.resolve(table, 'snowflake')
+
+
+def test_mappings_are_read_only_and_copies_are_counted(index):
+    with pytest.raises(TypeError):
+        index.values(('ptr',))['schemas'] = "b"
+    with pytest.raises(TypeError):
+        index.section((), 'snowflake')['prefix'] = "x"
+
+    config = index.config(('ptr', 'a', 't'))
+    config['strategy'] = "default"
+    assert PROPERTIES['ptr']['a']['t']['strategy'] == "partition"
+    assert index.config(('ptr', 'a', 'u'), 'snowflake') == {}
+    assert index.copies == 1
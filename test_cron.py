@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import pytest
+import cron
+
+
+@pytest.mark.parametrize('code, valid', [
+    ("0 8 * * *", True),
+    ("*/5 * * * *", True),
+    ("0,30 8-18 * * 1-5", True),
+    ("10-40/10 * 1 1 *", True),
+    ("60 * * * *", False),
+    ("* * * *", False),
+    ("*/0 * * * *", False),
+    ("5-1 * * * *", False),
+    ("@daily", False),
+])
+def test_is_valid_code(code, valid):
+    assert cron.is_valid_code(code) is valid
+
+
+@pytest.mark.parametrize('expression, interval', [
+    ("@every 1h30m", timedelta(hours=1, minutes=30)),
+    ("@every 90s", timedelta(seconds=90)),
+    ("@every 1000000ns", timedelta(milliseconds=1)),
+    ("@every 1ms500us", timedelta(microseconds=1500)),
+])
+def test_every_durations(expression, interval):
+    assert cron.is_valid_every(expression)
+    assert cron.parse(expression).interval == interval
+
+
+@pytest.mark.parametrize('expression', ["@every 500ns", "@every 0s", "@every 1h junk", "@daily"])
+def test_is_valid_every_agrees_with_parse(expression):
+    assert not cron.is_valid_every(expression)
+    if expression != "@daily":
+        with pytest.raises(ValueError):
+            cron.parse(expression)
+
+
+def test_next_fire_times_of_presets_and_codes():
+    start = datetime(2022, 4, 27, 8, 0)
+    assert cron.next_fire_times("@daily", start, 2) == [datetime(2022, 4, 28), datetime(2022, 4, 29)]
+    assert cron.next_fire_times("*/20 8 * * *", start, 3) == [datetime(2022, 4, 27, 8, 20),
+                                                              datetime(2022, 4, 27, 8, 40),
+                                                              datetime(2022, 4, 28, 8, 0)]
+
+
+def test_restricted_day_and_weekday_match_any():
+    # 1st of the month or sundays, 2022-05-01 is a sunday
+    schedule = cron.parse("0 0 1 * 0")
+    fire_times = schedule.next_fire_times(datetime(2022, 4, 27), 3)
+    assert fire_times == [datetime(2022, 5, 1), datetime(2022, 5, 8), datetime(2022, 5, 15)]
+
+
+def test_every_is_anchored():
+    schedule = cron.parse("@every 1h")
+    anchor = datetime(2022, 4, 27, 8, 15)
+    assert schedule.next_fire_times(datetime(2022, 4, 27, 10, 0), 2, anchor=anchor) == [
+        datetime(2022, 4, 27, 10, 15), datetime(2022, 4, 27, 11, 15)]
+
+
+def test_validate_many_reports_invalid_expressions_once():
+    errors = cron.validate_many(["@daily", "0 8 * * *", "bad", "bad"])
+    assert list(errors) == ["bad"]
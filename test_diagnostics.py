@@ -0,0 +1,68 @@
+import os
+import json
+import shutil
+import pytest
+import diagnostics
+import validate_properties
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+def test_entries_are_kept_in_order():
+    result = diagnostics.Diagnostics()
+    result.warning("ptr", "schemas", diagnostics.CASTED, "casted")
+    report = result.reporter("ptr.aap_drive")
+    report(diagnostics.ERROR, "tables", diagnostics.MISSING, "missing tables")
+    result.error("ptr", None, diagnostics.MISMATCH, "mismatch")
+
+    assert result.has_errors
+    assert result.messages(diagnostics.ERROR) == {'ptr.aap_drive': ["missing tables"], 'ptr': ["mismatch"]}
+    assert result.messages(diagnostics.WARNING) == {'ptr': ["casted"]}
+    assert [x.code for x in result.entries] == [diagnostics.CASTED, diagnostics.MISSING, diagnostics.MISMATCH]
+
+
+def test_max_errors_stops_validation():
+    result = diagnostics.Diagnostics(max_errors=2)
+    result.warning("a", "k", diagnostics.CASTED, "warning")
+    result.error("a", "k", diagnostics.MISSING, "first")
+    with pytest.raises(diagnostics.TooManyErrors):
+        result.error("a", "k", diagnostics.MISSING, "second")
+    assert result.truncated
+    assert result.report()['errors'] == 2
+    assert result.report()['warnings'] == 1
+
+
+def test_report_round_trip():
+    result = diagnostics.Diagnostics(max_errors=1)
+    with pytest.raises(diagnostics.TooManyErrors):
+        result.error("schedule", None, diagnostics.MISSING_SECTION, "No schedule is defined")
+    report = json.loads(json.dumps(result.report()))
+
+    replayed = diagnostics.Diagnostics.from_report(report)
+    assert replayed.report() == result.report()
+    assert replayed.log()
+
+
+def test_max_errors_from_environment(monkeypatch):
+    monkeypatch.delenv(diagnostics.MAX_ERRORS_ENV_VAR, raising=False)
+    assert diagnostics.diagnostics_from_environment().max_errors is None
+    monkeypatch.setenv(diagnostics.MAX_ERRORS_ENV_VAR, "3")
+    assert diagnostics.diagnostics_from_environment().max_errors == 3
+
+
+def test_validate_file_writes_report(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'ko-pipeline.properties')
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), file_path)
+    with open(file_path, 'a') as f:
+        f.write("origins = ptr,unknown\n")
+    monkeypatch.setenv(diagnostics.DIAGNOSTICS_ENV_VAR, str(tmp_path / 'reports'))
+
+    assert validate_properties.validate_file(file_path) is False
+    with open(tmp_path / 'reports' / 'ko-pipeline.json') as f:
+        report = json.load(f)
+    assert report['file'] == file_path
+    assert report['ok'] is False
+    assert report['errors'] >= 1
+    assert {'level': diagnostics.ERROR, 'path': "origins", 'key': "origins", 'code': diagnostics.INVALID_ORIGIN} in \
+        [{k: v for k, v in x.items() if k != 'message'} for x in report['diagnostics']]
@@ -0,0 +1,44 @@
+import os
+import json
+import instrumentation
+import validate_properties
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+def test_stats_report_adds_up_stages_and_counters():
+    stats = instrumentation.Stats(slowest_tables=1)
+    with stats.stage('parse'):
+        pass
+    assert list(stats.timed_iter([1, 2], 'build')) == [1, 2]
+    stats.count('tasks')
+    stats.count('tasks', 2)
+    stats.table('fast', 0.1)
+    stats.table('slow', 0.5)
+
+    report = stats.report()
+    assert set(report['stages']) == {'parse', 'build'}
+    assert report['total_seconds'] == sum(report['stages'].values())
+    assert report['counters'] == {'tasks': 3}
+    assert report['slowest_tables'] == [{'table': 'slow', 'seconds': 0.5}]
+
+
+def test_null_stats_is_a_drop_in():
+    stats = instrumentation.NULL_STATS
+    with stats.stage('parse'):
+        stats.count('tasks')
+    assert list(stats.timed_iter([1], 'build')) == [1]
+    assert not stats.enabled
+
+
+def test_validate_file_writes_counters(tmp_path, monkeypatch):
+    monkeypatch.setenv(instrumentation.STATS_ENV_VAR, str(tmp_path))
+    assert validate_properties.validate_file(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'))
+
+    with open(tmp_path / 'test-pipeline.json') as f:
+        report = json.load(f)
+    assert report['ok'] is True
+    assert report['counters']['configs_validated'] > 0
+    # Each validated level is copied once, with its snowflake section if it has one
+    assert 0 < report['counters']['copies'] <= 2 * report['counters']['configs_validated']
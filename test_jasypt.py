@@ -0,0 +1,37 @@
+import pytest
+import jasypt
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    jasypt.clear_derived_key_cache()
+    yield
+    jasypt.clear_derived_key_cache()
+
+
+def test_derived_keys_are_cached_and_bounded(monkeypatch):
+    monkeypatch.setattr(jasypt, 'DERIVED_KEY_CACHE_SIZE', 2)
+    ciphertexts = [jasypt.encrypt(f"value-{i}", b"key") for i in range(3)]
+    assert len(jasypt._derived_key_cache) == 0
+
+    assert [jasypt.decrypt(x, b"key") for x in ciphertexts] == ["value-0", "value-1", "value-2"]
+    assert len(jasypt._derived_key_cache) == 2
+    derive_key = jasypt._derive_key
+    calls = []
+    monkeypatch.setattr(jasypt, '_derive_key', lambda *args: calls.append(args) or derive_key(*args))
+    assert jasypt.decrypt(ciphertexts[2], b"key") == "value-2"
+    assert calls == []
+
+
+def test_decrypt_many_matches_decrypt():
+    ciphertexts = [jasypt.encrypt(x, b"key") for x in ["a", "b", "c"]]
+    msgs = ciphertexts + ciphertexts[:1]
+    assert jasypt.decrypt_many(msgs, b"key") == ["a", "b", "c", "a"]
+    assert jasypt.decrypt_many(msgs, b"key", workers=2) == [jasypt.decrypt(x, b"key") for x in msgs]
+
+
+def test_wrong_password_fails():
+    ciphertext = jasypt.encrypt("value", b"key")
+    with pytest.raises(ValueError):
+        for password in [b"other-%d" % i for i in range(50)]:
+            jasypt.decrypt(ciphertext, password)
@@ -0,0 +1,41 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+import benchmarks
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _loaded_lazy_modules(code):
+    '''
+    Runs code in a fresh interpreter and returns the LAZY_MODULES it loaded
+    '''
+    script = f"import sys, json\n{code}\nprint(json.dumps(sorted(sys.modules)))"
+    process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True, cwd=ROOT)
+    modules = json.loads(process.stdout.splitlines()[-1])
+    return [module for module in modules
+            if any(module == lazy or module.startswith(lazy + '.') for lazy in benchmarks.LAZY_MODULES)]
+
+
+@pytest.mark.parametrize('module', ['validate_properties', 'batch_validate', 'api', 'service', 'watch',
+                                    'cdc_compiler', 'rotate_keys'])
+def test_import_loads_no_heavy_module(module):
+    assert _loaded_lazy_modules(f"import {module}") == []
+
+
+def test_validation_without_encrypted_values_loads_no_crypto():
+    code = "import validate_properties\nassert validate_properties.validate_file('properties/test-pipeline.properties')"
+    loaded = _loaded_lazy_modules(code)
+    assert not any(module.split('.')[0] in ('Crypto', 'jasypt') for module in loaded)
+
+
+def test_import_time_benchmark_loads_no_heavy_module():
+    # The time budget is not enforced here, a single cold run on a shared CI runner is too noisy for it:
+    # it is checked by "python benchmarks.py importtime", the best of several runs
+    args = type('Args', (), {'repeat': 1, 'budget_ms': benchmarks.IMPORT_BUDGET_MS})
+    result = benchmarks.bench_importtime(args)
+    assert result['lazy_modules_loaded'] == []
+    assert result['import_ms'] > 0
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+import pytest
+import loader_budget
+from loader_budget import MB
+from strategy_advisor import TableStats
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+HORIZON_START = datetime(2022, 4, 27)
+
+
+def test_task_load():
+    load = loader_budget.task_load("t", "ptr", {'strategy': "partition", 'partitions': 4, 'query_threads': 4},
+                                   {'batch_size_rows': 1000, 'parallelism': 2}, TableStats(10500, 10500 * 100))
+    assert (load.batches, load.rows_in_flight, load.row_bytes) == (6, 6000, 100)
+    assert load.memory == 600000
+    assert load.stage_files == 11
+
+    load = loader_budget.task_load("t", "ptr", {}, {})
+    assert load.batch_size_rows == loader_budget.DEFAULT_BATCH_SIZE_ROWS
+    assert load.batches == 1 + loader_budget.AUTO_PARALLELISM
+    assert load.stage_files is None
+
+
+def test_check_task():
+    load = loader_budget.TaskLoad("t", "ptr", 1000, 4, 1024, rows=2000000)
+    errors, warnings = loader_budget.check_task(load, max_task_memory=1 * MB, max_stage_files=1000)
+    assert len(errors) == 2
+    assert len(warnings) == 1
+    # Tables smaller than a batch are not reported for their small files
+    assert loader_budget.check_task(loader_budget.TaskLoad("t", "ptr", 1000, 4, 1024, rows=10)) == ([], [])
+
+
+def _pipeline(interval, loads):
+    return loader_budget.PipelineResources("p.properties", interval, HORIZON_START, loads)
+
+
+def test_slot_loads_sum_every_resource():
+    first = _pipeline("0 8 * * *", [loader_budget.TaskLoad("a", "ptr", 1000, 2, 10, rows=5000),
+                                    loader_budget.TaskLoad("b", "ptr", 1000, 2, 10)])
+    second = _pipeline("0 8 * * *", [loader_budget.TaskLoad("c", "ptr", 2000, 1, 10, rows=3000)])
+    third = _pipeline("0 9 * * *", [loader_budget.TaskLoad("d", "ptr", 1000, 1, 10, rows=100000)])
+    assert first.weights == {'memory': 40000, 'rows': 4000, 'stage_files': 5}
+
+    slot_load = loader_budget.slot_loads([first, second, third], HORIZON_START, horizon_days=1)
+    assert slot_load.load[datetime(2022, 4, 27, 8)] == {'memory': 60000, 'rows': 6000, 'stage_files': 7}
+    assert slot_load.peak('memory') == 60000
+    assert slot_load.peak('stage_files') == 100
+    assert slot_load.over_budget({'memory': 50000, 'stage_files': 50}) == [
+        (datetime(2022, 4, 27, 8), 'memory', 60000, 50000),
+        (datetime(2022, 4, 27, 9), 'stage_files', 100, 50)]
+    assert slot_load.over_budget({}) == []
+
+
+def test_report_slots_over_budget():
+    pipelines = loader_budget.load_pipelines(
+        [os.path.join(PROPERTIES_DIR, 'test-pipeline.properties')],
+        {'ptr.aap_drive.fact_venta_evento': TableStats(10000000, 10000000 * 200)})
+    slot_load = loader_budget.slot_loads(pipelines, HORIZON_START, horizon_days=2)
+    result = loader_budget.report(pipelines, slot_load, max_slot_memory=10 * MB, max_slot_stage_files=50)
+
+    assert result['peak_slot']['stage_files'] == 100
+    assert [(x['resource'], x['budget']) for x in result['overloaded_slots']] == [('memory', 10), ('stage_files', 50)]
+    assert {x['slot'] for x in result['overloaded_slots']} == {"2022-04-28T00:00:00"}
+
+    result = loader_budget.report(pipelines, slot_load)
+    assert result['overloaded_slots'] == []
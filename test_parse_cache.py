@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import subprocess
+import parse_cache
+import validate_properties
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROPERTIES_DIR = os.path.join(ROOT, 'properties')
+
+
+def test_validator_version_does_not_import_validator_modules():
+    code = ("import sys, parse_cache\nparse_cache.validator_version()\n"
+            "print(any(name in sys.modules for name in parse_cache.VALIDATOR_MODULES))")
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=ROOT)
+    assert process.stdout.strip() == "False"
+
+
+def test_validator_version_hashes_module_sources():
+    assert parse_cache.validator_version() == parse_cache.source_digest(parse_cache.VALIDATOR_MODULES)
+    assert parse_cache.source_digest(['cron']) != parse_cache.source_digest(['cron', 'diagnostics'])
+
+
+def test_entries_round_trip(tmp_path):
+    cache = parse_cache.ParseCache(str(tmp_path))
+    key = cache.key("origins = ptr\n")
+    assert key != cache.key("origins = exadata\n")
+    assert cache.get(key) is None
+
+    report = {'errors': 0, 'warnings': 0, 'truncated': False, 'diagnostics': []}
+    cache.put(key, json.dumps({'origins': "ptr"}), report)
+    assert cache.get(key) == {'properties': {'origins': "ptr"}, 'diagnostics': report}
+
+
+def test_cached_validation_replays_diagnostics(tmp_path, monkeypatch):
+    monkeypatch.setenv(parse_cache.CACHE_ENV_VAR, str(tmp_path))
+    file_path = tmp_path / 'bad.properties'
+    file_path.write_text("origins = ptr\n")
+
+    assert not validate_properties.validate_file(str(file_path))
+    assert len(list(tmp_path.glob('*/*.json'))) == 1
+    # Second run is served from the cache with the same result
+    assert not validate_properties.validate_file(str(file_path))
+
+
+def test_properties_text_to_dict_nests_keys():
+    properties = validate_properties.properties_text_to_dict(
+        "# comment\n[origins]\norigins = ptr\nptr.schemas = a\nptr.a.tables = t\nptr.a.t.strategy = partition\n")
+    assert properties['origins'] == "ptr"
+    assert properties['ptr']['schemas'] == "a"
+    assert properties['ptr']['a']['t'] == {'strategy': "partition"}
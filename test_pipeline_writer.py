@@ -0,0 +1,166 @@
+import os
+import shutil
+import pytest
+import api
+import pipeline_writer
+import validate_properties
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+def _make_directory(path, files):
+    pipeline_writer.write_directory(str(path), files)
+
+
+def _read_directory(path):
+    result = {}
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            with open(file_path) as f:
+                result[os.path.relpath(file_path, path)] = f.read()
+    return result
+
+
+@pytest.fixture
+def result():
+    return api.validate_path(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'))
+
+
+@pytest.mark.parametrize('exchange', [True, False])
+def test_replace_directory(tmp_path, monkeypatch, exchange):
+    if not exchange:
+        monkeypatch.setattr(pipeline_writer, '_exchange', lambda path, other_path: False)
+    _make_directory(tmp_path / 'p', {'a': "old"})
+    _make_directory(tmp_path / '.p.tmp', {'a': "new", 'b': "new"})
+
+    pipeline_writer.replace_directory(str(tmp_path / '.p.tmp'), str(tmp_path / 'p'), str(tmp_path / '.p.old'))
+    assert _read_directory(tmp_path) == {os.path.join('p', 'a'): "new", os.path.join('p', 'b'): "new"}
+
+
+def test_failed_replace_keeps_previous_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_writer, '_exchange', lambda path, other_path: False)
+    _make_directory(tmp_path / 'p', {'a': "old"})
+    _make_directory(tmp_path / '.p.tmp', {'a': "new"})
+    rename = os.rename
+
+    def failing_rename(source, destination):
+        if source.endswith('.tmp'):
+            raise OSError("disk full")
+        rename(source, destination)
+
+    monkeypatch.setattr(os, 'rename', failing_rename)
+    with pytest.raises(OSError):
+        pipeline_writer.replace_directory(str(tmp_path / '.p.tmp'), str(tmp_path / 'p'), str(tmp_path / '.p.old'))
+    assert _read_directory(tmp_path / 'p') == {'a': "old"}
+    assert not os.path.exists(tmp_path / '.p.old')
+
+
+def test_pipeline_directory_writer_matches_in_memory_files(tmp_path, result):
+    pipeline_path = str(tmp_path / 'test-pipeline')
+    for i in range(2):
+        with pipeline_writer.PipelineDirectoryWriter(pipeline_path, pipeline_writer.new_yaml()) as writer:
+            writer.add_files({'schedule_interval': f"@daily-{i}"})
+            writer.add_tasks(result.tasks())
+            writer.commit()
+
+    files = _read_directory(pipeline_path)
+    assert files['schedule_interval'] == "@daily-1"
+    assert {name: content for name, content in files.items() if '/' in name} == \
+        {name: content for name, content in result.files().items() if '/' in name}
+    assert os.listdir(tmp_path) == ['test-pipeline']
+
+
+def test_aborted_write_keeps_previous_pipeline(tmp_path, result):
+    pipeline_path = str(tmp_path / 'test-pipeline')
+    _make_directory(pipeline_path, {'schedule_interval': "@daily"})
+    with pytest.raises(RuntimeError):
+        with pipeline_writer.PipelineDirectoryWriter(pipeline_path, pipeline_writer.new_yaml()) as writer:
+            writer.add_tasks(result.tasks())
+            raise RuntimeError("build failed")
+    assert _read_directory(tmp_path) == {os.path.join('test-pipeline', 'schedule_interval'): "@daily"}
+
+
+def test_incremental_writer_only_writes_changes(tmp_path, result):
+    pipeline_path = str(tmp_path / 'test-pipeline')
+    os.makedirs(pipeline_path)
+    os.makedirs(os.path.join(pipeline_path, 'removed_task'))
+    tasks = result.tasks()
+
+    writer = pipeline_writer.IncrementalPipelineWriter(pipeline_path, pipeline_writer.new_yaml())
+    for task in tasks:
+        writer.add_task(task)
+    assert writer.commit({'tags': "a"}) == (len(tasks), 0, 1)
+
+    writer = pipeline_writer.IncrementalPipelineWriter(pipeline_path, pipeline_writer.new_yaml())
+    for task in tasks:
+        writer.add_task(task)
+    assert writer.commit({'tags': "a"}) == (0, len(tasks), 0)
+    assert pipeline_writer.load_manifest(pipeline_path).keys() == {task.id for task in tasks}
+    assert not any(name.startswith('.') and name != pipeline_writer.MANIFEST_FILE
+                   for name in os.listdir(pipeline_path))
+
+
+@pytest.fixture
+def file_path(tmp_path, monkeypatch):
+    '''
+    Copy of the pipeline sample, pipelines are written under tmp_path
+    '''
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), 'test-pipeline.properties')
+    return 'test-pipeline.properties'
+
+
+def _task_mtimes(pipeline_path):
+    return {entry.name: os.stat(os.path.join(entry.path, 'schedule.yml')).st_mtime_ns
+            for entry in os.scandir(pipeline_path) if entry.is_dir() and not entry.name.startswith('.')}
+
+
+def test_incremental_write_matches_full_write(file_path):
+    assert validate_properties.validate_file(file_path, write=True)
+    shutil.move('pipelines', 'full')
+    assert validate_properties.validate_file(file_path, write=True, incremental=True)
+    assert sorted(_task_mtimes('pipelines/test-pipeline')) == sorted(_task_mtimes('full/test-pipeline'))
+    for name in _task_mtimes('full/test-pipeline'):
+        for task_file in ['environment.yml', 'schedule.yml', 'env']:
+            assert pipeline_writer.read_file(f'pipelines/test-pipeline/{name}/{task_file}') == \
+                pipeline_writer.read_file(f'full/test-pipeline/{name}/{task_file}')
+
+
+def test_incremental_write_only_touches_changed_tasks(file_path):
+    pipeline_path = 'pipelines/test-pipeline'
+    os.makedirs(os.path.join(pipeline_path, 'removed_task'))
+    assert validate_properties.validate_file(file_path, write=True, incremental=True)
+    mtimes = _task_mtimes(pipeline_path)
+    assert 'removed_task' not in mtimes
+    assert pipeline_writer.load_manifest(pipeline_path).keys() == mtimes.keys()
+
+    with open(file_path, 'a') as f:
+        f.write("ptr.aap_drive.fact_estimacion.query_threads = 2\n")
+    assert validate_properties.validate_file(file_path, write=True, incremental=True)
+    new_mtimes = _task_mtimes(pipeline_path)
+    changed = [name for name in mtimes if new_mtimes[name] != mtimes[name]]
+    assert changed == [x for x in mtimes if x.endswith('fact_estimacion')]
+    assert not any(name.startswith('.') and name != pipeline_writer.MANIFEST_FILE
+                   for name in os.listdir(pipeline_path))
+
+
+def test_staging_left_by_crashed_runs_is_swept(tmp_path, result, monkeypatch):
+    monkeypatch.setattr(pipeline_writer, '_process_alive', lambda pid: pid == 1)
+    pipeline_path = str(tmp_path / 'test-pipeline')
+    for name in ['.t.tmp-99999', '.t.old-99999', '.t.tmp-1', f'.t.tmp-{os.getpid()}', '.other']:
+        _make_directory(os.path.join(pipeline_path, name), {'a': "stale"})
+    _make_directory(tmp_path / '.other-pipeline.tmp-99999', {'a': "stale"})
+
+    writer = pipeline_writer.IncrementalPipelineWriter(pipeline_path, pipeline_writer.new_yaml())
+    for task in result.tasks():
+        writer.add_task(task)
+    writer.commit({})
+    # Directories of running processes and other hidden directories are kept
+    assert sorted(x for x in os.listdir(pipeline_path) if x.startswith('.')) == \
+        sorted(['.t.tmp-1', f'.t.tmp-{os.getpid()}', '.other', pipeline_writer.MANIFEST_FILE])
+
+    with pipeline_writer.PipelineDirectoryWriter(pipeline_path, pipeline_writer.new_yaml()) as writer:
+        writer.commit()
+    assert sorted(os.listdir(tmp_path)) == ['test-pipeline']
@@ -0,0 +1,53 @@
+import properties_editor
+
+
+TEXT = """# Pipeline
+[schedule]
+schedule.interval = @daily
+schedule.start_date=2022-04-27T08:00:00
+
+[origins]
+origins = ptr
+ptr.schemas = aap_drive
+ptr.aap_drive.tables = t1,t2
+"""
+
+
+def test_find_properties_spans_values():
+    properties = properties_editor.find_properties(TEXT)
+    assert [key for key, value, start, end in properties] == [
+        'schedule.interval', 'schedule.start_date', 'origins', 'ptr.schemas', 'ptr.aap_drive.tables']
+    for key, value, start, end in properties:
+        assert TEXT[start:end] == value
+
+
+def test_set_properties_keeps_layout():
+    text = properties_editor.set_properties(TEXT, {'schedule.interval': "5 0 * * *"})
+    assert text == TEXT.replace("schedule.interval = @daily", "schedule.interval = 5 0 * * *")
+    assert properties_editor.set_properties(TEXT, {'schedule.interval': "@daily"}) == TEXT
+
+
+def test_set_properties_inserts_after_longest_prefix():
+    text = properties_editor.set_properties(TEXT, {'ptr.aap_drive.t1.strategy': "partition", 'tags': "a"})
+    lines = text.splitlines()
+    assert lines[lines.index("ptr.aap_drive.tables = t1,t2") + 1] == "ptr.aap_drive.t1.strategy = partition"
+    assert lines[-1] == "tags = a"
+
+
+def test_last_line_of_a_key_is_rewritten():
+    text = properties_editor.set_properties("a = 1\na = 2\n", {'a': "3"})
+    assert text == "a = 1\na = 3\n"
+
+
+def test_keys_set_to_none_are_commented_out():
+    text = properties_editor.set_properties("a.x = 1\nb = 2\na.x = 3\n", {'a.x': None, 'a.y': "4", 'c': None})
+    assert text == "# a.x = 1\nb = 2\n# a.x = 3\na.y = 4\n"
+
+
+def test_update_file_only_rewrites_on_change(tmp_path):
+    file_path = tmp_path / 'p.properties'
+    file_path.write_text(TEXT)
+    assert not properties_editor.update_file(str(file_path), {'origins': "ptr"})
+    assert properties_editor.update_file(str(file_path), {'origins': "ptr,exadata"})
+    assert "origins = ptr,exadata\n" in file_path.read_text()
+    assert properties_editor.list_properties_files(str(tmp_path)) == [str(file_path)]
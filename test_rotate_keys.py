@@ -0,0 +1,105 @@
+import pytest
+import jasypt
+import validations
+import validate_properties
+import rotate_keys
+
+
+def _enc(plaintext, key):
+    return f"ENC({jasypt.encrypt(plaintext, key.encode('utf-8')).decode('utf-8')})"
+
+
+def _values(text):
+    return {key: value for key, value, start, end in rotate_keys.properties_editor.find_properties(text)}
+
+
+def _decrypt(value, key):
+    return jasypt.decrypt(rotate_keys.ENCRYPTED_VALUE.search(value).group(1), key.encode('utf-8'))
+
+
+@pytest.fixture
+def file_path(tmp_path):
+    path = tmp_path / 'p.properties'
+    path.write_text(f"""# Pipeline
+[schedule]
+schedule.interval = @daily
+schedule.start_date = 2022-04-27T08:00:00
+
+[origins]
+origins = ptr,exadata
+ptr.decrypt_key = old-ptr
+ptr.password = {_enc("ptr-password", "old-ptr")}
+ptr.schemas = aap_drive
+ptr.aap_drive.tables = t1
+exadata.password = {_enc("exadata-password", "old-global")}
+exadata.schemas = dmcomercial
+exadata.dmcomercial.tables = t2
+""")
+    return str(path)
+
+
+def test_jasypt_round_trip():
+    messages = ["a", "", "ñ" * 40]
+    ciphertexts = jasypt.encrypt_many(messages, b"key")
+    assert len(set(ciphertexts)) == len(messages)
+    assert jasypt.decrypt_many(ciphertexts, b"key") == messages
+    assert [jasypt.decrypt(x, b"key") for x in ciphertexts] == messages
+
+
+def test_find_encrypted_fields(file_path):
+    with open(file_path) as f:
+        fields, values = rotate_keys.find_encrypted_fields(file_path, f.read(), old_key="old-global")
+    assert [(x.key, x.decrypt_key_name, x.old_key) for x in fields] == [
+        ('ptr.password', "ptr.decrypt_key", "old-ptr"),
+        ('exadata.password', "exadata.decrypt_key", "old-global")]
+
+
+def test_rotate_files(file_path):
+    with open(file_path) as f:
+        text = f.read()
+    rotated, errors = rotate_keys.rotate_files([file_path], "new-key", old_key="old-global")
+    assert (rotated, errors) == ([file_path], {})
+
+    with open(file_path) as f:
+        new_text = f.read()
+    values = _values(new_text)
+    assert values['ptr.decrypt_key'] == "new-key"
+    assert _decrypt(values['ptr.password'], "new-key") == "ptr-password"
+    assert _decrypt(values['exadata.password'], "new-key") == "exadata-password"
+    # Layout and every other property are kept
+    assert new_text.splitlines()[:7] == text.splitlines()[:7]
+    assert {k: v for k, v in values.items() if 'password' not in k and 'decrypt_key' not in k} == \
+        {k: v for k, v in _values(text).items() if 'password' not in k and 'decrypt_key' not in k}
+    # The validator decrypts ptr.password with the rotated decrypt_key, and exadata.password
+    # with the new key given to the origin without decrypt_key
+    properties = validate_properties.properties_file_to_dict(file_path)
+    ptr = dict(properties['ptr'])
+    assert validations.decrypt_password(ptr) == []
+    assert ptr['password'] == "ptr-password"
+    exadata = dict(properties['exadata'], decrypt_key="new-key")
+    assert validations.decrypt_password(exadata) == []
+    assert exadata['password'] == "exadata-password"
+
+    # Values already under the new key are left as they are
+    assert rotate_keys.rotate_files([file_path], "new-key", old_key="new-key") == ([], {})
+
+
+def test_file_with_errors_is_not_rewritten(file_path):
+    with open(file_path) as f:
+        text = f.read()
+    rotated, errors = rotate_keys.rotate_files([file_path], "new-key", old_key="wrong-key")
+    assert rotated == []
+    assert errors == {file_path: ["exadata.password: Could not decrypt with 'exadata.decrypt_key'"]}
+    with open(file_path) as f:
+        assert f.read() == text
+
+    rotated, errors = rotate_keys.rotate_files([file_path], "new-key")
+    assert errors == {file_path: ["exadata.password: Encrypted value without a 'exadata.decrypt_key' to decipher it"]}
+
+
+def test_dry_run_does_not_write(file_path):
+    with open(file_path) as f:
+        text = f.read()
+    assert rotate_keys.rotate_files([file_path], "new-key", old_key="old-global", dry_run=True) == ([file_path], {})
+    with open(file_path) as f:
+        assert f.read() == text
@@ -0,0 +1,46 @@
+from datetime import datetime
+import pytest
+import schedule_planner
+
+
+@pytest.mark.parametrize('table_config, concurrency', [
+    ({}, 1),
+    ({'strategy': "default", 'query_threads': 8}, 1),
+    ({'strategy': "partition", 'query_threads': 8, 'partitions': 3}, 3),
+    ({'strategy': "offset_rownum", 'query_threads': 4}, 4),
+])
+def test_task_concurrency(table_config, concurrency):
+    assert schedule_planner.task_concurrency(table_config) == concurrency
+
+
+@pytest.mark.parametrize('interval, offset, shifted', [
+    ("@daily", 15, "15 0 * * *"),
+    ("50 23 * * *", 5, "55 23 * * *"),
+    ("50 23 * * *", 15, None),
+    ("0 * * * *", 30, "30 * * * *"),
+    ("*/5 * * * *", 5, None),
+])
+def test_shift_interval(interval, offset, shifted):
+    assert schedule_planner.shift_interval(interval, offset) == shifted
+
+
+def test_fire_slots_are_rounded():
+    slots = schedule_planner.fire_slots("7 8 * * *", datetime(2022, 1, 1), datetime(2022, 4, 27),
+                                        datetime(2022, 4, 29))
+    assert slots == [datetime(2022, 4, 27, 8, 5), datetime(2022, 4, 28, 8, 5)]
+
+
+def test_plan_staggers_pipelines_over_the_cap():
+    start = datetime(2022, 1, 1, 8)
+    pipelines = [schedule_planner.PipelineLoad(f"p{i}.properties", "0 8 * * *", start, {'ptr': 6})
+                 for i in range(2)]
+    current, planned = schedule_planner.plan(pipelines, datetime(2022, 4, 27), horizon_days=2, caps={'ptr': 10})
+
+    assert current.peak('ptr') == 12
+    assert planned.peak('ptr') == 6
+    assert [x.new_interval for x in pipelines] == [None, "5 8 * * *"]
+    assert planned.overloaded({'ptr': 10}, 10) == []
+
+
+def test_parse_caps():
+    assert schedule_planner.parse_caps(["PTR=4", " exadata = 2"]) == {'ptr': 4, 'exadata': 2}
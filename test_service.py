@@ -0,0 +1,93 @@
+import os
+import json
+import shutil
+import threading
+import http.client
+from urllib.parse import urlencode
+import pytest
+import api
+import service
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+@pytest.fixture
+def directory(tmp_path):
+    directory = tmp_path / 'properties'
+    directory.mkdir()
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), directory / 'test-pipeline.properties')
+    (tmp_path / 'outside.properties').write_text("origins = ptr\n")
+    (tmp_path / 'secret.txt').write_text("secret")
+    os.symlink(tmp_path / 'outside.properties', directory / 'link.properties')
+    return directory
+
+
+@pytest.fixture
+def server(directory):
+    server = service.ValidationServer(("127.0.0.1", 0), api.Validator(), str(directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get(server, path):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request("GET", f"/validate?{urlencode({'path': path})}")
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    return response.status, body
+
+
+def test_properties_path(directory):
+    file_path = str(directory / 'test-pipeline.properties')
+    assert service.properties_path(str(directory), file_path) == os.path.realpath(file_path)
+    for path in [directory.parent / 'outside.properties', directory / 'link.properties',
+                 directory / '..' / 'outside.properties', directory.parent / 'secret.txt', directory]:
+        with pytest.raises(PermissionError):
+            service.properties_path(str(directory), str(path))
+
+
+def test_get_reads_only_the_properties_directory(server, directory):
+    status, body = _get(server, str(directory / 'test-pipeline.properties'))
+    assert status == 200
+    assert body['ok']
+    assert body['name'] == "test-pipeline"
+
+    for path in [directory / '..' / 'secret.txt', directory / 'link.properties', "/etc/passwd"]:
+        status, body = _get(server, str(path))
+        assert status == 403
+    assert _get(server, str(directory / 'missing.properties'))[0] == 404
+
+
+def test_post_validates_text(server):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    with open(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties')) as f:
+        result = service.request_validation(connection, f.read(), "test-pipeline", files=True)
+    connection.close()
+    assert result['ok']
+    assert result['files']['schedule_interval'] == "@daily"
+
+
+def test_check_files_falls_back_in_process(directory):
+    # Nothing listens on port 1
+    assert service.check_files([str(directory / 'test-pipeline.properties')], port=1) == 0
+    assert service.check_files([str(directory.parent / 'outside.properties')], port=1) == 1
+
+
+@pytest.mark.parametrize('body, headers', [
+    (b"origins = \xff\xfe\n", {}),
+    (b"origins = ptr\n", {'Content-Length': "abc"}),
+])
+def test_post_invalid_body_is_rejected(server, body, headers):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.putrequest("POST", "/validate")
+    connection.putheader('Content-Length', headers.get('Content-Length', str(len(body))))
+    connection.endheaders(body)
+    response = connection.getresponse()
+    assert response.status == 400
+    assert 'error' in json.loads(response.read())
+    connection.close()
@@ -0,0 +1,123 @@
+import os
+import json
+import shutil
+import sqlite3
+import pytest
+import strategy_advisor
+from strategy_advisor import ColumnStats, TableStats
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+TABLE_CONFIG = {'strategy': "default", 'query_threads': 1}
+BIG_TABLE = TableStats(40000000, columns={
+    'FECHA_PEDIDO': ColumnStats(3650, "2014-01-01", "2023-12-31"),
+    'ID_CADENA': ColumnStats(4, 1, 16),
+    'CALIDAD': ColumnStats(100000),
+})
+
+
+def test_chunks_by_rows_or_bytes():
+    assert TableStats(10).chunks() == 1
+    assert TableStats(12000000).chunks(chunk_rows=5000000) == 3
+    assert TableStats(10, size=5 * 1024 ** 3).chunks(chunk_bytes=2 * 1024 ** 3) == 3
+
+
+def test_recommend_partition_over_widest_bounded_column():
+    assert strategy_advisor.recommend(TABLE_CONFIG, TableStats(100), 4) == {'strategy': "default", 'query_threads': 1}
+    assert strategy_advisor.recommend(TABLE_CONFIG, BIG_TABLE, 4) == {
+        'strategy': "partition", 'partitions': 8, 'partition_column': "FECHA_PEDIDO", 'query_threads': 4}
+
+
+def test_recommend_offset_without_partition_column():
+    stats = TableStats(40000000, columns={'ID_CADENA': ColumnStats(4, 1, 16)})
+    assert strategy_advisor.recommend(TABLE_CONFIG, stats, 2) == {
+        'strategy': "offset_rownum", 'max_results': 5000000, 'query_threads': 2}
+    config = dict(TABLE_CONFIG, strategy="offset_denserank")
+    assert strategy_advisor.recommend(config, stats, 2)['strategy'] == "offset_denserank"
+
+
+def test_allocate_threads_within_cap():
+    demands = {'a': (40000000, 8), 'b': (10000000, 2), 'c': (100, 1)}
+    threads = strategy_advisor.allocate_threads(demands, 8)
+    assert threads == {'a': 5, 'b': 2, 'c': 1}
+    assert sum(threads.values()) == 8
+    assert strategy_advisor.allocate_threads(demands, 2) == {'a': 1, 'b': 1, 'c': 1}
+
+
+def test_inefficiencies():
+    assert strategy_advisor.inefficiencies(TABLE_CONFIG, TableStats(100)) == []
+    assert strategy_advisor.inefficiencies(TABLE_CONFIG, BIG_TABLE) == [
+        "single query full scan of 40000000 rows, 8 chunks recommended"]
+    config = {'strategy': "partition", 'partitions': 8, 'partition_column': "ID_CADENA", 'query_threads': 10}
+    assert strategy_advisor.inefficiencies(config, BIG_TABLE) == [
+        "partition_column ID_CADENA has 4 distinct values for 8 partitions",
+        "query_threads 10 over 8 partitions"]
+
+
+def test_json_and_sqlite_stats_agree(tmp_path):
+    json_path = tmp_path / 'stats.json'
+    json_path.write_text(json.dumps({'tables': {'PTR.AAP_DRIVE.FACT_VENTA_EVENTO': {
+        'rows': 40000000, 'bytes': 1024,
+        'columns': {'fecha_pedido': {'distinct': 3650, 'min': "2014-01-01", 'max': "2023-12-31"}}}}}))
+
+    sqlite_path = str(tmp_path / 'stats.db')
+    with sqlite3.connect(sqlite_path) as connection:
+        connection.execute("CREATE TABLE table_stats (origin, schema_name, table_name, num_rows, bytes)")
+        connection.execute("CREATE TABLE column_stats (origin, schema_name, table_name, column_name, num_distinct, "
+                           "low_value, high_value)")
+        connection.execute("INSERT INTO table_stats VALUES ('PTR', 'AAP_DRIVE', 'FACT_VENTA_EVENTO', 40000000, 1024)")
+        connection.execute("INSERT INTO column_stats VALUES ('PTR', 'AAP_DRIVE', 'FACT_VENTA_EVENTO', 'FECHA_PEDIDO', "
+                           "3650, '2014-01-01', '2023-12-31')")
+    connection.close()
+
+    for stats in [strategy_advisor.load_stats(str(json_path)), strategy_advisor.load_stats(sqlite_path)]:
+        table = stats['ptr.aap_drive.fact_venta_evento']
+        assert (table.rows, table.size) == (40000000, 1024)
+        column = table.columns['FECHA_PEDIDO']
+        assert (column.distinct, column.low, column.high) == (3650, "2014-01-01", "2023-12-31")
+
+
+def test_advise_file(tmp_path):
+    file_path = str(tmp_path / 'test-pipeline.properties')
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), file_path)
+    stats = {'ptr.aap_drive.fact_venta_evento': BIG_TABLE, 'ptr.aap_drive.fact_estimacion': TableStats(100)}
+
+    result = strategy_advisor.advise_file(file_path, stats, {'ptr': 6}, 4)
+    tables = {x['table']: x for x in result['tables']}
+    assert tables.keys() == set(stats)
+    assert tables['ptr.aap_drive.fact_venta_evento']['recommended']['strategy'] == "partition"
+    assert tables['ptr.aap_drive.fact_venta_evento']['updates']['ptr.aap_drive.fact_venta_evento.partitions'] == 8
+    assert 'ptr.aap_drive.fact_venta_evento.partition_column' not in \
+        tables['ptr.aap_drive.fact_venta_evento']['updates']
+    assert tables['ptr.aap_drive.fact_estimacion']['recommended'] == {'strategy': "default", 'query_threads': 1}
+    assert result['concurrency']['ptr']['cap'] == 6
+    assert 'ptr.aap_drive.fact_art_no_nuevo' in result['missing_stats']
+    assert result['concurrency']['exadata']['cap'] == 4
+
+
+def test_apply_comments_out_settings_of_previous_strategy(tmp_path):
+    file_path = str(tmp_path / 'test-pipeline.properties')
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), file_path)
+    with open(file_path, 'a') as f:
+        f.write("ptr.aap_drive.fact_estimacion.strategy = offset_rownum\n"
+                "ptr.aap_drive.fact_estimacion.max_results = 1000\n")
+    # Partition to default, offset to partition
+    stats = {'ptr.aap_drive.fact_venta_evento': TableStats(100), 'ptr.aap_drive.fact_estimacion': BIG_TABLE}
+
+    result = strategy_advisor.advise_file(file_path, stats, {}, 4)
+    updates = {}
+    for table in result['tables']:
+        updates.update(table['updates'])
+    assert strategy_advisor.properties_editor.update_file(file_path, updates)
+
+    with open(file_path) as f:
+        lines = f.read().splitlines()
+    assert "# ptr.aap_drive.fact_venta_evento.partition_column = FECHA_PEDIDO" in lines
+    assert "# ptr.aap_drive.fact_venta_evento.partitions = 5" in lines
+    assert "# ptr.aap_drive.fact_estimacion.max_results = 1000" in lines
+    result = strategy_advisor.advise_file(file_path, stats, {}, 4)
+    assert [table['updates'] for table in result['tables']] == [{}, {}]
+    configs = {x['table']: x['current'] for x in result['tables']}
+    assert configs['ptr.aap_drive.fact_venta_evento'] == {'strategy': "default", 'query_threads': 1}
+    assert configs['ptr.aap_drive.fact_estimacion']['strategy'] == "partition"
@@ -0,0 +1,90 @@
+import os
+import shutil
+import pytest
+import task_index
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    '''
+    Copy of the pipeline sample, paths relative to tmp_path as in the git name-status list
+    '''
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('properties')
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), 'properties/a.properties')
+    return 'properties'
+
+
+@pytest.mark.parametrize('args, changes', [
+    ([], []),
+    (["M", "properties/a.properties", "D", "properties/b.properties"],
+     [("M", "properties/a.properties"), ("D", "properties/b.properties")]),
+    (["R100", "properties/a.properties", "properties/b.properties", "M", "properties/c.properties"],
+     [("D", "properties/a.properties"), ("A", "properties/b.properties"), ("M", "properties/c.properties")]),
+    (["C75", "properties/a.properties", "properties/b.properties", "A", "properties/c.properties"],
+     [("A", "properties/b.properties"), ("A", "properties/c.properties")]),
+])
+def test_parse_name_status(args, changes):
+    assert task_index.parse_name_status(args) == changes
+
+
+def test_parse_name_status_missing_rename_target():
+    with pytest.raises(ValueError):
+        task_index.parse_name_status(["R100", "properties/a.properties"])
+
+
+def test_update_file_skips_unchanged_digest(directory, monkeypatch):
+    index = task_index.TaskIndex()
+    assert index.update_file('properties/a.properties')
+    assert len(index.files['properties/a.properties']['tasks']) > 0
+
+    monkeypatch.setattr(task_index, 'file_tasks', lambda file_path, text: pytest.fail("file validated again"))
+    assert not index.update_file('properties/a.properties')
+
+
+def test_rename_drops_old_path(directory):
+    index_path = '.task_index.json'
+    assert task_index.check_changes([], index_path, directory) == 0
+
+    os.rename('properties/a.properties', 'properties/b.properties')
+    changes = task_index.parse_name_status(["R100", "properties/a.properties", "properties/b.properties"])
+    assert task_index.check_changes(changes, index_path, directory) == 0
+    assert list(task_index.TaskIndex.load(index_path).files) == ['properties/b.properties']
+
+
+def test_duplicate_task_ids_are_reported(directory):
+    index_path = '.task_index.json'
+    task_index.check_changes([], index_path, directory)
+    shutil.copy('properties/a.properties', 'properties/b.properties')
+
+    assert task_index.check_changes([("A", "properties/b.properties")], index_path, directory) == 0
+    index = task_index.TaskIndex.load(index_path)
+    conflicts = index.conflicts('properties/b.properties')
+    assert len(conflicts) > 0
+    assert {x['kind'] for x in conflicts} == {'duplicate_id'}
+    assert all(x['files'] == ['properties/a.properties'] for x in conflicts)
+    # Only strict checks fail on them
+    assert task_index.check_changes([("M", "properties/b.properties")], index_path, directory, strict=True) == 1
+
+
+def test_only_changed_files_are_read(directory, monkeypatch):
+    index_path = '.task_index.json'
+    shutil.copy('properties/a.properties', 'properties/b.properties')
+    task_index.check_changes([], index_path, directory)
+    os.remove('properties/b.properties')
+    with open('properties/a.properties', 'a') as f:
+        f.write("tags = changed\n")
+
+    opened = []
+    update_file = task_index.TaskIndex.update_file
+    monkeypatch.setattr(task_index.TaskIndex, 'update_file',
+                        lambda self, file_path: opened.append(file_path) or update_file(self, file_path))
+    task_index.check_changes([("M", "properties/a.properties")], index_path, directory)
+    assert opened == ['properties/a.properties']
+    # Files not in the changes are trusted, resync drops the deleted one
+    assert sorted(task_index.TaskIndex.load(index_path).files) == ['properties/a.properties', 'properties/b.properties']
+    task_index.check_changes([], index_path, directory, resync=True)
+    assert list(task_index.TaskIndex.load(index_path).files) == ['properties/a.properties']
@@ -0,0 +1,55 @@
+from datetime import datetime
+import task_model
+import validate_properties
+
+
+def _tables():
+    snowflake = {'prefix': "PTR", 'batch_size_rows': 100}
+    return [
+        ("PTR", "aap_drive", "t1", {'fields': ["A", "B"], 'strategy': "default", 'replication_method': "FULL_TABLE",
+                                    'query_threads': 1}, snowflake),
+        ("PTR", "aap_drive", "t2", {'fields': ["*"], 'strategy': "default", 'replication_method': "FULL_TABLE",
+                                    'query_threads': 1}, snowflake),
+    ]
+
+
+def test_freeze_and_thaw_round_trip():
+    value = ["a", ["b", 1]]
+    frozen = task_model.freeze(value)
+    assert frozen == ("a", ("b", 1))
+    assert task_model.thaw(frozen) == value
+
+
+def test_interner_shares_equal_settings():
+    interner = task_model.Interner()
+    first = interner.items([('a', [1, 2]), ('b', "x")])
+    assert interner.items([('a', [1, 2]), ('b', "x")]) is first
+    assert interner.items([('a', {'unhashable': 1})]) == (('a', {'unhashable': 1}),)
+
+
+def test_iter_tasks_builds_documents():
+    schedule = {'name': "p", 'transform': "skip", 'interval': "@daily", 'start_date': datetime(2022, 4, 27, 8)}
+    tasks = list(validate_properties.iter_tasks(_tables(), schedule))
+    assert [task.id for task in tasks] == ["ptr_aap_drive_t1", "ptr_aap_drive_t2"]
+    # Tasks with the same settings share them
+    assert tasks[0].metadata is tasks[1].metadata
+    assert tasks[0].loader_config is tasks[1].loader_config
+
+    environment, schedule_document = tasks[0].documents()
+    extractor = environment['environments'][0]['config']['plugins']['extractors'][0]
+    assert extractor['name'] == "tap-ptr"
+    assert extractor['select'] == ["AAP_DRIVE-T1.A", "AAP_DRIVE-T1.B"]
+    assert extractor['config'] == {'filter_schemas': "AAP_DRIVE", 'query_threads': 1}
+    assert extractor['metadata'] == {'AAP_DRIVE-T1': {'strategy': "default", 'replication-method': "FULL_TABLE"}}
+    assert environment['environments'][0]['config']['plugins']['loaders'] == [
+        {'name': "target-snowflake", 'config': {'prefix': "PTR", 'batch_size_rows': 100}}]
+    assert schedule_document == {'schedules': [dict(schedule, name="ptr_aap_drive_t1", extractor="tap-ptr",
+                                                    loader="target-snowflake")]}
+
+
+def test_equal_tasks_are_equal():
+    schedule = {'interval': "@daily"}
+    first = list(validate_properties.iter_tasks(_tables(), schedule))
+    second = list(validate_properties.iter_tasks(_tables(), schedule))
+    assert first == second
+    assert len({*first, *second}) == 2
@@ -0,0 +1,114 @@
+from datetime import datetime, timezone, timedelta
+import pytest
+import dateutil.parser
+import benchmarks
+import validate_properties
+from diagnostics import Diagnostics
+
+
+# Tables of the last schema break every kind of table validation
+BROKEN_LINES = [
+    "ptr.schema_1.table_0.query_threads = -1",
+    "ptr.schema_1.table_1.strategy = bogus",
+    "ptr.schema_1.table_2.strategy = partition",
+    "ptr.schema_1.table_3.replication_method = INCREMENTAL",
+    "ptr.schema_1.table_4.max_results = many",
+    "ptr.schema_1.table_5.snowflake.batch_size_rows = x",
+    "ptr.schema_1.table_6.snowflake.stage_type = s3",
+    "ptr.schema_1.table_7.unknown_key = 1",
+    "ptr.schema_1.table_8.fields =",
+]
+
+
+def _validate(text, min_tables, monkeypatch):
+    monkeypatch.setattr(validate_properties, 'COLUMNAR_MIN_TABLES', min_tables)
+    properties = validate_properties.properties_text_to_dict(text)
+    diagnostics = Diagnostics()
+    errors, warnings, tables, base_schedule, tags = validate_properties.validate_properties_dict(
+        properties, "columnar", diagnostics=diagnostics)
+    tables = [(origin, schema, table, table_config, dict(table_snowflake))
+              for origin, schema, table, table_config, table_snowflake in tables]
+    return diagnostics.report(), tables, base_schedule, tags
+
+
+@pytest.mark.parametrize('broken', [False, True])
+def test_columnar_matches_table_by_table(broken, monkeypatch):
+    text = benchmarks.generate_properties(origins=1, schemas=2, tables=validate_properties.COLUMNAR_MIN_TABLES + 4,
+                                          encrypted=False)
+    if broken:
+        text += "\n".join(BROKEN_LINES) + "\n"
+
+    columnar = _validate(text, 1, monkeypatch)
+    table_by_table = _validate(text, 10 ** 9, monkeypatch)
+    assert columnar == table_by_table
+    assert (columnar[0]['errors'] > 0) is broken
+
+
+@pytest.mark.parametrize('date_str, expected', [
+    ("2023-07-01T10:07:00+02:00", datetime(2023, 7, 1, 10, 7, tzinfo=timezone(timedelta(hours=2)))),
+    ("2023-07-01 10:07:00-03:30", datetime(2023, 7, 1, 10, 7, tzinfo=timezone(-timedelta(hours=3, minutes=30)))),
+    ("2023-01-01T10:03", datetime(2023, 1, 1, 10, 3)),
+    ("2023-01-01 10:03", datetime(2023, 1, 1, 10, 3)),
+    ("2023-01-01", datetime(2023, 1, 1)),
+    ("2023-06-30T23:59:59.999999", datetime(2023, 6, 30, 23, 59, 59, 999999)),
+])
+def test_parse_datetime_iso(date_str, expected):
+    result = validate_properties._parse_datetime(date_str)
+    assert result == expected
+    assert result.utcoffset() == expected.utcoffset()
+
+
+@pytest.mark.parametrize('date_str', benchmarks.DATE_SAMPLES)
+def test_parse_datetime_matches_dateutil(date_str):
+    try:
+        expected = dateutil.parser.parse(date_str)
+    except ValueError:
+        with pytest.raises(ValueError):
+            validate_properties._parse_datetime(date_str)
+        return
+    result = validate_properties._parse_datetime(date_str)
+    assert result == expected
+    assert result.utcoffset() == expected.utcoffset()
+
+
+class _NoIsoDatetime(datetime):
+    '''
+    datetime whose fromisoformat rejects everything, as Python 3.9 does with 'Z' or '+0100'
+    '''
+
+    @classmethod
+    def fromisoformat(cls, date_str):
+        raise ValueError(f"Invalid isoformat string: {date_str!r}")
+
+
+@pytest.mark.parametrize('date_str', ["2023-01-01T10:07:00Z", "2023-07-01T10:07:00-0330", "2023-01-01 10:03"])
+def test_parse_datetime_falls_back_to_dateutil(date_str, monkeypatch):
+    monkeypatch.setattr(validate_properties, 'datetime', _NoIsoDatetime)
+    assert validate_properties._parse_datetime(date_str) == dateutil.parser.parse(date_str)
+
+
+@pytest.mark.parametrize('date_str', ["20230101", "Jan 5 2023 10:03", "2023/01/05 10:03"])
+def test_non_iso_dates_skip_fast_path(date_str, monkeypatch):
+    monkeypatch.setattr(validate_properties, 'datetime', None)
+    assert validate_properties._parse_datetime(date_str) == dateutil.parser.parse(date_str)
+
+
+def test_parse_date_is_cached_and_bounded(monkeypatch):
+    monkeypatch.setattr(validate_properties, 'PARSED_DATE_CACHE_SIZE', 2)
+    validate_properties.clear_parsed_date_cache()
+    first = validate_properties.parse_date("2023-01-01T10:03")
+    assert validate_properties.parse_date("2023-01-01T10:03") is first
+    assert first == benchmarks._reference_parse_date("2023-01-01T10:03")
+    for date_str in ["2023-01-02", "2023-01-03", "2023-01-04"]:
+        validate_properties.parse_date(date_str)
+    assert list(validate_properties._parsed_date_cache) == ["2023-01-03", "2023-01-04"]
+    validate_properties.clear_parsed_date_cache()
+
+
+def test_value_replacing_nested_levels():
+    assert validate_properties.properties_text_to_dict("x.a.b = 1\nx.a = 2\nx.c = 3\n") == {'x': {'a': 2, 'c': 3}}
+    assert validate_properties.properties_text_to_dict("x.a.b = 1\nx.a.b = 2\nx.a.c = 3\n") == \
+        {'x': {'a': {'b': 2, 'c': 3}}}
+    # As the line by line parser did, a key below a replaced level fails instead of losing values
+    with pytest.raises(TypeError):
+        validate_properties.properties_text_to_dict("x.a.b.c = 1\nx.a = 2\nx.a.b.d = 3\n")
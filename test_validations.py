@@ -0,0 +1,54 @@
+import pytest
+import validations
+import validate_properties
+
+
+def test_depends_on_orders_keys_before_their_readers():
+    config_keys = {
+        'partitions': (validations.depends_on('strategy')(lambda x: x.get('strategy') == "partition"), int, None,
+                       None, None),
+        'strategy': (False, str, lambda x: x.strip().lower(), None, "default"),
+    }
+    schema = validations.compile_schema(config_keys)
+    assert schema.keys == ('strategy', 'partitions')
+
+    errors, warnings = schema.validate({'strategy': " PARTITION "})
+    assert errors == ["Required key 'partitions' is missing from config"]
+
+
+def test_dependencies_of_every_callable_are_followed():
+    config_keys = {
+        'b': (False, str, None, validations.depends_on('a')(lambda x: True), None),
+        'a': (False, str, None, None, None),
+    }
+    assert validations.compile_schema(config_keys).keys == ('a', 'b')
+
+
+def test_dependency_on_unknown_key_fails_at_compile_time():
+    config_keys = {'partitions': (validations.depends_on('strateg')(lambda x: True), int, None, None, None)}
+    with pytest.raises(ValueError, match="strateg"):
+        validations.compile_schema(config_keys)
+
+
+def test_circular_dependency_fails_at_compile_time():
+    config_keys = {
+        'a': (validations.depends_on('b')(lambda x: False), str, None, None, None),
+        'b': (validations.depends_on('a')(lambda x: False), str, None, None, None),
+    }
+    with pytest.raises(ValueError, match="Circular"):
+        validations.compile_schema(config_keys)
+
+
+@pytest.mark.parametrize('config', [
+    {'strategy': "partition", 'partitions': "4", 'partition_column': " FECHA "},
+    {'strategy': "offset_rownum"},
+    {'replication_method': "incremental", 'query_threads': "-1"},
+    {'strategy': "unknown", 'fields': "A,B"},
+])
+def test_compiled_schema_matches_interpreted_validation(config):
+    compiled_config = dict(config)
+    interpreted_config = dict(config)
+    compiled = validate_properties.ORACLE_SCHEMA.validate(compiled_config)
+    interpreted = validations._validate_keys_config(interpreted_config, validate_properties.ORACLE_CONFIG_KEYS)
+    assert compiled == interpreted
+    assert compiled_config == interpreted_config
@@ -0,0 +1,100 @@
+import os
+import shutil
+import pytest
+import validate_properties
+import watch
+
+
+PROPERTIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties')
+
+
+@pytest.fixture
+def file_path(tmp_path):
+    path = str(tmp_path / 'test-pipeline.properties')
+    shutil.copy(os.path.join(PROPERTIES_DIR, 'test-pipeline.properties'), path)
+    return path
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    '''
+    Arguments of every validate_file call, validation itself still runs
+    '''
+    calls = []
+    validate_file = validate_properties.validate_file
+
+    def recording_validate_file(file_path, **kwargs):
+        calls.append(kwargs)
+        return validate_file(file_path, **kwargs)
+
+    monkeypatch.setattr(validate_properties, 'validate_file', recording_validate_file)
+    return calls
+
+
+def _append(file_path, text):
+    with open(file_path, 'a') as f:
+        f.write(text)
+
+
+def test_unchanged_properties_are_not_revalidated(file_path, calls):
+    properties_watch = watch.PropertiesWatch(os.path.dirname(file_path))
+    assert properties_watch.validate(file_path) is True
+    assert properties_watch.validate(file_path) is None
+
+    _append(file_path, "\n# Only a comment\n\n")
+    assert properties_watch.validate(file_path) is None
+    assert len(calls) == 1
+
+    _append(file_path, "tags = extra\n")
+    assert properties_watch.validate(file_path) is True
+    assert len(calls) == 2
+
+
+def test_parsed_properties_and_index_are_handed_to_validation(file_path, calls):
+    properties_watch = watch.PropertiesWatch(os.path.dirname(file_path))
+    properties_watch.validate(file_path)
+
+    digest, properties, index = properties_watch._files[file_path]
+    assert calls[0]['properties'] is properties
+    assert calls[0]['index'] is index
+    # Validation leaves the cached properties as parsed
+    assert properties == validate_properties.properties_file_to_dict(file_path)
+
+
+def test_ko_files_are_revalidated(file_path, calls):
+    properties_watch = watch.PropertiesWatch(os.path.dirname(file_path))
+    _append(file_path, "origins = unknown\n")
+    assert properties_watch.validate(file_path) is False
+    assert properties_watch.validate(file_path) is False
+    assert len(calls) == 2
+    assert file_path not in properties_watch._files
+
+
+def test_deleted_file_is_forgotten(file_path):
+    properties_watch = watch.PropertiesWatch(os.path.dirname(file_path))
+    properties_watch.validate(file_path)
+    os.remove(file_path)
+    assert properties_watch.validate(file_path) is None
+    assert properties_watch._files == {}
+
+
+def test_polling_watcher_reports_changed_files(tmp_path, file_path):
+    watcher = watch.PollingWatcher(str(tmp_path), interval=0.01)
+    assert watcher.wait(0.05) == set()
+
+    _append(file_path, "# changed size\n")
+    (tmp_path / 'notes.txt').write_text("ignored")
+    (tmp_path / 'new.properties').write_text("origins = ptr\n")
+    assert watcher.wait(0.05) == {file_path, str(tmp_path / 'new.properties')}
+
+
+def test_wait_burst_collects_until_quiet():
+    class ListWatcher:
+        def __init__(self, events):
+            self.events = events
+
+        def wait(self, timeout=None):
+            return self.events.pop(0) if self.events else set()
+
+    watcher = ListWatcher([{'a.properties'}, {'b.properties'}, set(), {'c.properties'}])
+    assert watch.wait_burst(watcher, debounce=0) == {'a.properties', 'b.properties'}
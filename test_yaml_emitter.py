@@ -0,0 +1,92 @@
+import io
+import os
+import glob
+from datetime import date, datetime
+import pytest
+import api
+import yaml_emitter
+import pipeline_writer
+
+
+PROPERTIES_FILES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'properties',
+                                                 '*.properties')))
+
+# Scalars ruamel quotes, resolves as another type, folds or rejects as plain
+EDGE_SCALARS = [
+    "yes", "no", "on", "Off", "true", "null", "~", "", " ", "1e3", "1.0", "0o17", "0x1F", "1_000", ".inf",
+    "2022-04-27", "12:30", ":", "a: b", "a:b", "x #y", "#x", "*alias", "&anchor", "!tag", "%x", "@x", "`x",
+    "- x", "-", "? x", "|", ">", "[a]", "{a}", "'", '"', "it's", "a,b", " leading", "trailing ",
+    "line\nbreak", "tab\tx", "é", "x_y", "x-y", "X_1.0", "a" * 90,
+    None, True, False, 0, -1, 1.5, 1e20, date(2022, 4, 27), datetime(2022, 4, 27, 8, 0),
+]
+
+
+def _dump(yaml, document):
+    stream = io.StringIO()
+    yaml.dump(document, stream)
+    return stream.getvalue()
+
+
+@pytest.fixture(scope='module')
+def ruamel_yaml():
+    return pipeline_writer.new_yaml(template=False)
+
+
+@pytest.mark.parametrize('file_path', PROPERTIES_FILES, ids=os.path.basename)
+def test_task_documents_match_ruamel(file_path, ruamel_yaml):
+    emitter = yaml_emitter.TemplateEmitter()
+    result = api.validate_path(file_path)
+    assert result.ok
+    for task in result.tasks():
+        for document in task.documents():
+            assert _dump(emitter, document) == _dump(ruamel_yaml, document)
+
+
+@pytest.mark.parametrize('value', EDGE_SCALARS, ids=repr)
+def test_edge_scalars_match_ruamel(value, ruamel_yaml):
+    emitter = yaml_emitter.TemplateEmitter()
+    documents = [
+        {'key': value},
+        {'plugins': {'extractors': [{'name': value, 'config': {'value': value}}]}},
+        {'list': [value, "x", value]},
+    ]
+    if isinstance(value, str):
+        documents.append({value: "x", 'other': 1})
+    # Twice, the second time from the memoized renderings
+    for i in range(2):
+        for document in documents:
+            assert _dump(emitter, document) == _dump(ruamel_yaml, document)
+
+
+def test_memo_keeps_types_apart(ruamel_yaml):
+    emitter = yaml_emitter.TemplateEmitter()
+    for value in [1, "1", True, "True", None, "None", 1.0, "1.0"]:
+        assert _dump(emitter, {'k': value}) == _dump(ruamel_yaml, {'k': value})
+
+
+def test_memo_reset(monkeypatch, ruamel_yaml):
+    monkeypatch.setattr(yaml_emitter, 'MAX_MEMO_SIZE', 2)
+    emitter = yaml_emitter.TemplateEmitter()
+    for value in EDGE_SCALARS * 2:
+        assert _dump(emitter, {'k': value}) == _dump(ruamel_yaml, {'k': value})
+    assert len(emitter._values) <= 2
+
+
+SHARED_DATE = date(2022, 4, 27)
+SHARED_LIST = ["a_b"]
+SHARED_MAPPING = {'k': "x_y"}
+
+
+@pytest.mark.parametrize('document', [
+    {'start': SHARED_DATE, 'end': SHARED_DATE},
+    {'a': SHARED_LIST, 'b': [SHARED_LIST]},
+    {'a': SHARED_MAPPING, 'b': [SHARED_MAPPING]},
+    {'a': SHARED_MAPPING, 'b': SHARED_MAPPING, 'c': [1]},
+    {'nested': [[1, 2], {'k': [None, "-", "x_y"]}]},
+    {'long': " ".join(["word"] * 30)},
+    {'k' * 130: 1},
+    {'empty': {}, 'list': [], 'set': {1, 2}},
+])
+def test_fallback_documents_match_ruamel(document, ruamel_yaml):
+    emitter = yaml_emitter.TemplateEmitter()
+    assert _dump(emitter, document) == _dump(ruamel_yaml, document)
@@ -1,15 +1,21 @@
 import sys
 import os
 import re
+import json
 import logging
-import shutil
-import pendulum
-import copy
-from ruamel.yaml import YAML
+import time
 from datetime import datetime
-import dateutil.parser as parser
+from collections import OrderedDict
 #from inditex_commons import validations
 import validations
+import config_index
+import task_model
+import cron
+import pipeline_writer
+import instrumentation
+import parse_cache
+from diagnostics import Diagnostics, TooManyErrors, CASTED, INVALID_ORIGIN, MISSING_SECTION
+from diagnostics import ERROR, WARNING, diagnostics_from_environment, write_diagnostics
 
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] - [%(levelname)s] - %(message)s')
@@ -37,27 +43,13 @@ def is_valid_cron_schedule(x):
 
 
 def is_valid_cron_every(x):
-    reg_exp = r'(@every (\d+(ns|us|µs|ms|s|m|h))+)'
-    return bool(re.search(reg_exp, x))
-
-
-def is_valid_cron_code(cron):
-    # Simplified CRON: accepts * or a valid digit
-    # base_reg_exp = r'^((((\d+,)+\d+|(\d+(\/|-)\d+)|\d+|\*) ?))$'
-    base_reg_exp = r'^(\d|\*)$'
-    digits = ['[1-5]?[0-9]',
-              '2[0-3]|1[0-9]|[0-9]',
-              '3[01]|[12][0-9]|[1-9]',
-              '1[0-2]|[1-9]',
-              '[0-6]']
-    values = [x.strip() for x in cron.split(' ')]
-    if len(values) != 5:
-        return False
-    for i in range(5):
-        if bool(re.search(base_reg_exp.replace('\d', digits[i]), values[i])):
-            continue
-        return False
-    return True
+    return cron.is_valid_every(x)
+
+
+def is_valid_cron_code(cron_code):
+    # Cron codes are parsed with the grammar compiled in cron module:
+    # lists, ranges and steps are accepted ('0,30', '1-5', '*/5')
+    return cron.is_valid_code(cron_code)
 
 
 def is_valid_cron(x):
@@ -86,20 +78,66 @@ def round_to_minute(minute, round_to=5):
     return (round_to * ((minute + round_to - 1) // round_to)) % 60
 
 
+# Timezone of schedule dates, resolved once
+TIMEZONE = 'Europe/Madrid'
+_timezone = None
+
+# ISO 8601 dates parsed without dateutil: date, optional time and UTC offset
+ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?)?(Z|[+-]\d{2}(:?\d{2})?)?$')
+
+# Bounded LRU cache of parsed dates keyed by start_date string, many pipelines share a few dates
+PARSED_DATE_CACHE_SIZE = 1024
+_parsed_date_cache = OrderedDict()
+
+
+# pendulum and dateutil are only imported when a date is handled
+def _get_timezone():
+    global _timezone
+    if _timezone is None:
+        import pendulum
+
+        _timezone = pendulum.timezone(TIMEZONE)
+    return _timezone
+
+
 def localize_date(date, round_minute=True):
     if round_minute:
         date = date.replace(minute=round_to_minute(date.minute, round_to=5), second=0, microsecond=0)
-    return date.astimezone(pendulum.timezone('Europe/Madrid'))
+    return date.astimezone(_get_timezone())
+
+
+def _parse_datetime(date_str):
+    # Fast path for ISO 8601, anything else (or invalid) is parsed by dateutil as before
+    if ISO_DATE.match(date_str):
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
+    import dateutil.parser as parser
+
+    return parser.parse(date_str)
+
+
+def clear_parsed_date_cache():
+    _parsed_date_cache.clear()
 
 
 def parse_date(date_str):
-    return localize_date(parser.parse(date_str))
+    date = _parsed_date_cache.get(date_str)
+    if date is None:
+        date = localize_date(_parse_datetime(date_str))
+        _parsed_date_cache[date_str] = date
+        while len(_parsed_date_cache) > PARSED_DATE_CACHE_SIZE:
+            _parsed_date_cache.popitem(last=False)
+    else:
+        _parsed_date_cache.move_to_end(date_str)
+    return date
 
 
 # Schedule validations
 SCHEDULE_CONFIG_KEYS = {
     'interval': (True, str, lambda x: x.strip(), lambda x: is_valid_cron(x), None),
-    'start_date': (False, str, lambda x: parse_date(x), None, localize_date(datetime.now()))
+    'start_date': (False, str, lambda x: parse_date(x), None, lambda x: localize_date(datetime.now()))
 }
 
 # Tags validations
@@ -138,21 +176,30 @@ VALID_REPLICATION = [
     'INCREMENTAL'
 ]
 
+# Loader plugin for every task
+LOADER_NAME = "target-snowflake"
+
 # Extractor specific fields
 METADATA_FIELDS = {'replication_method', 'replication_key', 'encrypt_columns', 'additional_filters',
                    'strategy', 'partitions', 'partition_columns', 'max_results'}
 
+# Conditions of the keys only required by some replication methods or strategies
+_incremental_replication = validations.depends_on('replication_method')(
+    lambda x: x.get('replication_method', "") == "INCREMENTAL")
+_partition_strategy = validations.depends_on('strategy')(lambda x: x.get('strategy', "") == "partition")
+_offset_strategy = validations.depends_on('strategy')(lambda x: bool(re.match(r'offset_.*', x.get('strategy', ""))))
+
 ORACLE_CONFIG_KEYS = {
-    'query_threads': (False, int, None, lambda x: x > 0, 1),
+    'query_threads': (False, int, None, validations.positive, 1),
     'fields': (False, str, lambda x: get_list_from_string_commas(x), None, ["*"]),
-    'replication_method': (False, str, lambda x: x.strip().upper(), lambda x: x in VALID_REPLICATION, "FULL_TABLE"),
-    'replication_key': (lambda x: x.get('replication_method', "") == "INCREMENTAL", str, lambda x: x.strip().upper(), None, None),
+    'replication_method': (False, str, lambda x: x.strip().upper(), validations.one_of(VALID_REPLICATION), "FULL_TABLE"),
+    'replication_key': (_incremental_replication, str, lambda x: x.strip().upper(), None, None),
     'additional_filters': (False, str, lambda x: x.strip(), None, None),
     'encrypt_columns': (False, str, lambda x: get_list_from_string_commas(x), None, None),
-    'strategy': (False, str, lambda x: x.strip().lower(), lambda x: x in VALID_STRATEGIES, "default"),
-    'partitions': (lambda x: x.get('strategy', "") == "partition", int, None, lambda x: x > 0, None),
-    'partition_column': (lambda x: x.get('strategy', "") == "partition", str, lambda x: x.strip(), None, None),
-    'max_results': (lambda x: bool(re.match(r'offset_.*', x.get('strategy', ""))), int, None, lambda x: x > 0, None),
+    'strategy': (False, str, lambda x: x.strip().lower(), validations.one_of(VALID_STRATEGIES), "default"),
+    'partitions': (_partition_strategy, int, None, validations.positive, None),
+    'partition_column': (_partition_strategy, str, lambda x: x.strip(), None, None),
+    'max_results': (_offset_strategy, int, None, validations.positive, None),
 }
 
 # Snowflake validations
@@ -162,17 +209,66 @@ VALID_STAGE_TYPES = [
     'snowflake']
 
 SNOWFLAKE_CONFIG_KEYS = {
-    'batch_size_rows': (False, int, None, lambda x: x > 0, None),
-    'parallelism': (False, int, None, lambda x: x > 0, None),
+    'batch_size_rows': (False, int, None, validations.positive, None),
+    'parallelism': (False, int, None, validations.positive, None),
     'add_metadata_columns': (False, bool, None, None, None),
     'primary_key_required': (False, bool, None, None, None),
     'no_compression': (False, bool, None, None, None),
-    'stage_type': (False, str, lambda x: x.strip().lower(), lambda x: x in VALID_STAGE_TYPES, None),
+    'stage_type': (False, str, lambda x: x.strip().lower(), validations.one_of(VALID_STAGE_TYPES), None),
     'prefix': (False, str, lambda x: x.strip().upper(), None, None),
     'wait_to_load': (False, bool, None, None, None),
     'clean_stage': (False, bool, None, None, None)
 }
 
+# Schemas with at least this number of tables are validated key by key across all tables
+COLUMNAR_MIN_TABLES = 16
+
+# Compiled validation plans, built once at import time
+SCHEDULE_SCHEMA = validations.compile_schema(SCHEDULE_CONFIG_KEYS)
+TAG_SCHEMA = validations.compile_schema(TAG_CONFIG_KEYS)
+ORIGINS_SCHEMA = validations.compile_schema(ORIGINS_CONFIG_KEYS)
+ORIGIN_SCHEMA = validations.compile_schema(ORIGIN_CONFIG_KEYS)
+SCHEMA_SCHEMA = validations.compile_schema(SCHEMA_CONFIG_KEYS)
+ORACLE_SCHEMA = validations.compile_schema(ORACLE_CONFIG_KEYS)
+SNOWFLAKE_SCHEMA = validations.compile_schema(SNOWFLAKE_CONFIG_KEYS)
+
+
+# A property line: not a comment, key up to the first '=', value up to end of line.
+# [section] and blank lines have no '=' and are skipped
+PROPERTY_LINE = re.compile(r'^(?!#)([^=\n]*)=([^\n]*)$', re.MULTILINE)
+
+
+def properties_text_to_dict(text):
+    '''
+    Loads the properties found in a properties file content into a dict, see properties_file_to_dict
+
+    :param text: str with properties file content
+    :return: dict with properties read
+    '''
+    props = {}
+    # Nested dict of each already seen key prefix, 'a.b' -> props['a']['b']
+    levels = {}
+    for k, v in PROPERTY_LINE.findall(text):
+        k = k.strip()
+        prefix, sep, key = k.rpartition('.')
+        level = levels.get(prefix) if sep else props
+        if level is None:
+            level = props
+            for i in prefix.split('.'):
+                if i not in level:
+                    level[i] = {}
+                level = level[i]
+            levels[prefix] = level
+
+        # A value replacing a nested dict, forget its cached levels, cached or not itself
+        if isinstance(level.get(key), dict):
+            for cached in [x for x in levels if x == k or x.startswith(k + '.')]:
+                del levels[cached]
+
+        level[key] = parse_value(v.strip())
+
+    return props
+
 
 def properties_file_to_dict(filepath):
     '''
@@ -186,27 +282,8 @@ def properties_file_to_dict(filepath):
     :param filepath: path of input file
     :return: dict with properties read
     '''
-
-    props = {}
     with open(filepath) as f:
-        for line in f:
-            line = line.rstrip()  # removes trailing whitespace and '\n' chars
-
-            if line.startswith("#") or "=" not in line:
-                continue
-
-            k, v = (x.strip() for x in line.split("=", 1))
-            k = k.split('.')
-
-            level = props
-            for i in k[:-1]:
-                if i not in level:
-                    level[i] = {}
-                level = level[i]
-
-            level[k[-1]] = parse_value(v)
-
-    return props
+        return properties_text_to_dict(f.read())
 
 
 def merge_dicts(*dict_args):
@@ -220,20 +297,6 @@ def merge_dicts(*dict_args):
     return result
 
 
-def override_dict(old_config, new_config):
-    '''
-    Creates a new dict based on old_config which
-    upserts (update,create) keys in old_config with new_config
-
-    :param old_config: base dict
-    :param new_config: dict to merge with
-    :return:
-    '''
-    merged = copy.deepcopy(old_config)
-    merged.update(new_config)
-    return merged
-
-
 def uniquify(seq):
     '''
     Removes duplicates of a list preserving the original order
@@ -246,25 +309,6 @@ def uniquify(seq):
     return [x for x in seq if not (x in seen or seen_add(x))]
 
 
-def fetch_from_config(key, config):
-    '''
-    Returns a tuple of selected key, and 'snowflake' key
-
-    :param key: key to extract from dict
-    :param config: dict to search
-    :return: a tuple consisting of:
-                selected key from config, empty dict if does not exist
-                snowflake key from config, empty dict if does not exist
-                tags key from config, empty dict if does not exist
-    '''
-    properties = config.get(key.lower(), {})
-    snowflake = properties.get('snowflake', {})
-    if 'snowflake' in properties:
-        del properties['snowflake']
-
-    return properties, snowflake
-
-
 def parse_value(value):
     '''
     Parses a string value to data type
@@ -277,7 +321,8 @@ def parse_value(value):
         if value.isdigit():
             return int(value)
         else:
-            return True if value.lower() == "true" else False if value.lower() == "false" else value
+            lower = value.lower()
+            return True if lower == "true" else False if lower == "false" else value
 
 def parse_values_from_dict(keylist, obj):
     '''
@@ -294,12 +339,92 @@ def parse_values_from_dict(keylist, obj):
     return output
 
 
-def validate_and_check_config(errors, warnings, config, config_keys, config_name="", filter_keys=False):
-    new_errors, new_warnings = validations.validate_config(config, config_keys, filter_keys=filter_keys)
-    if len(new_warnings) > 0:
-        warnings[config_name] = new_warnings
-    if len(new_errors) > 0:
-        errors[config_name] = new_errors
+def iter_tasks(tables, base_schedule):
+    '''
+    Builds the task records of a pipeline, one task at a time, so they can be written
+    as soon as they are built. Names and settings repeated across tasks are shared
+
+    :param tables: list of (origin, schema, table, table_config, table_snowflake) tuples,
+                   where table_snowflake is a ChainMap with the inherited snowflake layers
+    :param base_schedule: validated schedule dict, shared by every task
+    :return: generator of task_model.TaskRecord
+    '''
+    interner = task_model.Interner()
+    for origin, schema, table, table_config, table_snowflake in tables:
+        # Identifiers for this task
+        stream_name = interner.name(f"{schema.upper()}-{table.upper()}")
+        id_name = interner.name(f"{origin.lower()}_{schema.lower()}_{table.lower()}")
+
+        fields = ()
+        config = []
+        metadata = []
+        for k in table_config:
+            # select fields
+            if k == 'fields':
+                fields = task_model.freeze(table_config.get(k))
+            # metadata
+            # special encrypt_fields
+            elif k in METADATA_FIELDS:
+                new_key = k
+                if "replication_" in k:
+                    new_key = k.replace('_', '-')
+                metadata.append((new_key, table_config.get(k)))
+            # config
+            else:
+                config.append((k, table_config.get(k)))
+
+        # Loader flattens inherited snowflake config
+        yield task_model.TaskRecord(id_name, interner.name(f"tap-{origin.lower()}"), interner.name(schema.upper()),
+                                    stream_name, fields, interner.items(config), interner.items(metadata),
+                                    LOADER_NAME, interner.items(dict(table_snowflake).items()), base_schedule)
+
+
+def validate_and_check_config(diagnostics, config, config_keys, config_path="", filter_keys=False,
+                              stats=instrumentation.NULL_STATS):
+    '''
+    Validates a config in place, adding its errors and warnings to diagnostics under config_path
+
+    :raise diagnostics.TooManyErrors: if the maximum number of errors is reached
+    '''
+    first = len(diagnostics.entries)
+    validations.validate_config(config, config_keys, filter_keys=filter_keys,
+                                report=diagnostics.reporter(config_path))
+    if stats.enabled:
+        stats.count('configs_validated')
+        stats.count('casts', sum(1 for x in diagnostics.entries[first:] if x.code == CASTED))
+
+
+def validate_tables_columnar(diagnostics, index, schema_path, table_names, stats=instrumentation.NULL_STATS):
+    '''
+    Validates every table of a schema key by key with validations.validate_columns, adding
+    their errors and warnings to diagnostics in the same order as validating them one by one
+
+    :param index: config_index.ConfigIndex of the properties
+    :param schema_path: level path of the schema
+    :param table_names: list of table names of the schema
+    :raise diagnostics.TooManyErrors: if the maximum number of errors is reached
+    :return: list of validated (table, table_path, table_config, table_snowflake) tuples
+    '''
+    table_paths = [schema_path + (table.lower(),) for table in table_names]
+    table_configs = [index.config(table_path) for table_path in table_paths]
+    table_snowflakes = [index.config(table_path, 'snowflake') for table_path in table_paths]
+    config_reports = validations.validate_columns(table_configs, ORACLE_SCHEMA)
+    snowflake_reports = validations.validate_columns(table_snowflakes, SNOWFLAKE_SCHEMA)
+
+    add = diagnostics.add
+    for table_path, config_report, snowflake_report in zip(table_paths, config_reports, snowflake_reports):
+        table_name = ".".join(table_path)
+        for level, key, code, message in config_report:
+            add(level, table_name, key, code, message)
+        for level, key, code, message in snowflake_report:
+            add(level, f"{table_name}.snowflake", key, code, message)
+
+    if stats.enabled:
+        stats.count('configs_validated', 2 * len(table_paths))
+        stats.count('tables_columnar', len(table_paths))
+        stats.count('casts', sum(1 for report in config_reports + snowflake_reports
+                                 for entry in report if entry[2] == CASTED))
+    return list(zip(table_names, table_paths, table_configs, table_snowflakes))
 
 
 def log_errors(errors, warnings):
@@ -315,199 +440,271 @@ def log_errors(errors, warnings):
     return False
 
 
-def validate_file(file_path, write=False):
-    yaml = YAML()
-
-    # Get from input parameter
-    # properties_parser [file_name]
-    if not os.path.exists(file_path):
-        logger.error(f"File {file_path} doesn't exists")
-        sys.exit(1)
-    file_name = os.path.basename(file_path).split('.')[0]
-    logger.info(f"Successfully read file {file_path}")
-
-    # Get properties dict from file
-    properties = properties_file_to_dict(file_path)
-
-    # Schedule, environment YAMLs base objects
-    schedule = dict()
-    schedule['schedules'] = []
-    environment = dict()
-    environment['environments'] = []
-
+def validate_properties_dict(properties, file_name, stats=instrumentation.NULL_STATS, diagnostics=None, index=None):
+    '''
+    Validates every level of a properties dict, applying casts, transformations and defaults in place
+
+    :param properties: dict as returned by properties_file_to_dict
+    :param file_name: pipeline name, base name of the properties file
+    :param stats: instrumentation.Stats collecting time per level and counters
+    :param diagnostics: diagnostics.Diagnostics collecting every error and warning, a new one by default
+    :param index: config_index.ConfigIndex of properties, built from them by default
+    :raise diagnostics.TooManyErrors: if diagnostics reaches its maximum number of errors
+    :return: a tuple consisting of:
+                errors dict with config path ('ptr.aap_drive.snowflake') -> list of errors
+                warnings dict with config path -> list of warnings
+                list of validated (origin, schema, table, table_config, table_snowflake) tuples
+                validated schedule dict shared by every task
+                list of tags
+    '''
     # Base schedule dict for schedule YAML
     base_schedule = {'name': file_name, 'transform': 'skip'}
 
-    # Base environment dict for schedule YAML
-    base_environment = {'name': file_name, 'config': {'plugins': {}}}
-
-    # Base extractor plugin
-    base_extractor = {'name': "", 'config': {}, 'select': [], 'metadata': {}}
-
-    # Base loader plugin
-    base_loader = {'name': "target-snowflake", 'config': {}}
-
-    base_environment['config']['plugins']['extractors'] = [base_extractor]
-    base_environment['config']['plugins']['loaders'] = [base_loader]
-
     # Properties levels:
     #   Global -> Origin -> Schema -> Table
+    # Each level is validated on a copy of its own values, properties are left untouched
+    if index is None:
+        index = config_index.ConfigIndex.from_properties(properties)
+    # Validated level -> (config, sections), snowflake settings are resolved from them
+    validated = {}
+
+    if diagnostics is None:
+        diagnostics = Diagnostics()
+    with stats.stage('validate_global'):
+        global_config = index.config(())
+        validate_and_check_config(diagnostics, global_config, TAG_SCHEMA, "tags", stats=stats)
+        validate_and_check_config(diagnostics, global_config, ORIGINS_SCHEMA, "origins", stats=stats)
+        tags = global_config.get('tags', [])
+        origins = global_config.get('origins', [])
+
+        # Schedule must be defined in properties file
+        if ('schedule',) not in index:
+            diagnostics.error("schedule", None, MISSING_SECTION, "No schedule is defined")
+        else:
+            base_schedule = merge_dicts(base_schedule, index.values(('schedule',)))
+            validate_and_check_config(diagnostics, base_schedule, SCHEDULE_SCHEMA, "schedule", stats=stats)
 
-    errors, warnings = {}, {}
-    validate_and_check_config(errors, warnings, properties, TAG_CONFIG_KEYS, "tags")
-    validate_and_check_config(errors, warnings, properties, ORIGINS_CONFIG_KEYS, "origins")
-    tags = properties.get('tags', [])
-    origins = properties.get('origins', [])
-
-    # Schedule must be defined in properties file
-    if 'schedule' not in properties:
-        errors['schedule'] = ['No schedule is defined']
-
-    base_schedule = override_dict(base_schedule, properties.get('schedule'))
-    validate_and_check_config(errors, warnings, base_schedule, SCHEDULE_CONFIG_KEYS, "schedule")
-
-    global_snowflake = properties.get('snowflake', {})
-    validate_and_check_config(errors, warnings, global_snowflake, SNOWFLAKE_CONFIG_KEYS, "snowflake", filter_keys=True)
+        global_snowflake = index.config((), 'snowflake')
+        validate_and_check_config(diagnostics, global_snowflake, SNOWFLAKE_SCHEMA, "snowflake", filter_keys=True,
+                                  stats=stats)
+        validated[()] = (global_config, {'snowflake': global_snowflake})
 
-    write_environments = {}
-    write_schedules = {}
-    task_ids = {}
+    # Validated tables, task documents are built later from them one at a time
+    tables = []
 
     for origin in origins:
 
         if origin.lower() not in VALID_ORIGINS:
-            errors['origins'] = [f"'{origin}' is not a valid origin, accepted origins are: {VALID_ORIGINS}"]
+            diagnostics.error("origins", "origins", INVALID_ORIGIN,
+                              f"'{origin}' is not a valid origin, accepted origins are: {VALID_ORIGINS}")
             continue
 
-        origin_config, origin_snowflake = fetch_from_config(origin, properties)
-        validate_and_check_config(errors, warnings, origin_config, ORIGIN_CONFIG_KEYS, origin)
-        validate_and_check_config(errors, warnings, origin_snowflake, SNOWFLAKE_CONFIG_KEYS, f"{origin}_snowflake", filter_keys=True)
+        with stats.stage('validate_origin'):
+            origin_path = index.path(origin)
+            origin_name = origin_path[0]
+            origin_config = index.config(origin_path)
+            origin_snowflake = index.config(origin_path, 'snowflake')
+            validate_and_check_config(diagnostics, origin_config, ORIGIN_SCHEMA, origin_name, stats=stats)
+            validate_and_check_config(diagnostics, origin_snowflake, SNOWFLAKE_SCHEMA, f"{origin_name}.snowflake", filter_keys=True,
+                                      stats=stats)
+            validated[origin_path] = (origin_config, {'snowflake': origin_snowflake})
         tags += [origin]
-        origin_snowflake = override_dict(global_snowflake, origin_snowflake)
         schemas = origin_config.get('schemas', [])
 
         for schema in schemas:
-            schema_config, schema_snowflake = fetch_from_config(schema, origin_config)
-            validate_and_check_config(errors, warnings, schema_config, SCHEMA_CONFIG_KEYS, f"{origin}_{schema}")
-            validate_and_check_config(errors, warnings, schema_snowflake, SNOWFLAKE_CONFIG_KEYS, f"{origin}_{schema}_snowflake", filter_keys=True)
+            with stats.stage('validate_schema'):
+                schema_path = origin_path + (schema.lower(),)
+                schema_name = ".".join(schema_path)
+                schema_config = index.config(schema_path)
+                schema_snowflake = index.config(schema_path, 'snowflake')
+                validate_and_check_config(diagnostics, schema_config, SCHEMA_SCHEMA, schema_name, stats=stats)
+                validate_and_check_config(diagnostics, schema_snowflake, SNOWFLAKE_SCHEMA, f"{schema_name}.snowflake", filter_keys=True,
+                                          stats=stats)
+                validated[schema_path] = (schema_config, {'snowflake': schema_snowflake})
             tags += [schema]
-            schema_snowflake = override_dict(origin_snowflake, schema_snowflake)
-            tables = schema_config.get('tables', [])
+            table_names = schema_config.get('tables', [])
+
+            if len(table_names) >= COLUMNAR_MIN_TABLES:
+                with stats.stage('validate_table'):
+                    for table, table_path, table_config, table_snowflake in validate_tables_columnar(
+                            diagnostics, index, schema_path, table_names, stats=stats):
+                        validated[table_path] = (table_config, {'snowflake': table_snowflake})
+                        tags += [table]
+                        tables.append((origin, schema, table, table_config, table_path))
+                continue
 
-            for table in tables:
-                table_config, table_snowflake = fetch_from_config(table, schema_config)
-                validate_and_check_config(errors, warnings, table_config, ORACLE_CONFIG_KEYS, f"{origin}_{schema}_{table}", filter_keys=True)
-                validate_and_check_config(errors, warnings, table_snowflake, SNOWFLAKE_CONFIG_KEYS, f"{origin}_{schema}_snowflake", filter_keys=True)
+            for table in table_names:
+                start = time.perf_counter() if stats.enabled else None
+                table_path = schema_path + (table.lower(),)
+                table_name = ".".join(table_path)
+                table_config = index.config(table_path)
+                table_snowflake = index.config(table_path, 'snowflake')
+                validate_and_check_config(diagnostics, table_config, ORACLE_SCHEMA, table_name, filter_keys=True,
+                                          stats=stats)
+                validate_and_check_config(diagnostics, table_snowflake, SNOWFLAKE_SCHEMA, f"{table_name}.snowflake", filter_keys=True,
+                                          stats=stats)
+                validated[table_path] = (table_config, {'snowflake': table_snowflake})
                 tags += [table]
-                table_snowflake = override_dict(schema_snowflake, table_snowflake)
-
-                # Identifiers for this task
-                stream_name = f"{schema.upper()}-{table.upper()}"
-                id_name = f"{origin.lower()}_{schema.lower()}_{table.lower()}"
-
-                # Create environment for task
-                task_environment = override_dict(base_environment, {'name': id_name})
-
-                # Create loader for task
-                task_loader = copy.deepcopy(base_loader)
-                task_loader['config'] = table_snowflake
-
-                # Create extractor for task
-                task_extractor = {}
-                task_extractor['name'] = f"tap-{origin.lower()}"
-                task_extractor['config'] = {}
-                task_extractor['config']['filter_schemas'] = schema.upper()
-                task_extractor['select'] = []
-                task_extractor['metadata'] = {}
-                task_extractor['metadata'][stream_name] = {}
-
-                for k in table_config:
-                    # select fields
-                    if k == 'fields':
-                        fields = [f"{stream_name}.{field}" for field in table_config.get(k)]
-                        for field in fields:
-                            task_extractor['select'].append(field)
-                    # metadata
-                    # special encrypt_fields
-                    elif k in METADATA_FIELDS:
-                        new_key = k
-                        if "replication_" in k:
-                            new_key = k.replace('_', '-')
-                        task_extractor['metadata'][stream_name][new_key] = table_config.get(k)
-                    # config
-                    else:
-                        task_extractor['config'][k] = table_config.get(k)
-
-                # Set extractor/loader in environment YAML
-                task_environment['config']['plugins']['extractors'] = [override_dict(base_extractor, task_extractor)]
-                task_environment['config']['plugins']['loaders'] = [task_loader]
-                environment['environments'] = [task_environment]
-
-
-                # Set schedule YAML for task
-                task_schedule = {}
-                task_schedule['name'] = id_name
-                task_schedule['extractor'] = task_extractor['name']
-                task_schedule['loader'] = task_loader['name']
-                schedule['schedules'] = [override_dict(base_schedule, task_schedule)]
-
-                path = f"pipelines/{file_name}/{id_name}"
-                write_environments[path] = copy.deepcopy(environment)
-                write_schedules[path] = copy.deepcopy(schedule)
-                task_ids[path] = id_name
-
-    if log_errors(errors, warnings):
+                tables.append((origin, schema, table, table_config, table_path))
+                if stats.enabled:
+                    elapsed = time.perf_counter() - start
+                    stats.stages['validate_table'] += elapsed
+                    stats.table(f"{origin.lower()}_{schema.lower()}_{table.lower()}", elapsed)
+
+    # Effective snowflake settings of each table, layered over its schema, origin and global ones
+    validated_index = config_index.ConfigIndex(validated)
+    tables = [(origin, schema, table, table_config, validated_index.resolve(table_path, 'snowflake'))
+              for origin, schema, table, table_config, table_path in tables]
+    # Shallow copies of the levels validated, they replace the deep copies of the whole config
+    stats.count('copies', index.copies)
+
+    return diagnostics.messages(ERROR), diagnostics.messages(WARNING), tables, base_schedule, tags
+
+
+def pipeline_files(base_schedule, tags):
+    '''
+    :return: dict with file name -> content of the files at the root of a pipeline directory
+    '''
+    return {
+        'schedule_interval': f"{base_schedule['interval']}",
+        'schedule_start': f"{base_schedule['start_date'].isoformat()}",
+        'tags': ",".join(uniquify(tags))
+    }
+
+
+def validate_file(file_path, write=False, incremental=False, stats=None, yaml_workers=1, diagnostics=None,
+                  properties=None, index=None):
+    '''
+    Validates a properties file and, if requested, writes its pipeline files
+
+    Instrumentation is enabled with instrumentation.STATS_ENV_VAR (JSON report with time
+    per stage, counters and slowest tables) and instrumentation.PROFILE_ENV_VAR (cProfile dump).
+    Errors and warnings are written as a JSON report to diagnostics.DIAGNOSTICS_ENV_VAR, if set
+
+    :param file_path: path of input properties file
+    :param write: write pipeline files under pipelines/<file_name> if file is valid
+    :param incremental: only rewrite the tasks whose content changed since last write
+    :param stats: instrumentation.Stats to fill, by default enabled from environment
+    :param yaml_workers: worker processes serializing task YAML files when writing
+    :param diagnostics: diagnostics.Diagnostics to fill, by default limited by diagnostics.MAX_ERRORS_ENV_VAR
+    :param properties: dict already parsed from the file content, the file is read and parsed by default
+    :param index: config_index.ConfigIndex of properties, built from them by default
+    :return: True if properties file is OK, False if it is KO
+    '''
+    file_name = os.path.basename(file_path).split('.')[0]
+    if stats is None:
+        stats = instrumentation.stats_from_environment()
+    if diagnostics is None:
+        diagnostics = diagnostics_from_environment()
+
+    with instrumentation.profile_from_environment(file_name):
+        result = _validate_file(file_path, file_name, write, incremental, stats, yaml_workers, diagnostics,
+                                properties, index)
+
+    instrumentation.write_stats(stats, file_name, file=file_path, ok=result)
+    write_diagnostics(diagnostics, file_name, file=file_path, ok=result)
+    return result
+
+
+def _validate_file(file_path, file_name, write, incremental, stats, yaml_workers, diagnostics, properties=None,
+                   index=None):
+    yaml = pipeline_writer.new_yaml() if write else None
+
+    # Get from input parameter
+    # properties_parser [file_name]
+    if not os.path.exists(file_path):
+        logger.error(f"File {file_path} doesn't exists")
+        sys.exit(1)
+    logger.info(f"Successfully read file {file_path}")
+
+    # Get properties dict from file, or from the parse cache if file content is unchanged
+    cache, cached = None, None
+    if properties is None:
+        with stats.stage('parse'):
+            with open(file_path) as f:
+                text = f.read()
+            cache = parse_cache.cache_from_environment()
+            cache_key = cache.key(text) if cache is not None else None
+            cached = cache.get(cache_key) if cache is not None else None
+
+            if cached is not None:
+                stats.count('cache_hits')
+                # Validation result is already known, only writing needs the validated properties
+                if not write:
+                    diagnostics.replay(cached['diagnostics'])
+                    if diagnostics.log():
+                        logger.info(f"Properties file {file_path} is KO (cached)")
+                        return False
+                    logger.info(f"Properties file {file_path} is OK (cached)")
+                    return True
+                properties = cached['properties']
+            else:
+                properties = properties_text_to_dict(text)
+
+    try:
+        errors, warnings, tables, base_schedule, tags = validate_properties_dict(properties, file_name, stats=stats,
+                                                                                 diagnostics=diagnostics, index=index)
+    except TooManyErrors:
+        # Fail fast, the file is KO whatever the rest of it
+        diagnostics.log()
         logger.info(f"Properties file {file_path} is KO")
-        return
+        return False
+
+    if cache is not None and cached is None:
+        # Validation leaves properties as parsed
+        cache.put(cache_key, json.dumps(properties), diagnostics.report())
+
+    if diagnostics.log():
+        logger.info(f"Properties file {file_path} is KO")
+        return False
 
     logger.info(f"Properties file {file_path} is OK")
 
-    if write:
+    if write and incremental:
+        logger.info(f"Writing changed files for pipeline {file_name}...")
+        pipeline_path = f"pipelines/{file_name}"
+        os.makedirs(pipeline_path, exist_ok=True)
+        writer = pipeline_writer.IncrementalPipelineWriter(pipeline_path, yaml, stats=stats)
+        try:
+            for task in stats.timed_iter(iter_tasks(tables, base_schedule), 'build'):
+                start = time.perf_counter() if stats.enabled else None
+                writer.add_task(task)
+                stats.count('tasks')
+                if stats.enabled:
+                    stats.table(task.id, time.perf_counter() - start)
+            with stats.stage('write'):
+                written, unchanged, deleted = writer.commit(pipeline_files(base_schedule, tags))
+            logger.info(f"Pipeline {file_name}: {written} tasks written, {unchanged} unchanged, {deleted} deleted")
+        except Exception as ex:
+            logger.error(f"Error found when writing file: {ex}")
+            logger.info(f"Staged tasks will be deleted, tasks not swapped yet keep their previous files")
+            writer.abort()
+            return False
+
+    elif write:
         logger.info(f"Writing files for pipeline {file_name}...")
-        # If pipeline already exists, delete first, then write
+        # Pipeline is written aside and swapped into place, previous files are kept if anything fails
         pipeline_path = f"pipelines/{file_name}"
-        if os.path.exists(pipeline_path):
-            shutil.rmtree(pipeline_path)
-        os.makedirs(pipeline_path)
+        os.makedirs("pipelines", exist_ok=True)
+        writer = pipeline_writer.PipelineDirectoryWriter(pipeline_path, yaml, yaml_workers=yaml_workers, stats=stats)
 
         try:
-            # Write schedule
-            with open(f"{pipeline_path}/schedule_interval", 'w') as f:
-                f.write(f"{base_schedule['interval']}")
-
-            with open(f"{pipeline_path}/schedule_start", 'w') as f:
-                f.write(f"{base_schedule['start_date'].isoformat()}")
-            logger.info("Schedule files created OK")
-
-            # Write tags
-            tags = ",".join(uniquify(tags))
-            with open(f"{pipeline_path}/tags", 'w') as f:
-                f.write(f"{tags}")
-            logger.info("Tag file created OK")
-
-            # Write all environments
-            # Create output path
-            for path in task_ids:
-                os.makedirs(path, exist_ok=True)
-
-                # Write environment.yml
-                with open(f"{path}/environment.yml", 'w') as f:
-                    yaml.dump(write_environments[path], f)
-
-                # Write schedule.yml
-                with open(f"{path}/schedule.yml", 'w') as f:
-                    yaml.dump(write_schedules[path], f)
-
-                # Write meltano environment id as environment variable
-                with open(f"{path}/env", 'w') as f:
-                    f.write(f"export MELTANO_ENVIRONMENT={task_ids[path]}")
-
-                logger.info(f"Task {task_ids[path]} created OK")
+            with writer:
+                # Write schedule and tags
+                writer.add_files(pipeline_files(base_schedule, tags))
+
+                # Write all environments, as soon as each batch of tasks is built
+                tasks = writer.add_tasks(stats.timed_iter(iter_tasks(tables, base_schedule), 'build'))
+                stats.count('tasks', tasks)
+
+                writer.commit()
+            logger.info(f"Pipeline {file_name}: {tasks} tasks written")
         except Exception as ex:
             logger.error(f"Error found when writing file: {ex}")
-            logger.info(f"Files created will be deleted to avoid inconsistent state")
-            if os.path.exists(pipeline_path):
-                shutil.rmtree(pipeline_path)
+            logger.info(f"Staged files will be deleted, previous pipeline directory is kept")
+            return False
+
+    return True
 
 
 def main():
@@ -1,7 +1,11 @@
 import re
-import inspect
-import jasypt
 import exceptions
+import diagnostics
+from diagnostics import ERROR, WARNING
+
+
+# Suffix of the warning added when a value is casted to its expected type
+CAST_WARNING = ", value was casted successfully"
 
 
 def raise_(ex):
@@ -15,6 +19,63 @@ CAST_EXPRESSION = {
 }
 
 
+# Above this number of values, vectorizable predicates use NumPy if it is installed
+NUMPY_MIN_VALUES = 4096
+
+_numpy = None
+
+
+def _get_numpy():
+    """ NumPy module, False if it is not installed. It is optional and only imported for large columns """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+
+class Positive:
+    """ Validation checking x > 0, which can also check a whole column of ints at once """
+
+    def __call__(self, x):
+        return x > 0
+
+    def many(self, values):
+        """ :return: list of bool, x > 0 for each value """
+        numpy = _get_numpy() if len(values) >= NUMPY_MIN_VALUES else False
+        if numpy:
+            try:
+                return (numpy.fromiter(values, dtype=numpy.int64, count=len(values)) > 0).tolist()
+            except (OverflowError, TypeError, ValueError):
+                pass
+        return [x > 0 for x in values]
+
+
+class OneOf:
+    """ Validation checking x is one of the given values, with set membership """
+
+    def __init__(self, values):
+        self.values = frozenset(values)
+
+    def __call__(self, x):
+        return x in self.values
+
+    def many(self, values):
+        """ :return: list of bool, x in values for each value """
+        members = self.values
+        return [x in members for x in values]
+
+
+positive = Positive()
+
+
+def one_of(values):
+    return OneOf(values)
+
+
 def decrypt_password(config, password_key="password", decrypt_key="decrypt_key"):
     # Decrypt password if encrypted
     errors, warnings = [], []
@@ -24,6 +85,9 @@ def decrypt_password(config, password_key="password", decrypt_key="decrypt_key")
                 errors.append(f"Provided a encrypted password but not a key to decipher it")
             else:
                 try:
+                    # Crypto is only imported when an encrypted value is found
+                    import jasypt
+
                     text = re.search(r'ENC\((.*?)\)', config[password_key]).group(1)
                     config[password_key] = jasypt.decrypt(text, config[decrypt_key].encode('utf-8'))
                 except Exception as ex:
@@ -64,7 +128,7 @@ def _validate_keys_config(config, config_keys):
                 error_string = f"Provided key '{key}' with type {type(config[key])}, it should be {data_type}"
                 try:
                     config[key] = CAST_EXPRESSION[data_type](config[key])
-                    warnings.append(error_string + ", value was casted successfully")
+                    warnings.append(error_string + CAST_WARNING)
                 except KeyError as ex:
                     errors.append(error_string + ", this value type cast is not defined")
                     continue
@@ -102,24 +166,366 @@ def _validate_keys_config(config, config_keys):
     return errors, warnings
 
 
-def validate_config(config, config_keys={}, password_decrypt=False, password_fields=[], filter_keys=True):
+def depends_on(*keys):
+    """
+    Declares the keys of the config read by a required/transformation/validation/default callable,
+    so compiled schemas process them first: depends_on('strategy')(lambda x: x.get('strategy') == "partition")
+    """
+    def declare(function):
+        function.depends_on = frozenset(keys)
+        return function
+    return declare
+
+
+def _sort_dependencies(config_keys):
+    """ Orders keys so that keys declared with depends_on are processed first, otherwise keeps schema order """
+    keys = list(config_keys)
+    depends = {}
+    for key in keys:
+        depends[key] = set()
+        for function in config_keys[key]:
+            declared = getattr(function, 'depends_on', None) if _is_callable(function) else None
+            if declared is None:
+                continue
+            unknown = declared.difference(config_keys)
+            if len(unknown) > 0:
+                raise ValueError(f"Key '{key}' depends on keys not in the schema: {sorted(unknown)}")
+            depends[key] |= declared - {key}
+
+    ordered = []
+    while len(keys) > 0:
+        ready = [key for key in keys if depends[key].isdisjoint(keys)]
+        if len(ready) == 0:
+            raise ValueError(f"Circular dependency between keys {keys}")
+        ordered.append(ready[0])
+        keys.remove(ready[0])
+    return ordered
+
+
+def _compile_key(key, required, data_type, transformation, validation, default):
+    """ Builds the validation step of a single key, skipping the stages that do nothing """
+    required_function = required if _is_callable(required) else None
+    transformation = transformation if _is_callable(transformation) else None
+    validation = validation if _is_callable(validation) else None
+    default_function = default if _is_callable(default) else None
+    cast = CAST_EXPRESSION.get(data_type, None)
+
+    missing_error = f"Required key '{key}' is missing from config"
+    empty_error = f"Required key '{key}' can't be empty"
+    type_error = f", it should be {data_type}"
+
+    def step(config, report):
+        # Required field
+        is_required = required
+        if required_function is not None:
+            try:
+                is_required = required_function(config)
+            except Exception as ex:
+                report(ERROR, key, diagnostics.REQUIRED_FAILED,
+                       f"Exception when determining if key '{key}' is a required field: {ex}")
+                return
+        if is_required is True:
+            value = config.get(key, None)
+            if value is None:
+                report(ERROR, key, diagnostics.MISSING, missing_error)
+            elif value == "":
+                report(ERROR, key, diagnostics.EMPTY, empty_error)
+
+        # If not required, it may not be in the config
+        if key in config:
+            # Check data type
+            if not isinstance(config[key], data_type):
+                error_string = f"Provided key '{key}' with type {type(config[key])}" + type_error
+                if cast is None:
+                    report(ERROR, key, diagnostics.CAST_UNDEFINED, error_string + ", this value type cast is not defined")
+                    return
+                try:
+                    config[key] = cast(config[key])
+                    report(WARNING, key, diagnostics.CASTED, error_string + CAST_WARNING)
+                except KeyError:
+                    report(ERROR, key, diagnostics.CAST_UNDEFINED, error_string + ", this value type cast is not defined")
+                    return
+                except Exception:
+                    report(ERROR, key, diagnostics.CAST_FAILED, error_string + ", value could not be casted")
+                    return
+
+            # Apply transformation
+            if transformation is not None:
+                try:
+                    config[key] = transformation(config[key])
+                except Exception as ex:
+                    report(ERROR, key, diagnostics.TRANSFORM_FAILED, f"Exception when preprocessing key '{key}': {ex}")
+                    return
+
+            # Apply validation
+            if validation is not None:
+                try:
+                    if not validation(config[key]):
+                        report(ERROR, key, diagnostics.CONDITION_FAILED,
+                               f"Provided key '{key}' with value '{config[key]}' does not met validation condition")
+                except Exception as ex:
+                    report(ERROR, key, diagnostics.VALIDATION_FAILED, f"Exception when validating key '{key}': {ex}")
+        # Default it if necessary
+        else:
+            value = default
+            if default_function is not None:
+                try:
+                    value = default_function(config)
+                except Exception as ex:
+                    report(ERROR, key, diagnostics.DEFAULT_FAILED,
+                           f"Exception when setting default value on key '{key}': {ex}")
+                    return
+            if value is not None:
+                config[key] = value
+
+    return step
+
+
+# Markers of values whose cast failed, so each distinct value is casted once per column
+_CAST_UNDEFINED = object()
+_CAST_FAILED = object()
+
+
+def _cast_value(cast, value):
+    try:
+        return cast(value)
+    except KeyError:
+        return _CAST_UNDEFINED
+    except Exception:
+        return _CAST_FAILED
+
+
+def _check_values(validation, values):
+    """ :return: list with the validation result, or the exception it raised, for each value """
+    many = getattr(validation, 'many', None)
+    if many is not None:
+        try:
+            return many(values)
+        except Exception:
+            # Values are checked one by one to report each exception
+            pass
+    results = []
+    for value in values:
+        try:
+            results.append(validation(value))
+        except Exception as ex:
+            results.append(ex)
+    return results
+
+
+def _compile_column(key, required, data_type, transformation, validation, default):
+    """
+    Builds the columnar validation step of a single key: the same checks as _compile_key,
+    applied to the value of the key in every config of a level before moving to the next key
+    """
+    required_function = required if _is_callable(required) else None
+    transformation = transformation if _is_callable(transformation) else None
+    validation = validation if _is_callable(validation) else None
+    default_function = default if _is_callable(default) else None
+    cast = CAST_EXPRESSION.get(data_type, None)
+
+    missing_error = (ERROR, key, diagnostics.MISSING, f"Required key '{key}' is missing from config")
+    empty_error = (ERROR, key, diagnostics.EMPTY, f"Required key '{key}' can't be empty")
+    type_error = f", it should be {data_type}"
+
+    def column(configs, reports):
+        # Required field, split configs with and without the key
+        present, absent = [], []
+        for i, config in enumerate(configs):
+            is_required = required
+            if required_function is not None:
+                try:
+                    is_required = required_function(config)
+                except Exception as ex:
+                    reports[i].append((ERROR, key, diagnostics.REQUIRED_FAILED,
+                                       f"Exception when determining if key '{key}' is a required field: {ex}"))
+                    continue
+            if is_required is True:
+                value = config.get(key, None)
+                if value is None:
+                    reports[i].append(missing_error)
+                elif value == "":
+                    reports[i].append(empty_error)
+            (present if key in config else absent).append(i)
+
+        # Check data type, casting each distinct value once
+        typed = []
+        casted = {}
+        for i in present:
+            config = configs[i]
+            value = config[key]
+            if isinstance(value, data_type):
+                typed.append(i)
+                continue
+            error_string = f"Provided key '{key}' with type {type(value)}" + type_error
+            if cast is None:
+                reports[i].append((ERROR, key, diagnostics.CAST_UNDEFINED,
+                                   error_string + ", this value type cast is not defined"))
+                continue
+            try:
+                result = casted[(type(value), value)]
+            except KeyError:
+                result = casted[(type(value), value)] = _cast_value(cast, value)
+            except TypeError:
+                result = _cast_value(cast, value)
+            if result is _CAST_UNDEFINED:
+                reports[i].append((ERROR, key, diagnostics.CAST_UNDEFINED,
+                                   error_string + ", this value type cast is not defined"))
+            elif result is _CAST_FAILED:
+                reports[i].append((ERROR, key, diagnostics.CAST_FAILED, error_string + ", value could not be casted"))
+            else:
+                config[key] = result
+                reports[i].append((WARNING, key, diagnostics.CASTED, error_string + CAST_WARNING))
+                typed.append(i)
+
+        # Apply transformation
+        if transformation is not None:
+            transformed = []
+            for i in typed:
+                config = configs[i]
+                try:
+                    config[key] = transformation(config[key])
+                    transformed.append(i)
+                except Exception as ex:
+                    reports[i].append((ERROR, key, diagnostics.TRANSFORM_FAILED,
+                                       f"Exception when preprocessing key '{key}': {ex}"))
+            typed = transformed
+
+        # Apply validation to the whole column
+        if validation is not None and len(typed) > 0:
+            values = [configs[i][key] for i in typed]
+            for i, value, result in zip(typed, values, _check_values(validation, values)):
+                if isinstance(result, Exception):
+                    reports[i].append((ERROR, key, diagnostics.VALIDATION_FAILED,
+                                       f"Exception when validating key '{key}': {result}"))
+                elif not result:
+                    reports[i].append((ERROR, key, diagnostics.CONDITION_FAILED,
+                                       f"Provided key '{key}' with value '{value}' does not met validation condition"))
+
+        # Default it if necessary
+        for i in absent:
+            config = configs[i]
+            value = default
+            if default_function is not None:
+                try:
+                    value = default_function(config)
+                except Exception as ex:
+                    reports[i].append((ERROR, key, diagnostics.DEFAULT_FAILED,
+                                       f"Exception when setting default value on key '{key}': {ex}"))
+                    continue
+            if value is not None:
+                config[key] = value
+
+    return column
+
+
+class CompiledSchema:
+    """
+    Precomputed validator for a *_CONFIG_KEYS dict, see compile_schema.
+    Can be used instead of the dict in validate_config
+    """
+
+    def __init__(self, config_keys):
+        self.config_keys = config_keys
+        self.keys = tuple(_sort_dependencies(config_keys))
+        self._steps = tuple(_compile_key(key, *config_keys[key]) for key in self.keys)
+        self._columns = tuple(_compile_column(key, *config_keys[key]) for key in self.keys)
+
+    def __contains__(self, key):
+        return key in self.config_keys
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def validate(self, config):
+        """ Same as _validate_keys_config(config, self.config_keys) """
+        errors, warnings = [], []
+
+        def report(level, key, code, message):
+            (errors if level == ERROR else warnings).append(message)
+
+        self.validate_into(config, report)
+        return errors, warnings
+
+    def validate_into(self, config, report):
+        """ Validates config passing every error and warning to report(level, key, code, message) """
+        for step in self._steps:
+            step(config, report)
+
+    def validate_many(self, configs):
+        """
+        Validates several configs of the same level key by key, same result as validate on each one
+
+        :return: list with the (level, key, code, message) entries of each config, in key order
+        """
+        reports = [[] for config in configs]
+        for column in self._columns:
+            column(configs, reports)
+        return reports
+
+
+def compile_schema(config_keys):
+    """
+    Compiles a *_CONFIG_KEYS dict {key: (required, data_type, transformation, validation, default)}
+    into a CompiledSchema, intended to be done once at import time
+    """
+    return CompiledSchema(config_keys)
+
+
+def validate_config(config, config_keys={}, password_decrypt=False, password_fields=[], filter_keys=True, report=None):
+    """
+    Validates config in place, filtering keys not in config_keys if filter_keys is set
+
+    If report is given, every error and warning is passed to report(level, key, code, message),
+    see diagnostics.Diagnostics.reporter, and empty lists are returned
+    """
+    config_errors, config_warnings = [], []
+    if report is None:
+        def report(level, key, code, message):
+            (config_errors if level == ERROR else config_warnings).append(message)
+
     # Required keys
-    config_errors, config_warnings = _validate_keys_config(config, config_keys)
+    if not isinstance(config_keys, CompiledSchema):
+        config_keys = compile_schema(config_keys)
+    config_keys.validate_into(config, report)
 
     # Check if password needs decrypt
     if password_decrypt:
         for password in password_fields:
-            decrypt_errors, decrypt_warnings = decrypt_password(config, password)
-            config_errors = config_errors + decrypt_errors
-            config_warnings = config_warnings + decrypt_warnings
+            for error in decrypt_password(config, password):
+                report(ERROR, password, diagnostics.DECRYPT_FAILED, error)
 
     # Remove extra keys
     if filter_keys:
-        delete_keys = []
-        for key in config:
-            if key not in config_keys:
-                delete_keys.append(key)
-        for key in delete_keys:
-            del config[key]
+        _filter_keys(config, config_keys)
 
     return config_errors, config_warnings
+
+
+def _filter_keys(config, config_keys):
+    delete_keys = []
+    for key in config:
+        if key not in config_keys:
+            delete_keys.append(key)
+    for key in delete_keys:
+        del config[key]
+
+
+def validate_columns(configs, config_keys={}, filter_keys=True):
+    """
+    Columnar version of validate_config for many configs of the same level (every table of a schema):
+    each key is casted and validated across all configs at once, casting each distinct value once and
+    checking vectorizable validations (positive, one_of) on the whole column
+
+    :return: list with the (level, key, code, message) entries of each config, see CompiledSchema.validate_many
+    """
+    if not isinstance(config_keys, CompiledSchema):
+        config_keys = compile_schema(config_keys)
+    reports = config_keys.validate_many(configs)
+    if filter_keys:
+        for config in configs:
+            _filter_keys(config, config_keys)
+    return reports
@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import select
+import struct
+import hashlib
+import logging
+import argparse
+import validate_properties
+import properties_editor
+import config_index
+
+
+logger = logging.getLogger()
+
+# Seconds without new events before a burst of saves is revalidated
+DEBOUNCE_SECONDS = 0.2
+# Seconds between directory scans when inotify is not available
+POLL_SECONDS = 1.0
+
+# inotify(7) constants
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_properties_file(name):
+    return name.endswith('.properties') and not name.startswith('.')
+
+
+class PollingWatcher:
+    '''
+    Detects changed properties files comparing mtime and size of every file on each scan
+    '''
+
+    def __init__(self, directory, interval=POLL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for entry in os.scandir(self.directory):
+            if is_properties_file(entry.name) and entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout=None):
+        '''
+        :param timeout: maximum seconds to wait, None to wait for a change
+        :return: set of changed file paths, empty on timeout
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if len(changed) > 0:
+                return changed
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return set()
+            time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    '''
+    Detects changed properties files with Linux inotify, through libc with ctypes
+
+    :raise OSError: if inotify is not available
+    '''
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed on {directory}")
+
+    def wait(self, timeout=None):
+        '''
+        :param timeout: maximum seconds to wait, None to wait for a change
+        :return: set of changed file paths, empty on timeout
+        '''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, every file is considered changed
+                changed.update(os.path.join(self.directory, x) for x in os.listdir(self.directory)
+                               if is_properties_file(x))
+            elif is_properties_file(name):
+                changed.add(os.path.join(self.directory, name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def new_watcher(directory, poll=False, interval=POLL_SECONDS):
+    '''
+    :return: InotifyWatcher, or PollingWatcher if poll is set or inotify is not available
+    '''
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as ex:
+            logger.info(f"inotify not available ({ex}), polling {directory} every {interval}s")
+    return PollingWatcher(directory, interval)
+
+
+def wait_burst(watcher, debounce=DEBOUNCE_SECONDS):
+    '''
+    Waits for a change and keeps collecting until no change arrives for debounce seconds
+
+    :return: set of changed file paths
+    '''
+    changed = watcher.wait()
+    while True:
+        more = watcher.wait(debounce)
+        if len(more) == 0:
+            return changed
+        changed |= more
+
+
+class PropertiesWatch:
+    '''
+    Keeps the validator warm and revalidates the properties files of a directory as they change.
+    The parsed properties and config index of the last OK validation are kept per file: a save
+    leaving the properties unchanged (comments, blank lines, spacing) is not revalidated, and a
+    changed file is parsed and indexed once, here, instead of again by the validation.
+    Written pipelines are regenerated incrementally, rewriting only the tasks whose content changed
+
+    :param directory: properties directory
+    :param write: regenerate pipelines/<file_name> of valid files
+    '''
+
+    def __init__(self, directory="properties", write=False):
+        self.directory = directory
+        self.write = write
+        # File path -> (content digest, properties dict, ConfigIndex) of its last OK validation
+        self._files = {}
+
+    def _read(self, file_path):
+        try:
+            with open(file_path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def validate(self, file_path):
+        '''
+        Revalidates a file if its properties changed since it was last validated
+
+        :return: True if OK, False if KO, None if skipped (unchanged or deleted)
+        '''
+        text = self._read(file_path)
+        if text is None:
+            if self._files.pop(file_path, None) is not None:
+                logger.warning(f"Properties file {file_path} deleted, its pipeline is kept")
+            return None
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        previous = self._files.get(file_path)
+        if previous is not None and previous[0] == digest:
+            return None
+
+        properties = validate_properties.properties_text_to_dict(text)
+        if previous is not None and previous[1] == properties:
+            logger.info(f"Properties file {file_path} changed without changing its properties, not revalidated")
+            self._files[file_path] = (digest, previous[1], previous[2])
+            return None
+
+        start = time.perf_counter()
+        index = config_index.ConfigIndex.from_properties(properties)
+        result = validate_properties.validate_file(file_path, write=self.write, incremental=True,
+                                                   properties=properties, index=index)
+        logger.info(f"Properties file {file_path} revalidated in {(time.perf_counter() - start) * 1000:.1f}ms")
+        # KO files are revalidated on next save even if their content goes back to a known one
+        if result:
+            self._files[file_path] = (digest, properties, index)
+        else:
+            self._files.pop(file_path, None)
+        return result
+
+    def validate_all(self):
+        '''
+        :return: dict with file path -> result of validate, for every file of the directory
+        '''
+        return {x: self.validate(x) for x in properties_editor.list_properties_files(self.directory)}
+
+    def run(self, watcher, debounce=DEBOUNCE_SECONDS):
+        '''
+        Validates every file and then revalidates changed files until interrupted
+        '''
+        self.validate_all()
+        logger.info(f"Watching {self.directory} for changes")
+        while True:
+            for file_path in sorted(wait_burst(watcher, debounce)):
+                try:
+                    self.validate(file_path)
+                except SystemExit:
+                    # validate_file exits when the file disappears between event and validation
+                    self._files.pop(file_path, None)
+                except Exception as ex:
+                    logger.error(f"Unexpected error validating {file_path}: {ex}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Revalidate properties files as they change")
+    arg_parser.add_argument('directory', nargs='?', default="properties", help="properties directory")
+    arg_parser.add_argument('--write', action='store_true', help="regenerate pipelines of valid files")
+    arg_parser.add_argument('--poll', action='store_true', help="poll the directory instead of using inotify")
+    arg_parser.add_argument('--interval', type=float, default=POLL_SECONDS, help="seconds between polls")
+    arg_parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS,
+                            help="seconds without changes before revalidating a burst of saves")
+    args = arg_parser.parse_args()
+
+    watcher = new_watcher(args.directory, poll=args.poll, interval=args.interval)
+    try:
+        PropertiesWatch(args.directory, write=args.write).run(watcher, debounce=args.debounce)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import io
+import re
+import logging
+from datetime import date
+
+
+logger = logging.getLogger()
+
+"""
+Fast emitter for the block YAML written to environment.yml and schedule.yml, producing the
+same bytes as ruamel round-trip YAML().dump:
+
+  key: value            mappings, nested mappings indented 2 spaces
+  key:
+  - item                sequences at the indentation of their key
+  - name: x             mappings inside sequences start on the dash line
+    config: y
+
+Every task document has the same skeleton and only a few leaf values change, so line
+prefixes and rendered scalars are memoized. Scalars that are not trivially plain are
+rendered once by ruamel itself. Any document outside this subset (nested sequences, lines
+that ruamel could fold, multiline scalars, complex keys, objects met twice that ruamel writes
+as &anchor/*alias...) is dumped by ruamel as a whole
+"""
+
+# ruamel breaks lines longer than its best width (80), only shorter lines are emitted here
+MAX_LINE_WIDTH = 80
+# Memoized scalars before the memo is reset, task names make it grow with the pipeline size
+MAX_MEMO_SIZE = 65536
+
+# Strings ruamel always emits plain: starting with a letter and with a '_' or '-' inside,
+# so they can't be resolved as bool, null, number or timestamp, and without indicators
+SAFE_PLAIN = re.compile(r'[A-Za-z][A-Za-z0-9.]*[_\-][A-Za-z0-9_\-.]*\*?')
+
+SCALAR_TYPES = (str, int, float, bool, type(None), date)
+# Values ruamel never anchors, any other object met twice in a document is written as &anchor/*alias
+UNALIASED_TYPES = (str, int, float, bool, type(None))
+
+
+class Unsafe(Exception):
+    '''
+    Raised when a document can't be emitted with the same output as ruamel
+    '''
+
+
+class TemplateEmitter:
+    '''
+    Drop-in replacement of ruamel YAML instance for dump(document, stream), see module doc.
+    ruamel is only used for uncommon scalars and fallback documents
+
+    :param yaml: ruamel YAML instance, created on first use if None
+    '''
+
+    def __init__(self, yaml=None):
+        self._yaml = yaml
+        self._values = {}
+        self._items = {}
+        self._keys = {}
+        self._indents = {}
+        self._ids = set()
+        self.fallbacks = 0
+
+    @property
+    def yaml(self):
+        if self._yaml is None:
+            from ruamel.yaml import YAML
+
+            self._yaml = YAML()
+        return self._yaml
+
+    def dump(self, document, stream):
+        '''
+        Writes document to stream as ruamel YAML().dump would
+
+        :param document: dict
+        :param stream: text stream
+        '''
+        try:
+            if type(document) is not dict or len(document) == 0:
+                raise Unsafe()
+            lines = []
+            self._ids.clear()
+            self._mapping(document, 0, None, lines)
+            lines.append("")
+            text = "\n".join(lines)
+        except Unsafe:
+            self.fallbacks += 1
+            self.yaml.dump(document, stream)
+            return
+        stream.write(text)
+
+    def _indent(self, indent):
+        prefix = self._indents.get(indent)
+        if prefix is None:
+            prefix = self._indents[indent] = " " * indent
+        return prefix
+
+    def _ruamel(self, document):
+        stream = io.StringIO()
+        self.yaml.dump(document, stream)
+        return stream.getvalue()
+
+    def _render(self, memo, value, document, prefix):
+        # Renders value through ruamel, it must be a single line starting with prefix
+        key = (type(value), str(value))
+        rendered = memo.get(key)
+        if rendered is None:
+            if len(memo) >= MAX_MEMO_SIZE:
+                memo.clear()
+            text = self._ruamel(document)
+            if text.startswith(prefix) and text.endswith("\n") and text.count("\n") == 1:
+                rendered = text[len(prefix):-1]
+            else:
+                rendered = False
+            memo[key] = rendered
+        if rendered is False:
+            raise Unsafe()
+        return rendered
+
+    def _key(self, key):
+        if type(key) is not str:
+            raise Unsafe()
+        rendered = self._keys.get(key)
+        if rendered is None:
+            if SAFE_PLAIN.fullmatch(key) and len(key) < MAX_LINE_WIDTH:
+                rendered = self._keys[key] = key
+            else:
+                rendered = self._render(self._keys, key, {key: None}, "")
+                if not rendered.endswith(":"):
+                    raise Unsafe()
+                rendered = self._keys[key] = rendered[:-1]
+        return rendered
+
+    def _once(self, value):
+        # Objects ruamel would alias are left to it
+        if id(value) in self._ids:
+            raise Unsafe()
+        self._ids.add(id(value))
+
+    def _value(self, value):
+        # Rendered with its separator from the key: ' value', or '' for null
+        if type(value) is str and SAFE_PLAIN.fullmatch(value):
+            return " " + value
+        if type(value) is int:
+            return f" {value}"
+        if not isinstance(value, SCALAR_TYPES) and not (type(value) in (dict, list) and len(value) == 0):
+            raise Unsafe()
+        if not isinstance(value, UNALIASED_TYPES):
+            self._once(value)
+        return self._render(self._values, value, {'k': value}, "k:")
+
+    def _item(self, value):
+        if type(value) is str and SAFE_PLAIN.fullmatch(value):
+            return " " + value
+        if type(value) is int:
+            return f" {value}"
+        if not isinstance(value, SCALAR_TYPES) and not (type(value) in (dict, list) and len(value) == 0):
+            raise Unsafe()
+        if not isinstance(value, UNALIASED_TYPES):
+            self._once(value)
+        return self._render(self._items, value, [value], "-")
+
+    def _mapping(self, mapping, indent, first_prefix, lines):
+        self._once(mapping)
+        prefix = self._indent(indent)
+        for key, value in mapping.items():
+            line = (first_prefix or prefix) + self._key(key) + ":"
+            first_prefix = None
+            value_type = type(value)
+            if value_type is dict and len(value) > 0:
+                self._append(lines, line)
+                self._mapping(value, indent + 2, None, lines)
+            elif value_type is list and len(value) > 0:
+                self._append(lines, line)
+                self._sequence(value, indent, lines)
+            else:
+                self._append(lines, line + self._value(value))
+
+    def _sequence(self, sequence, indent, lines):
+        self._once(sequence)
+        prefix = self._indent(indent)
+        for item in sequence:
+            item_type = type(item)
+            if item_type is dict and len(item) > 0:
+                self._mapping(item, indent + 2, prefix + "- ", lines)
+            elif item_type is list and len(item) > 0:
+                raise Unsafe()
+            else:
+                self._append(lines, prefix + "-" + self._item(item))
+
+    @staticmethod
+    def _append(lines, line):
+        if len(line) > MAX_LINE_WIDTH:
+            raise Unsafe()
+        lines.append(line)